@@ -0,0 +1,59 @@
+"""Report the per-user cost of building CSRs with and without a CSRTemplate.
+
+Keys are generated up front, so only the CSR build and sign is timed.
+
+Usage:
+
+    python benchmarks/csr_template.py [--users N] [--key-profile NAME]
+"""
+import argparse
+import time
+from k8s_user.pki import CSR, CSRTemplate, KEY_PROFILES, Key
+
+
+ADDITIONAL_SUBJECT = {"OU": "contractors", "C": "US", "ST": "IL", "L": "Chicago"}
+DNSNAMES = ["users.example.com", "onboarding.example.com"]
+GROUPS = ["developers", "system:authenticated"]
+
+
+def without_template(keys):
+    start = time.perf_counter()
+    for i, key in enumerate(keys):
+        CSR(
+            key=key,
+            common_name=f"user{i}",
+            additional_subject={
+                **ADDITIONAL_SUBJECT,
+                "O": GROUPS[0],
+            },
+            dnsnames=DNSNAMES,
+        )
+    return time.perf_counter() - start
+
+
+def with_template(keys):
+    start = time.perf_counter()
+    template = CSRTemplate(
+        additional_subject=ADDITIONAL_SUBJECT, dnsnames=DNSNAMES, groups=GROUPS
+    )
+    for i, key in enumerate(keys):
+        CSR(key=key, common_name=f"user{i}", template=template)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument(
+        "--key-profile", choices=sorted(KEY_PROFILES), default="ec-p256"
+    )
+    args = parser.parse_args()
+
+    keys = [Key(key_profile=args.key_profile) for _ in range(args.users)]
+    for label, bench in [("without template", without_template), ("with template", with_template)]:
+        elapsed = bench(keys)
+        print(f"{label:<18} {elapsed / args.users * 1e6:>10.1f} us/user")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Report key generation and CSR signing time for each pki key profile.
+
+Usage:
+
+    python benchmarks/key_profiles.py [--rounds N] [--profile NAME ...]
+"""
+import argparse
+import statistics
+import time
+from k8s_user.pki import CSR, KEY_PROFILES, Key
+
+
+def time_profile(profile_name, rounds):
+    keygen_times = []
+    sign_times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        key = Key(key_profile=profile_name)
+        keygen_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        csr = CSR(key=key, common_name="benchmark")
+        sign_times.append(time.perf_counter() - start)
+    return keygen_times, sign_times, len(key.pem), len(csr.pem)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument(
+        "--profile",
+        dest="profiles",
+        action="append",
+        choices=sorted(KEY_PROFILES),
+        help="Profile to benchmark. May be repeated. Defaults to all profiles.",
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'profile':<10} {'keygen ms':>12} {'csr sign ms':>12} "
+        f"{'key pem B':>10} {'csr pem B':>10}"
+    )
+    for profile_name in args.profiles or KEY_PROFILES:
+        keygen_times, sign_times, key_pem_size, csr_pem_size = time_profile(
+            profile_name, args.rounds
+        )
+        print(
+            f"{profile_name:<10} "
+            f"{statistics.median(keygen_times) * 1000:>12.2f} "
+            f"{statistics.median(sign_times) * 1000:>12.2f} "
+            f"{key_pem_size:>10} {csr_pem_size:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,185 @@
 import os
 import sys
+import time
 import argparse
+from datetime import timedelta
 import kubernetes
 from kubernetes import client, config
-from .user import CSRK8sUser, TokenK8sUser
+from .batch import provision_service_accounts
+from .cert_index import CertIndex
+from .k8s.csr_resource import approve_many
+from .k8s.informer import stop_informers
+from .k8s.inventory import write_inventory
+from .k8s.polling import PollPolicy
+from .k8s.sweeper import sweep_csrs
+from .local_ca import LocalCA
+from .metrics import StepHistograms
+from .pki import Cert, KEY_PROFILES
+from .store import CredentialStore
+from .verify import verify_directory
+from .user import CSRK8sUser, ParallelCSRK8sUser, TokenK8sUser
+
+
+def list_expiring(creds_dir: str, days: float) -> int:
+    """Print the certificates in creds_dir that expire within days"""
+    index = CertIndex(creds_dir)
+    index.update()
+    for path, error in sorted(index.errors.items()):
+        print(f"could not read {path}: {error}", file=sys.stderr)
+    for entry in index.expiring_within(days):
+        print(f"{entry.not_after.isoformat()}\t{entry.subject}\t{entry.path}")
+    return 0
+
+
+def verify_creds(creds_dir: str, names, ca_cert_file, in_kubeconfig) -> int:
+    """Print the key/CSR/cert consistency of users in creds_dir"""
+    if not ca_cert_file:
+        try:
+            api_client = config.new_client_from_config(config_file=in_kubeconfig)
+            ca_cert_file = api_client.configuration.ssl_ca_cert
+        except Exception:
+            ca_cert_file = None
+    ca_cert = Cert(crt_file=ca_cert_file) if ca_cert_file else None
+    if not ca_cert:
+        print("no cluster CA found; skipping CA chain checks", file=sys.stderr)
+
+    failed = 0
+    for result in verify_directory(creds_dir, user_names=names, ca_cert=ca_cert):
+        if result.ok:
+            print(f"OK\t{result.user_name}")
+        else:
+            failed += 1
+            print(f"FAIL\t{result.user_name}\t{'; '.join(result.errors)}")
+    return 1 if failed else 0
+
+
+def approve_csrs(in_kubeconfig, names, label_selector, max_workers) -> int:
+    """Approve pending CSRs in bulk and print per-CSR outcomes and throughput"""
+    api_client = config.new_client_from_config(config_file=in_kubeconfig)
+    start = time.monotonic()
+    approved = failed = 0
+    try:
+        for result in approve_many(
+            api_client,
+            names=names,
+            label_selector=label_selector,
+            max_workers=max_workers,
+        ):
+            if result.approved:
+                approved += 1
+                print(f"APPROVED\t{result.name}")
+            else:
+                failed += 1
+                print(f"FAIL\t{result.name}\t{result.error}")
+    finally:
+        stop_informers(api_client)
+    elapsed = time.monotonic() - start
+    rate = approved / elapsed if elapsed else 0
+    print(
+        f"approved {approved} CSRs ({failed} failed) in {elapsed:.2f}s "
+        f"({rate:.1f}/s)",
+        file=sys.stderr,
+    )
+    return 1 if failed else 0
+
+
+def sweep(in_kubeconfig, days, dry_run, page_size, max_workers) -> int:
+    """Delete the CSRs this tool created more than days ago and print counts"""
+    api_client = config.new_client_from_config(config_file=in_kubeconfig)
+    result = sweep_csrs(
+        api_client,
+        timedelta(days=days),
+        dry_run=dry_run,
+        page_size=page_size,
+        max_workers=max_workers,
+    )
+    for name, error in sorted(result.errors.items()):
+        print(f"FAIL\t{name}\t{error}")
+    action = "would delete" if dry_run else "deleted"
+    print(
+        f"scanned {result.scanned} CSRs; {result.expired} older than {days} days; "
+        f"{action} {result.expired if dry_run else result.deleted}"
+    )
+    return 1 if result.errors else 0
+
+
+def new_api_client(in_kubeconfig, pool_maxsize=None) -> client.ApiClient:
+    """Return an ApiClient for the kubeconfig, with a connection pool of at
+    least pool_maxsize connections"""
+    configuration = client.Configuration()
+    config.load_kube_config(
+        config_file=in_kubeconfig, client_configuration=configuration
+    )
+    if pool_maxsize:
+        configuration.connection_pool_maxsize = max(
+            configuration.connection_pool_maxsize, pool_maxsize
+        )
+    return client.ApiClient(configuration=configuration)
+
+
+def provision_sa_bulk(args) -> int:
+    """Provision every name in every namespace and print per-user outcomes"""
+    api_client = new_api_client(args.in_kubeconfig, pool_maxsize=args.max_workers)
+    poll_policy = PollPolicy(
+        timeout=args.poll_timeout,
+        initial_delay=args.poll_initial_delay,
+        max_delay=args.poll_max_delay,
+        backoff=args.poll_backoff,
+        jitter=args.poll_jitter,
+    )
+    failed = 0
+    try:
+        for result in provision_service_accounts(
+            api_client,
+            args.names,
+            args.namespaces,
+            out_dir=args.out_directory,
+            cluster_name=args.out_cluster,
+            context_name=args.out_context,
+            poll_policy=poll_policy,
+            token_request=args.token_request,
+            token_audiences=args.token_audiences,
+            token_expiration_seconds=args.token_expiration_seconds,
+            max_workers=args.max_workers,
+        ):
+            if result.error:
+                failed += 1
+                print(f"FAIL\t{result.namespace}/{result.name}\t{result.error}")
+            else:
+                action = "created" if result.created else "exists"
+                print(
+                    f"OK\t{result.namespace}/{result.name}\t{action}\t"
+                    f"{result.out_kubeconfig}"
+                )
+    finally:
+        stop_informers(api_client)
+    return 1 if failed else 0
+
+
+def inventory(in_kubeconfig, namespace, page_size, out_file) -> int:
+    """Write the inventory of users created by this tool as JSON lines"""
+    api_client = config.new_client_from_config(config_file=in_kubeconfig)
+    if out_file:
+        with open(out_file, "w") as out:
+            count = write_inventory(
+                api_client, out, namespace=namespace, page_size=page_size
+            )
+    else:
+        count = write_inventory(
+            api_client, sys.stdout, namespace=namespace, page_size=page_size
+        )
+    print(f"{count} records", file=sys.stderr)
+    return 0
+
+
+def write_metrics(user, json_path, textfile_path) -> None:
+    """Write the step timings of a user as JSON and/or a Prometheus textfile"""
+    histograms = StepHistograms()
+    histograms.observe_user(user)
+    if json_path:
+        histograms.write_json(json_path)
+    if textfile_path:
+        histograms.write_prometheus_textfile(textfile_path)
 
 
 def main(args=None):
@@ -39,6 +215,88 @@ def main(args=None):
         ),
         default=None,
     )
+    parser.add_argument(
+        "--store",
+        dest="store",
+        help=(
+            "If passed, the path of a SQLite credential store. Keys, CSRs, "
+            "certs, tokens and kubeconfig locations are saved to it, and an "
+            "existing key and CSR for the user and cluster are reused."
+        ),
+        default=None,
+    )
+
+    parser.add_argument(
+        "--store-key-password",
+        dest="store_key_password",
+        help="If passed with --store, keys are encrypted in the store with this password.",
+        default=os.environ.get("K8S_USER_STORE_KEY_PASSWORD"),
+    )
+
+    parser.add_argument(
+        "--poll-timeout",
+        dest="poll_timeout",
+        type=float,
+        help=(
+            "The overall number of seconds to wait for a cert or token "
+            "before giving up."
+        ),
+        default=10,
+    )
+
+    parser.add_argument(
+        "--poll-initial-delay",
+        dest="poll_initial_delay",
+        type=float,
+        help="The number of seconds to wait before the first re-poll.",
+        default=0.1,
+    )
+
+    parser.add_argument(
+        "--poll-max-delay",
+        dest="poll_max_delay",
+        type=float,
+        help="The largest number of seconds to wait between polls.",
+        default=2,
+    )
+
+    parser.add_argument(
+        "--poll-backoff",
+        dest="poll_backoff",
+        type=float,
+        help="The factor the delay between polls grows by after each poll.",
+        default=2,
+    )
+
+    parser.add_argument(
+        "--poll-jitter",
+        dest="poll_jitter",
+        type=float,
+        help="The fraction, from 0 to 1, to randomize each poll delay by.",
+        default=0.1,
+    )
+
+    parser.add_argument(
+        "--metrics-json",
+        dest="metrics_json",
+        help=(
+            "Optionally write the wall time, API calls and poll iterations of "
+            "each csr or sa workflow step to this JSON file."
+        ),
+        default=None,
+    )
+
+    parser.add_argument(
+        "--metrics-textfile",
+        dest="metrics_textfile",
+        help=(
+            "Optionally write the csr or sa workflow step metrics to this file "
+            "in the Prometheus text format, e.g. for the node_exporter "
+            "textfile collector."
+        ),
+        default=None,
+    )
+
     parser_csr = subparsers.add_parser("csr", help="CSR User Generator")
 
     parser_csr.add_argument(
@@ -112,6 +370,77 @@ def main(args=None):
         default=None,
     )
 
+    parser_csr.add_argument(
+        "--key-profile",
+        dest="key_profile",
+        choices=sorted(KEY_PROFILES),
+        help=(
+            "The algorithm and size of the generated key. EC keys are much "
+            "faster to generate than RSA keys. Ed25519 requires a cluster "
+            "signer that accepts Ed25519 client certificates. If not "
+            "specified, a 4092 bit RSA key is generated."
+        ),
+        default=None,
+    )
+
+    parser_csr.add_argument(
+        "--checkpoint-dir",
+        dest="checkpoint_dir",
+        help=(
+            "Optionally save the progress of the workflow in this directory. "
+            "If the run is interrupted, e.g. while waiting for the cert, "
+            "running the same command again resumes with the same key and "
+            "CSR resource. The checkpoint holds the unencrypted key and is "
+            "removed once the user is created."
+        ),
+        default=None,
+    )
+
+    parser_csr.add_argument(
+        "--parallel-steps",
+        dest="parallel_steps",
+        action="store_true",
+        help=(
+            "Run independent workflow steps concurrently, e.g. look up the CSR "
+            "resource while the key is generated."
+        ),
+        default=False,
+    )
+
+    parser_csr.add_argument(
+        "--local-ca-cert",
+        dest="local_ca_cert",
+        help=(
+            "Optionally pass in a filesystem path to the cluster CA cert in PEM "
+            "format. Together with --local-ca-key, the user cert is signed "
+            "locally instead of through a k8s CSR resource. This is meant for "
+            "dev and CI clusters where the CA key is available."
+        ),
+        default=None,
+    )
+
+    parser_csr.add_argument(
+        "--local-ca-key",
+        dest="local_ca_key",
+        help="The filesystem path to the cluster CA key in PEM format.",
+        default=None,
+    )
+
+    parser_csr.add_argument(
+        "--local-ca-key-password",
+        dest="local_ca_key_password",
+        help="If --local-ca-key has a password set, the password to decrypt it.",
+        default=None,
+    )
+
+    parser_csr.add_argument(
+        "--local-ca-days",
+        dest="local_ca_days",
+        type=int,
+        help="How many days a locally signed cert is valid for.",
+        default=365,
+    )
+
     parser_token = subparsers.add_parser("sa", help="SA Token User Generator")
     parser_token.add_argument(
         "-k",
@@ -160,15 +489,309 @@ def main(args=None):
         help=("The namespace of the service account associated with the user."),
     )
 
-    args = parser.parse_args()
-    print(args)
+    parser_token.add_argument(
+        "--token-audience",
+        dest="token_audiences",
+        action="append",
+        help=(
+            "An intended audience of the requested token. May be passed more "
+            "than once. Defaults to the API server's audience."
+        ),
+        default=None,
+    )
 
-    # sys.exit(1)
+    parser_token.add_argument(
+        "--token-expiration-seconds",
+        dest="token_expiration_seconds",
+        type=int,
+        help=(
+            "The requested lifetime of the token. Defaults to the API "
+            "server's default lifetime."
+        ),
+        default=None,
+    )
+
+    parser_token.add_argument(
+        "--no-token-request",
+        dest="token_request",
+        action="store_false",
+        help=(
+            "Read the token from the service account token Secret instead of "
+            "creating one with the TokenRequest API. Token Secrets are not "
+            "created automatically since Kubernetes 1.24."
+        ),
+    )
+
+    parser_sa_bulk = subparsers.add_parser(
+        "sa-bulk",
+        help=(
+            "Provision every name as a SA Token User in every namespace. One "
+            "kubeconfig per user and namespace is written to the -d/--out-dir "
+            "directory as <name>-<namespace>-kubeconfig.yaml."
+        ),
+    )
+
+    parser_sa_bulk.add_argument(
+        "names",
+        nargs="+",
+        help="The names of the service account users to create.",
+    )
+
+    parser_sa_bulk.add_argument(
+        "-n",
+        "--namespace",
+        dest="namespaces",
+        action="append",
+        required=True,
+        help="A namespace to create the users in. May be passed more than once.",
+    )
+
+    parser_sa_bulk.add_argument(
+        "--out-kubeconfig-context-name",
+        dest="out_context",
+        help="The name of the kubeconfig context associated with each user.",
+        default="default",
+    )
+
+    parser_sa_bulk.add_argument(
+        "--out-kubeconfig-cluster-name",
+        dest="out_cluster",
+        help="The name of the kubeconfig cluster associated with each user.",
+        default="default",
+    )
+
+    parser_sa_bulk.add_argument(
+        "--token-audience",
+        dest="token_audiences",
+        action="append",
+        help="An intended audience of the requested tokens.",
+        default=None,
+    )
+
+    parser_sa_bulk.add_argument(
+        "--token-expiration-seconds",
+        dest="token_expiration_seconds",
+        type=int,
+        help="The requested lifetime of the tokens.",
+        default=None,
+    )
+
+    parser_sa_bulk.add_argument(
+        "--no-token-request",
+        dest="token_request",
+        action="store_false",
+        help="Read the tokens from the service account token Secrets.",
+    )
+
+    parser_sa_bulk.add_argument(
+        "--max-workers",
+        dest="max_workers",
+        type=int,
+        help="The number of users provisioned concurrently.",
+        default=10,
+    )
+
+    parser_expiring = subparsers.add_parser(
+        "expiring",
+        help=(
+            "List the certificates in the -d/--out-dir directory that expire "
+            "soon, using an incrementally updated index."
+        ),
+    )
+
+    parser_expiring.add_argument(
+        "--days",
+        dest="days",
+        type=float,
+        help="List certificates expiring within this many days.",
+        default=30,
+    )
+
+    parser_verify = subparsers.add_parser(
+        "verify",
+        help=(
+            "Check that the key, CSR and cert files of users in the "
+            "-d/--out-dir directory share a public key and that the certs "
+            "are issued by the cluster CA."
+        ),
+    )
+
+    parser_verify.add_argument(
+        "names",
+        nargs="*",
+        help="The users to verify. Defaults to every user in the directory.",
+    )
+
+    parser_verify.add_argument(
+        "--ca-cert",
+        dest="ca_cert",
+        help=(
+            "A filesystem path to the cluster CA cert in PEM format. Defaults "
+            "to the CA of the --kubeconfig cluster."
+        ),
+        default=None,
+    )
+
+    parser_approve = subparsers.add_parser(
+        "approve",
+        help=(
+            "Approve many pending k8s CSR resources concurrently, selected by "
+            "name and/or label selector."
+        ),
+    )
+
+    parser_approve.add_argument(
+        "names",
+        nargs="*",
+        help="The names of the CSR resources to approve.",
+    )
+
+    parser_approve.add_argument(
+        "-l",
+        "--selector",
+        dest="label_selector",
+        help="Approve the pending CSR resources matching this label selector.",
+        default=None,
+    )
+
+    parser_approve.add_argument(
+        "--max-workers",
+        dest="max_workers",
+        type=int,
+        help="The number of concurrent approvals.",
+        default=10,
+    )
+
+    parser_sweep = subparsers.add_parser(
+        "sweep",
+        help=(
+            "Delete the k8s CSR resources created by this tool that are older "
+            "than a retention period."
+        ),
+    )
+
+    parser_sweep.add_argument(
+        "--older-than-days",
+        dest="days",
+        type=float,
+        help="Delete CSR resources created more than this many days ago.",
+        default=30,
+    )
+
+    parser_sweep.add_argument(
+        "--dry-run",
+        dest="dry_run",
+        action="store_true",
+        help="Only report how many CSR resources would be deleted.",
+    )
+
+    parser_sweep.add_argument(
+        "--page-size",
+        dest="page_size",
+        type=int,
+        help="The number of CSR resources fetched per list request.",
+        default=500,
+    )
+
+    parser_sweep.add_argument(
+        "--max-workers",
+        dest="max_workers",
+        type=int,
+        help="The number of concurrent deletes.",
+        default=10,
+    )
+
+    parser_inventory = subparsers.add_parser(
+        "inventory",
+        help=(
+            "List the CSR and Service Account resources created by this tool, "
+            "with their approval, cert expiry and token status, as JSON lines."
+        ),
+    )
+
+    parser_inventory.add_argument(
+        "-n",
+        "--namespace",
+        dest="namespace",
+        help="Only list Service Accounts in this namespace. Defaults to all namespaces.",
+        default=None,
+    )
+
+    parser_inventory.add_argument(
+        "--page-size",
+        dest="page_size",
+        type=int,
+        help="The number of resources fetched per list request.",
+        default=500,
+    )
+
+    parser_inventory.add_argument(
+        "-o",
+        "--output",
+        dest="out_file",
+        help="Write the JSON lines to this file instead of stdout.",
+        default=None,
+    )
+
+    args = parser.parse_args()
 
     if not args.user_type:
         print("user_type argument must be specified")
         sys.exit(1)
 
+    if args.user_type == "expiring":
+        if not args.out_directory:
+            print("-d/--out-dir argument must be specified")
+            sys.exit(1)
+        sys.exit(list_expiring(args.out_directory, args.days))
+
+    if args.user_type == "verify":
+        if not args.out_directory:
+            print("-d/--out-dir argument must be specified")
+            sys.exit(1)
+        sys.exit(
+            verify_creds(
+                args.out_directory,
+                args.names or None,
+                args.ca_cert,
+                args.in_kubeconfig,
+            )
+        )
+
+    if args.user_type == "approve":
+        if not (args.names or args.label_selector):
+            print("CSR names or -l/--selector must be specified")
+            sys.exit(1)
+        sys.exit(
+            approve_csrs(
+                args.in_kubeconfig,
+                args.names or None,
+                args.label_selector,
+                args.max_workers,
+            )
+        )
+
+    if args.user_type == "inventory":
+        sys.exit(
+            inventory(
+                args.in_kubeconfig, args.namespace, args.page_size, args.out_file
+            )
+        )
+
+    if args.user_type == "sa-bulk":
+        sys.exit(provision_sa_bulk(args))
+
+    if args.user_type == "sweep":
+        sys.exit(
+            sweep(
+                args.in_kubeconfig,
+                args.days,
+                args.dry_run,
+                args.page_size,
+                args.max_workers,
+            )
+        )
+
     if not args.name:
         print("Name argument must be specified")
         sys.exit(1)
@@ -188,14 +811,45 @@ def main(args=None):
 
     api_client = config.new_client_from_config(config_file=args.in_kubeconfig)
 
+    store = (
+        CredentialStore(args.store, key_password=args.store_key_password)
+        if args.store
+        else None
+    )
+
+    user = None
     try:
+        poll_policy = PollPolicy(
+            timeout=args.poll_timeout,
+            initial_delay=args.poll_initial_delay,
+            max_delay=args.poll_max_delay,
+            backoff=args.poll_backoff,
+            jitter=args.poll_jitter,
+        )
         inputs_common = dict(
+            poll_policy=poll_policy,
             cluster_name=args.out_cluster,
             context_name=args.out_context,
             out_kubeconfig=out_kubeconfig,
+            store=store,
         )
         if args.user_type == "csr":
-            user = CSRK8sUser(name=args.name,)
+            if args.checkpoint_dir:
+                os.makedirs(args.checkpoint_dir, mode=0o700, exist_ok=True)
+            user_klass = ParallelCSRK8sUser if args.parallel_steps else CSRK8sUser
+            user = user_klass(name=args.name,)
+
+            local_ca = None
+            if args.local_ca_cert or args.local_ca_key:
+                if not (args.local_ca_cert and args.local_ca_key):
+                    print("--local-ca-cert and --local-ca-key must be used together")
+                    sys.exit(1)
+                local_ca = LocalCA(
+                    ca_cert_file=args.local_ca_cert,
+                    ca_key_file=args.local_ca_key,
+                    ca_key_password=args.local_ca_key_password,
+                    days=args.local_ca_days,
+                )
 
             inputs = {
                 **dict(
@@ -203,12 +857,23 @@ def main(args=None):
                     in_key=args.in_key,
                     in_key_password=args.in_key_password,
                     in_csr=args.in_csr,
+                    key_profile=args.key_profile,
+                    local_ca=local_ca,
+                    checkpoint_dir=args.checkpoint_dir,
                 ),
                 **inputs_common,
             }
         elif args.user_type == "sa":
             user = TokenK8sUser(name=args.name,)
-            inputs = {**dict(namespace=args.namespace,), **inputs_common}
+            inputs = {
+                **dict(
+                    namespace=args.namespace,
+                    token_request=args.token_request,
+                    token_audiences=args.token_audiences,
+                    token_expiration_seconds=args.token_expiration_seconds,
+                ),
+                **inputs_common,
+            }
         else:
             raise Exception("Must include a user_type as argument")
         user.create(api_client, inputs)
@@ -216,6 +881,11 @@ def main(args=None):
         raise
         print(f"{e}")
         sys.exit(1)
+    finally:
+        if store:
+            store.close()
+        if user and (args.metrics_json or args.metrics_textfile):
+            write_metrics(user, args.metrics_json, args.metrics_textfile)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,174 @@
+from typing import Optional, Dict, Iterable, Iterator, List, Tuple
+import collections
+import os
+from concurrent.futures import FIRST_COMPLETED, Executor, as_completed, wait
+import kubernetes
+from kubernetes.client.rest import ApiException
+from .executors import ExecutorScope
+from .k8s.informer import SA_KIND, start_informer
+from .k8s.polling import PollPolicy
+from .metrics import StepHistograms
+from .user import TokenK8sUser
+from .workflows import UserResult
+
+
+SAProvisionResult = collections.namedtuple(
+    "SAProvisionResult", "name namespace created out_kubeconfig error"
+)
+
+
+def create_user(user, api_client: kubernetes.client.ApiClient, inputs: Dict) -> UserResult:
+    """Run user.create, reporting any error in the returned UserResult"""
+    try:
+        user.create(api_client, inputs)
+    except Exception as exc:
+        return UserResult(user_name=user.name, error=exc, user=user)
+    return UserResult(user_name=user.name, error=None, user=user)
+
+
+def create_users(
+    api_client: kubernetes.client.ApiClient,
+    users: Iterable[Tuple[object, Dict]],
+    max_workers: Optional[int] = 10,
+    executor: Optional[Executor] = None,
+    histograms: Optional[StepHistograms] = None,
+) -> Iterator[UserResult]:
+    """Create many users concurrently through the one api_client
+
+    Each user runs its own workflow instance, so the K8sUser objects must be
+    distinct. Results are yielded as they complete.
+
+    :param users: an iterable of (K8sUser, inputs) pairs
+    :param max_workers: the number of concurrent users. Ignored if executor
+        is given. The api_client connection pool should be at least this big.
+    :param executor: an optional concurrent.futures.Executor to create users on
+    :param histograms: optional metrics.StepHistograms to add the step timings
+        of every user to, including the users that failed
+    """
+    with ExecutorScope(executor, max_workers) as scope:
+        for user, inputs in users:
+            scope.futures[scope.submit(create_user, user, api_client, inputs)] = user
+        for future in as_completed(scope.futures):
+            if histograms is not None:
+                histograms.observe_user(scope.futures[future])
+            yield future.result()
+
+
+def sa_kubeconfig_path(name: str, namespace: str, out_dir: Optional[str] = None) -> str:
+    """Return where the kubeconfig of a bulk-provisioned ServiceAccount is written"""
+    return os.path.join(out_dir or ".", f"{name}-{namespace}-kubeconfig.yaml")
+
+
+def list_service_accounts(
+    api_client: kubernetes.client.ApiClient, namespace: str
+) -> Dict[str, kubernetes.client.V1ServiceAccount]:
+    """Return the ServiceAccounts in a namespace by name, from the api_client's
+    shared ServiceAccount informer of the namespace, which is started if it is
+    not running"""
+    informer = start_informer(api_client, SA_KIND, namespace)
+    return {sa.metadata.name: sa for sa in informer.list()}
+
+
+def _error_message(exc: Exception) -> str:
+    if isinstance(exc, ApiException):
+        return f"{exc.status} {exc.reason}"
+    return str(exc)
+
+
+def provision_service_accounts(
+    api_client: kubernetes.client.ApiClient,
+    names: Iterable[str],
+    namespaces: Iterable[str],
+    out_dir: Optional[str] = None,
+    cluster_name: str = "default",
+    context_name: str = "default",
+    poll_policy: Optional[PollPolicy] = None,
+    token_request: bool = True,
+    token_audiences: Optional[List[str]] = None,
+    token_expiration_seconds: Optional[int] = None,
+    max_workers: Optional[int] = 10,
+    executor: Optional[Executor] = None,
+    histograms: Optional[StepHistograms] = None,
+) -> Iterator[SAProvisionResult]:
+    """Provision every name in every namespace as a TokenK8sUser
+
+    Existing ServiceAccounts are found with one paginated LIST per namespace,
+    by starting the api_client's shared ServiceAccount informer of each
+    namespace. The informers keep running until
+    informer.stop_informers(api_client) is called. The listed ServiceAccounts
+    prime each user's SAResource, so the workflows skip the per-user GET.
+    The users of a namespace are submitted to the executor as soon as its LIST
+    completes, so creation overlaps the LISTs of the other namespaces. Every
+    user is created with create_user through the one api_client, so its
+    connection pool is shared. One kubeconfig is written per user and
+    namespace, named by sa_kubeconfig_path. A user whose kubeconfig exists
+    already is not provisioned. Results are yielded as they complete.
+
+    :param out_dir: the directory to write the kubeconfigs to. Defaults to
+        the current directory.
+    :param max_workers: the number of concurrent users. Ignored if executor
+        is given. The api_client connection pool should be at least this big.
+    :param executor: an optional concurrent.futures.Executor to provision on
+    :param histograms: optional metrics.StepHistograms to add the step timings
+        of every user to
+    """
+    names = list(names)
+    namespaces = list(namespaces)
+    with ExecutorScope(executor, max_workers) as scope:
+        list_futures = set()
+        for namespace in namespaces:
+            list_future = scope.submit(list_service_accounts, api_client, namespace)
+            scope.futures[list_future] = namespace
+            list_futures.add(list_future)
+        while scope.futures:
+            done, _ = wait(scope.futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in list_futures:
+                    namespace = scope.futures.pop(future)
+                    list_error = None
+                    try:
+                        service_accounts = future.result()
+                    except ApiException as exc:
+                        list_error = _error_message(exc)
+                    for name in names:
+                        out_kubeconfig = sa_kubeconfig_path(name, namespace, out_dir)
+                        error = list_error
+                        if not error and os.path.isfile(out_kubeconfig):
+                            error = "kubeconfig file exists already"
+                        if error:
+                            yield SAProvisionResult(
+                                name=name,
+                                namespace=namespace,
+                                created=False,
+                                out_kubeconfig=out_kubeconfig,
+                                error=error,
+                            )
+                            continue
+                        inputs = {
+                            "namespace": namespace,
+                            "service_accounts": service_accounts,
+                            "out_kubeconfig": out_kubeconfig,
+                            "cluster_name": cluster_name,
+                            "context_name": context_name,
+                            "poll_policy": poll_policy,
+                            "token_request": token_request,
+                            "token_audiences": token_audiences,
+                            "token_expiration_seconds": token_expiration_seconds,
+                        }
+                        user_future = scope.submit(
+                            create_user, TokenK8sUser(name), api_client, inputs
+                        )
+                        scope.futures[user_future] = inputs
+                    continue
+                inputs = scope.futures.pop(future)
+                result = future.result()
+                if histograms is not None:
+                    histograms.observe_user(result.user)
+                sa_resource = getattr(result.user, "sa_resource", None)
+                yield SAProvisionResult(
+                    name=result.user_name,
+                    namespace=inputs["namespace"],
+                    created=bool(sa_resource and sa_resource.created),
+                    out_kubeconfig=inputs["out_kubeconfig"],
+                    error=_error_message(result.error) if result.error else None,
+                )
@@ -0,0 +1,271 @@
+from typing import Optional, Dict, Iterator, List, Tuple
+from datetime import datetime, timedelta, timezone
+import base64
+import collections
+import hashlib
+import json
+import os
+from .loader import iter_pem_file
+
+
+# The attribute short names cryptography uses in Name.rfc4514_string(), so the
+# subjects in the index match pki.Cert.subject.
+RFC4514_SHORT_NAMES = {
+    "2.5.4.3": "CN",
+    "2.5.4.7": "L",
+    "2.5.4.8": "ST",
+    "2.5.4.10": "O",
+    "2.5.4.11": "OU",
+    "2.5.4.6": "C",
+    "2.5.4.9": "STREET",
+    "0.9.2342.19200300.100.1.25": "DC",
+    "0.9.2342.19200300.100.1.1": "UID",
+}
+
+
+CertIndexEntry = collections.namedtuple(
+    "CertIndexEntry", "path subject serial not_before not_after fingerprint"
+)
+
+
+def pem_to_der(block: bytes) -> bytes:
+    """Return the DER bytes of a single PEM block"""
+    return base64.b64decode(b"".join(block.strip().splitlines()[1:-1]))
+
+
+def _read_tlv(data: bytes, offset: int) -> Tuple[int, int, int]:
+    """Read the DER tag and length at offset
+
+    :returns: a tuple of (tag, content start offset, content end offset)
+    """
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        num_bytes = length & 0x7F
+        length = int.from_bytes(data[offset : offset + num_bytes], "big")
+        offset += num_bytes
+    return tag, offset, offset + length
+
+
+def _parse_time(tag: int, value: bytes) -> int:
+    """Return the epoch seconds of a DER UTCTime or GeneralizedTime"""
+    text = value.decode("ascii")
+    if tag == 0x17:
+        # RFC 5280: UTCTime years 50-99 are 1950-1999, and 00-49 are 2000-2049
+        century = "19" if int(text[:2]) >= 50 else "20"
+        parsed = datetime.strptime(century + text, "%Y%m%d%H%M%SZ")
+    else:
+        parsed = datetime.strptime(text, "%Y%m%d%H%M%SZ")
+    return int(parsed.replace(tzinfo=timezone.utc).timestamp())
+
+
+def _parse_oid(value: bytes) -> str:
+    """Return the dotted string of a DER OBJECT IDENTIFIER"""
+    parts = [value[0] // 40, value[0] % 40]
+    number = 0
+    for byte in value[1:]:
+        number = (number << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            parts.append(number)
+            number = 0
+    return ".".join(str(p) for p in parts)
+
+
+def _escape_rfc4514(value: str) -> str:
+    value = "".join(f"\\{c}" if c in ',+"\\<>;' else c for c in value)
+    if value.startswith(("#", " ")):
+        value = "\\" + value
+    if value.endswith(" "):
+        value = value[:-1] + "\\ "
+    return value
+
+
+def _parse_name(data: bytes, start: int, end: int) -> str:
+    """Return the RFC4514 string of a DER Name"""
+    rdns = []
+    offset = start
+    while offset < end:
+        _, set_start, set_end = _read_tlv(data, offset)
+        attributes = []
+        attribute_offset = set_start
+        while attribute_offset < set_end:
+            _, seq_start, seq_end = _read_tlv(data, attribute_offset)
+            _, oid_start, oid_end = _read_tlv(data, seq_start)
+            value_tag, value_start, value_end = _read_tlv(data, oid_end)
+            oid = _parse_oid(data[oid_start:oid_end])
+            value = data[value_start:value_end]
+            if value_tag == 0x1E:
+                value = value.decode("utf-16-be")
+            else:
+                value = value.decode("utf-8", "replace")
+            attributes.append(
+                f"{RFC4514_SHORT_NAMES.get(oid, oid)}={_escape_rfc4514(value)}"
+            )
+            attribute_offset = seq_end
+        rdns.append("+".join(attributes))
+        offset = set_end
+    return ",".join(reversed(rdns))
+
+
+def read_cert_fields(der: bytes) -> Dict:
+    """Extract the serial, validity and subject of a DER certificate
+
+    Only the leading fields of the TBSCertificate are walked, which is much
+    cheaper than a full x509 parse.
+
+    :returns: a dict with serial, not_before and not_after (epoch seconds),
+        subject and fingerprint (SHA256 of the DER) keys
+    """
+    _, cert_start, _ = _read_tlv(der, 0)
+    _, tbs_start, _ = _read_tlv(der, cert_start)
+    tag, start, end = _read_tlv(der, tbs_start)
+    if tag == 0xA0:
+        # explicit version
+        tag, start, end = _read_tlv(der, end)
+    serial = int.from_bytes(der[start:end], "big", signed=True)
+    _, _, end = _read_tlv(der, end)  # signature algorithm
+    _, _, end = _read_tlv(der, end)  # issuer
+    _, validity_start, validity_end = _read_tlv(der, end)
+    tag, start, not_before_end = _read_tlv(der, validity_start)
+    not_before = _parse_time(tag, der[start:not_before_end])
+    tag, start, end = _read_tlv(der, not_before_end)
+    not_after = _parse_time(tag, der[start:end])
+    _, subject_start, subject_end = _read_tlv(der, validity_end)
+    return {
+        "serial": serial,
+        "not_before": not_before,
+        "not_after": not_after,
+        "subject": _parse_name(der, subject_start, subject_end),
+        "fingerprint": hashlib.sha256(der).hexdigest(),
+    }
+
+
+def read_cert_file_fields(path: str) -> Optional[Dict]:
+    """Extract the index fields of the first certificate in a PEM file"""
+    for label, block in iter_pem_file(path):
+        if label == "CERTIFICATE":
+            return read_cert_fields(pem_to_der(block))
+    return None
+
+
+class CertIndex:
+    """An on-disk index of the certificates in a credentials directory.
+
+    The index records the subject, serial, validity and fingerprint of every
+    <user>.crt.pem file, keyed by file name. update() only re-reads files
+    whose mtime or size changed since the last update.
+
+    :param creds_dir: the directory holding the .crt.pem files
+    :param index_path: an optional path for the index file. Defaults to
+        INDEX_FILE_NAME inside creds_dir.
+    """
+
+    INDEX_FILE_NAME = ".k8s_user_cert_index.json"
+    CERT_SUFFIX = ".crt.pem"
+
+    def __init__(self, creds_dir: str, index_path: Optional[str] = None):
+        self.creds_dir = creds_dir
+        self.index_path = (
+            index_path
+            if index_path
+            else os.path.join(creds_dir, self.INDEX_FILE_NAME)
+        )
+        self.records = {}
+        self.errors = {}
+        self.load()
+
+    def load(self):
+        """Load the index file if it exists. A corrupt index file, e.g. one
+        truncated by a full disk, is treated as an empty index."""
+        try:
+            with open(self.index_path) as f:
+                self.records = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.records = {}
+
+    def save(self):
+        """Atomically write the index file"""
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.records, f)
+        os.replace(tmp_path, self.index_path)
+
+    def update(self) -> int:
+        """Bring the index up to date with the credentials directory
+
+        Certificate files that can not be read or parsed are left out of the
+        index, and their errors are recorded in self.errors.
+
+        :returns: the number of certificate files that were (re)read
+        """
+        seen = set()
+        updated = 0
+        dropped = 0
+        self.errors = {}
+        with os.scandir(self.creds_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(self.CERT_SUFFIX) or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # removed since the directory was listed
+                    continue
+                seen.add(entry.name)
+                record = self.records.get(entry.name)
+                if (
+                    record
+                    and record["mtime_ns"] == stat.st_mtime_ns
+                    and record["size"] == stat.st_size
+                ):
+                    continue
+                try:
+                    fields = read_cert_file_fields(entry.path)
+                except (OSError, ValueError, IndexError) as exc:
+                    fields = None
+                    self.errors[entry.name] = str(exc)
+                if fields is None:
+                    if self.records.pop(entry.name, None) is not None:
+                        dropped += 1
+                    continue
+                fields.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                self.records[entry.name] = fields
+                updated += 1
+
+        removed = set(self.records) - seen
+        for name in removed:
+            del self.records[name]
+        if updated or removed or dropped:
+            self.save()
+        return updated
+
+    def entries(self) -> Iterator[CertIndexEntry]:
+        """Yield a CertIndexEntry for every indexed certificate"""
+        for name, record in self.records.items():
+            yield self._entry(name, record)
+
+    def expiring_within(
+        self, days: float, now: Optional[datetime] = None
+    ) -> List[CertIndexEntry]:
+        """Return the certificates that expire within the given number of days,
+        soonest first. Already expired certificates are included."""
+        now = now if now else datetime.now(timezone.utc)
+        cutoff = (now + timedelta(days=days)).timestamp()
+        return [
+            self._entry(name, record)
+            for name, record in sorted(
+                self.records.items(), key=lambda item: item[1]["not_after"]
+            )
+            if record["not_after"] <= cutoff
+        ]
+
+    def _entry(self, name: str, record: Dict) -> CertIndexEntry:
+        return CertIndexEntry(
+            path=os.path.join(self.creds_dir, name),
+            subject=record["subject"],
+            serial=record["serial"],
+            not_before=datetime.fromtimestamp(record["not_before"], timezone.utc),
+            not_after=datetime.fromtimestamp(record["not_after"], timezone.utc),
+            fingerprint=record["fingerprint"],
+        )
@@ -0,0 +1,100 @@
+from typing import Optional, Dict
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from .pki import CSR
+
+
+def csr_fingerprint(csr: CSR) -> str:
+    """Return the hex SHA-256 digest of a CSR's DER encoding"""
+    return hashlib.sha256(csr.der).hexdigest()
+
+
+class Checkpoint:
+    """The saved progress of one user's workflow, so that an interrupted run
+    can resume from its last completed step.
+
+    The state is a JSON file named <user name>.checkpoint.json in directory.
+    It holds the completed steps and the step each one led to, the generated
+    key and CSR, the CSR fingerprint, the CSR resource name and the cert. The
+    key is encrypted when the workflow has a store key password; either way the
+    file is only readable by its owner.
+    It is rewritten atomically after every change. Steps running concurrently,
+    as in GraphWorkflowBase, can update it from several threads.
+
+    :param directory: the directory of the checkpoint files
+    :param name: the user name
+    """
+
+    def __init__(self, directory: str, name: str):
+        self.path = os.path.join(directory, f"{name}.checkpoint.json")
+        self.state = {"name": name, "steps": {}}
+        self._lock = threading.RLock()
+        if os.path.isfile(self.path):
+            with open(self.path) as f:
+                self.state = json.load(f)
+
+    @property
+    def resumed(self) -> bool:
+        """Return if a previous run left this checkpoint"""
+        return bool(self.state["steps"])
+
+    def is_completed(self, step_name: str) -> bool:
+        return step_name in self.state["steps"]
+
+    def next_step(self, step_name: str) -> Optional[str]:
+        """Return the step a completed step led to"""
+        return self.state["steps"][step_name]
+
+    def step_done(self, step_name: str, next_step: Optional[str]):
+        with self._lock:
+            self.state["steps"][step_name] = next_step
+            self.save()
+
+    def get(self, field: str) -> Optional[str]:
+        return self.state.get(field)
+
+    def get_bytes(self, field: str) -> Optional[bytes]:
+        value = self.state.get(field)
+        return value.encode("utf-8") if value else None
+
+    def update(self, **fields):
+        """Set the given fields and save. bytes values are stored as text."""
+        with self._lock:
+            for field, value in fields.items():
+                self.state[field] = (
+                    value.decode("utf-8") if isinstance(value, bytes) else value
+                )
+            self.save()
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        # the lock is held until the file is replaced, so an older snapshot
+        # can not replace a newer one
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".checkpoint")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(self.state, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+    def clear(self):
+        """Remove the checkpoint, e.g. once the workflow has finished"""
+        with self._lock:
+            if os.path.isfile(self.path):
+                os.remove(self.path)
+            self.state = {"name": self.state["name"], "steps": {}}
+
+
+def get_checkpoint(inputs: Dict) -> Optional[Checkpoint]:
+    """Return the Checkpoint of inputs' user if a checkpoint_dir input is set"""
+    checkpoint_dir = inputs.get("checkpoint_dir")
+    user = inputs.get("user")
+    if not checkpoint_dir or user is None:
+        return None
+    return Checkpoint(checkpoint_dir, user.name)
@@ -0,0 +1,63 @@
+from typing import Optional, Any, Callable, Dict
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, wait as wait_futures
+
+
+class ExecutorScope:
+    """An executor and the futures submitted to it, cleaned up together.
+
+    Use it as a context manager around the code submitting work. On exit,
+    every future still in .futures is cancelled, so a generator that is
+    abandoned does not leave its queued work running, and the executor is
+    shut down if the scope created it.
+
+    :param executor: an optional concurrent.futures.Executor to submit to.
+        It is not shut down on exit.
+    :param max_workers: the number of workers of the created executor.
+        Ignored if executor is given.
+    :param executor_class: the class of the created executor
+    :param wait: on exit, wait for the futures that were already running
+        and could not be cancelled
+    """
+
+    def __init__(
+        self,
+        executor: Optional[Executor] = None,
+        max_workers: Optional[int] = None,
+        executor_class: Callable[..., Executor] = ThreadPoolExecutor,
+        wait: bool = False,
+    ):
+        self.owns_executor = executor is None
+        self.executor = (
+            executor if executor else executor_class(max_workers=max_workers)
+        )
+        self.wait = wait
+        # maps each submitted future to an optional caller value, such as
+        # the name of the item it works on. Callers may pop done futures.
+        self.futures: Dict[Future, Any] = {}
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Submit fn(*args, **kwargs) to the executor and track its future"""
+        future = self.executor.submit(fn, *args, **kwargs)
+        self.futures[future] = None
+        return future
+
+    def close(self, wait: Optional[bool] = None):
+        """Cancel the futures left in .futures and shut down the executor if
+        the scope created it
+
+        :param wait: overrides the scope's wait
+        """
+        wait = self.wait if wait is None else wait
+        futures = list(self.futures)
+        for future in futures:
+            future.cancel()
+        if wait:
+            wait_futures(futures)
+        if self.owns_executor:
+            self.executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
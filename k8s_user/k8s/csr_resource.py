@@ -1,8 +1,97 @@
-from typing import Optional, Dict, List
+from typing import Optional, Dict, Iterable, Iterator, List
+import base64
+import collections
+import copy
 import time
+from concurrent.futures import Executor, as_completed
 from datetime import datetime, timezone
 import kubernetes
 from kubernetes.client.rest import ApiException
+from ..executors import ExecutorScope
+from .informer import CSR_KIND, get_informer, start_informer
+from .polling import DEFAULT_POLL_POLICY, PollPolicy
+
+
+APPROVE_MESSAGE = "This certificate was approved by the Python Client."
+APPROVE_REASON = "ApprovedForUser"
+
+
+ApproveResult = collections.namedtuple("ApproveResult", "name approved error")
+
+
+def approval_condition(message: str = APPROVE_MESSAGE, reason: str = APPROVE_REASON):
+    """Return a CSR condition that marks it Approved"""
+    return kubernetes.client.V1beta1CertificateSigningRequestCondition(
+        last_update_time=datetime.now(timezone.utc).astimezone(),
+        message=message,
+        reason=reason,
+        type="Approved",
+    )
+
+
+def is_pending(csr) -> bool:
+    """Return if a CSR object has not been approved or denied yet"""
+    conditions = (csr.status.conditions if csr.status else None) or []
+    return not any(c.type in ("Approved", "Denied") for c in conditions)
+
+
+def is_denied(csr) -> bool:
+    """Return if a CSR object has been denied. A denied CSR is never signed."""
+    conditions = (csr.status.conditions if csr.status else None) or []
+    return any(c.type == "Denied" for c in conditions)
+
+
+def approval_body(
+    csr, message: str = APPROVE_MESSAGE, reason: str = APPROVE_REASON
+):
+    """Return a copy of a CSR object with an Approved condition appended to its
+    existing conditions. The CSR object itself is left untouched, since it may
+    be shared with an informer cache."""
+    body = copy.copy(csr)
+    body.status = (
+        copy.copy(csr.status)
+        if csr.status
+        else kubernetes.client.V1beta1CertificateSigningRequestStatus()
+    )
+    body.status.conditions = list(csr.status.conditions or []) if csr.status else []
+    body.status.conditions.append(approval_condition(message, reason))
+    return body
+
+
+def approve_object(
+    api_instance: kubernetes.client.CertificatesV1beta1Api,
+    name: str,
+    csr,
+    message: str = APPROVE_MESSAGE,
+    reason: str = APPROVE_REASON,
+    retries: int = 3,
+):
+    """Approve a CSR in one request from a known CSR object
+
+    The approval is sent with the object's resourceVersion, so a concurrent
+    change is rejected with 409 Conflict. On conflict, the CSR is read again
+    and the approval is retried, up to retries times. A CSR that is already
+    approved is returned without a request.
+
+    :param csr: the last known CSR object, or None to read it first
+    :returns: the approved CSR object
+    :raises ValueError: if the CSR has been denied
+    """
+    for attempt in range(retries + 1):
+        if csr is None:
+            csr = api_instance.read_certificate_signing_request_status(name)
+        if is_denied(csr):
+            raise ValueError(f"CSR {name} has been denied")
+        if not is_pending(csr):
+            return csr
+        try:
+            return api_instance.replace_certificate_signing_request_approval(
+                name, approval_body(csr, message, reason)
+            )
+        except ApiException as exc:
+            if exc.status != 409 or attempt == retries:
+                raise
+            csr = None
 
 
 class CSRResource:
@@ -13,6 +102,8 @@ class CSRResource:
     :param metadata: an optional dict with fields matching k8s V1ObjectMeta object
     :param groups: RBAC groups to add to this CSR (defaults to ["system:authenticated"])
     :param usages: CSR usages (defaults to ["client auth"])
+    :param poll_policy: how get_cert waits for the certificate (defaults to
+        DEFAULT_POLL_POLICY)
     """
 
     def __init__(
@@ -22,19 +113,21 @@ class CSRResource:
         metadata: Optional[Dict] = None,
         groups: Optional[List] = None,
         usages: Optional[List] = None,
+        poll_policy: Optional[PollPolicy] = None,
     ):
         self._resource_cache = None
+        self._resource_primed = False
         self.name = name
         self.csr_str = csr_str
-        self.metadata = metadata if isinstance(metadata, dict) else {}
-        self.groups = groups if groups else ["system:authenticated"]
-        self.usages = usages if usages else ["client auth"]
+        self.metadata = dict(metadata) if isinstance(metadata, dict) else {}
+        self.groups = list(groups) if groups else ["system:authenticated"]
+        self.usages = list(usages) if usages else ["client auth"]
+        self.poll_policy = poll_policy if poll_policy else DEFAULT_POLL_POLICY
 
     def get_text(self):
         """Return the text of the CertificateSigningRequest that will be set to the
         kubernetes api."""
-        metadata = self.metadata
-        metadata.update({"name": self.name})
+        metadata = {**self.metadata, "name": self.name}
         return kubernetes.client.V1beta1CertificateSigningRequest(
             kind="CertificateSigningRequest",
             metadata=kubernetes.client.V1ObjectMeta(**metadata),
@@ -48,10 +141,15 @@ class CSRResource:
     ):
         """Get the CertificateSigningRequest object from the kubernetes cluster based on 
         the self.name. If cache is set to True, then cache the result and fetch from
-        the cache on subsequent lookups.
+        the cache on subsequent lookups. If a CSR informer was started for this
+        api_client, cached lookups are answered from the informer instead.
         """
-        if cache and self._resource_cache:
-            return self._resource_cache
+        if cache:
+            informer = get_informer(api_client, CSR_KIND)
+            if informer:
+                return informer.get(self.name)
+            if self._resource_cache or self._resource_primed:
+                return self._resource_cache
         api_instance = kubernetes.client.CertificatesV1beta1Api(api_client)
         try:
             response = api_instance.read_certificate_signing_request_status(self.name)
@@ -62,6 +160,21 @@ class CSRResource:
         self._resource_cache = response
         return response
 
+    def prime(self, resource):
+        """Seed the cache with a CertificateSigningRequest object looked up
+        elsewhere, e.g. while the CSR was generated. None records that the CSR
+        does not exist. Cached lookups then skip the GET."""
+        self._resource_cache = resource
+        self._resource_primed = True
+
+    def request_matches(self, api_client: kubernetes.client.ApiClient) -> bool:
+        """Return if the CertificateSigningRequest in the cluster was created from
+        this object's CSR, i.e. a cert it issues belongs to this CSR's key"""
+        resource = self.get_resource(api_client)
+        if not resource or not resource.spec or not resource.spec.request:
+            return False
+        return base64.b64decode(resource.spec.request) == base64.b64decode(self.csr_str)
+
     def resource_exists(
         self, api_client: kubernetes.client.ApiClient, cache: Optional[bool] = True
     ) -> bool:
@@ -72,46 +185,185 @@ class CSRResource:
         """Create the CertificateSigningRequest in the kubernetes cluster"""
         if not self.resource_exists(api_client):
             api_instance = kubernetes.client.CertificatesV1beta1Api(api_client)
-            return api_instance.create_certificate_signing_request(self.get_text())
+            response = api_instance.create_certificate_signing_request(self.get_text())
+            self._resource_cache = response
+            return response
         else:
             return self.get_resource(api_client)
 
     def approve(
         self,
         api_client: kubernetes.client.ApiClient,
-        message: Optional[str] = "This certificate was approved by the Python Client.",
-        reason: Optional[str] = "ApprovedForUser",
+        message: Optional[str] = APPROVE_MESSAGE,
+        reason: Optional[str] = APPROVE_REASON,
+        retries: Optional[int] = 3,
     ):
-        """Approve the CSR in Kubernetes"""
-        csr_status = self.get_resource(api_client, cache=False)
-        # create an approval condition
-        approval_condition = kubernetes.client.V1beta1CertificateSigningRequestCondition(
-            last_update_time=datetime.now(timezone.utc).astimezone(),
-            message=message,
-            reason=reason,
-            type="Approved",
-        )
+        """Approve the CSR in Kubernetes
 
-        # patch the existing `body` with the new conditions
-        # you might want to append the new conditions to the existing ones
-        csr_status.status.conditions = [approval_condition]
+        The approval condition is appended to any existing conditions and sent
+        in a single request, using the resourceVersion of the last known CSR
+        (e.g. from create). If the CSR changed in the meantime, it is read again
+        and the approval retried up to retries times.
+        """
         api_instance = kubernetes.client.CertificatesV1beta1Api(api_client)
-        response = api_instance.replace_certificate_signing_request_approval(
-            self.name, csr_status
+        response = approve_object(
+            api_instance,
+            self.name,
+            self.get_resource(api_client),
+            message=message,
+            reason=reason,
+            retries=retries,
         )
         self._resource_cache = response
         return response
 
     def get_cert(
-        self, api_client: kubernetes.client.ApiClient, timeout: Optional[int] = 10
+        self,
+        api_client: kubernetes.client.ApiClient,
+        timeout: Optional[float] = None,
+        deadline: Optional[float] = None,
     ):
-        """Get the certificate from the CSR object"""
-        start = time.time()
-        cert = None
-        while time.time() - start < timeout:
-            csr_status = self.get_resource(api_client, cache=False)
-            cert = csr_status.status.certificate
+        """Get the certificate from the CSR object
+
+        Rather than polling, this watches the named CSR from the resourceVersion
+        of the last read and returns as soon as the signer fills in
+        status.certificate. If the watch fails or ends early, fall back to
+        polling with self.poll_policy until the deadline.
+
+        :param timeout: an optional number of seconds to wait for the
+            certificate, overriding the poll policy timeout
+        :param deadline: an optional time.monotonic() deadline shared with the caller
+        :returns: the base64 encoded certificate, or None on timeout
+        :raises ValueError: if the CSR has been denied
+        """
+        poll = self.poll_policy.start(timeout=timeout, deadline=deadline)
+        csr_status = self._check_not_denied(self.get_resource(api_client, cache=False))
+        cert = self._certificate(csr_status)
+        if cert or csr_status is None:
+            return cert
+        try:
+            cert = self._watch_cert(
+                api_client, csr_status.metadata.resource_version, poll.deadline
+            )
+        except ApiException:
+            # e.g. 410 Gone when the resourceVersion is too old to watch from
+            cert = None
+        if cert:
+            return cert
+        for _ in poll:
+            cert = self._certificate(
+                self._check_not_denied(self.get_resource(api_client, cache=False))
+            )
             if cert:
                 break
-            time.sleep(1)
         return cert
+
+    def _check_not_denied(self, csr_status):
+        if csr_status is not None and is_denied(csr_status):
+            raise ValueError(f"CSR {self.name} has been denied")
+        return csr_status
+
+    def _watch_cert(
+        self,
+        api_client: kubernetes.client.ApiClient,
+        resource_version: Optional[str],
+        deadline: float,
+    ):
+        """Watch the CSR until it has a certificate or the deadline passes"""
+        remaining = deadline - time.monotonic()
+        if remaining < 1:
+            return None
+        api_instance = kubernetes.client.CertificatesV1beta1Api(api_client)
+        watch = kubernetes.watch.Watch()
+        try:
+            for event in watch.stream(
+                api_instance.list_certificate_signing_request,
+                field_selector=f"metadata.name={self.name}",
+                resource_version=resource_version,
+                timeout_seconds=int(remaining),
+                _request_timeout=remaining + 5,
+            ):
+                if event["type"] == "ERROR":
+                    break
+                if event["type"] == "DELETED":
+                    self._resource_cache = None
+                    break
+                self._resource_cache = self._check_not_denied(event["object"])
+                cert = self._certificate(event["object"])
+                if cert:
+                    return cert
+                if time.monotonic() >= deadline:
+                    break
+        finally:
+            watch.stop()
+        return None
+
+    @staticmethod
+    def _certificate(csr_status):
+        """Return status.certificate of a CSR object, or None"""
+        status = getattr(csr_status, "status", None)
+        return getattr(status, "certificate", None)
+
+
+def approve_many(
+    api_client: kubernetes.client.ApiClient,
+    names: Optional[Iterable[str]] = None,
+    label_selector: Optional[str] = None,
+    message: Optional[str] = APPROVE_MESSAGE,
+    reason: Optional[str] = APPROVE_REASON,
+    max_workers: Optional[int] = 10,
+    executor: Optional[Executor] = None,
+) -> Iterator[ApproveResult]:
+    """Approve many pending CSRs concurrently
+
+    The CSRs are listed once and approved from the listed objects, so each
+    approval costs a single request. Results are yielded as they complete.
+    Without a label_selector, the CSRs come from the api_client's shared CSR
+    informer, which is started if it is not running and keeps running until
+    informer.stop_informers(api_client) is called.
+
+    :param names: an optional set of CSR names to approve
+    :param label_selector: an optional label selector the CSRs must match
+    :param max_workers: the number of concurrent approvals. Ignored if
+        executor is given.
+    :param executor: an optional concurrent.futures.Executor to approve on
+    :returns: an iterator of ApproveResult. Names that are not found, have
+        been denied or are no longer pending are reported with approved=False.
+    """
+    if names is None and label_selector is None:
+        raise ValueError("Must supply names or label_selector")
+    api_instance = kubernetes.client.CertificatesV1beta1Api(api_client)
+    if label_selector:
+        csrs = api_instance.list_certificate_signing_request(
+            label_selector=label_selector
+        ).items
+    else:
+        csrs = start_informer(api_client, CSR_KIND).list()
+    listed = {csr.metadata.name: csr for csr in csrs}
+    wanted = set(names) if names is not None else set(listed)
+    for name in sorted(wanted - set(listed)):
+        yield ApproveResult(name=name, approved=False, error="not found")
+
+    def _approve(csr):
+        try:
+            approve_object(api_instance, csr.metadata.name, csr, message, reason)
+        except ApiException as exc:
+            return ApproveResult(
+                name=csr.metadata.name, approved=False, error=f"{exc.status} {exc.reason}"
+            )
+        except ValueError:
+            # denied since it was listed
+            return ApproveResult(name=csr.metadata.name, approved=False, error="denied")
+        return ApproveResult(name=csr.metadata.name, approved=True, error=None)
+
+    with ExecutorScope(executor, max_workers) as scope:
+        for name in sorted(wanted & set(listed)):
+            csr = listed[name]
+            if not is_pending(csr):
+                if names is not None:
+                    error = "denied" if is_denied(csr) else "not pending"
+                    yield ApproveResult(name=name, approved=False, error=error)
+                continue
+            scope.submit(_approve, csr)
+        for future in as_completed(scope.futures):
+            yield future.result()
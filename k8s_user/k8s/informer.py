@@ -0,0 +1,220 @@
+from typing import Optional, Callable, Dict, List
+import logging
+import threading
+import kubernetes
+from kubernetes.client.rest import ApiException
+
+
+logger = logging.getLogger(__name__)
+
+
+CSR_KIND = "certificatesigningrequests"
+SA_KIND = "serviceaccounts"
+SECRET_KIND = "secrets"
+
+
+def _list_func(api_client: kubernetes.client.ApiClient, kind: str, namespace: str):
+    """Return the list/watch API function of a resource kind"""
+    if kind == CSR_KIND:
+        return kubernetes.client.CertificatesV1beta1Api(
+            api_client
+        ).list_certificate_signing_request, {}
+    core = kubernetes.client.CoreV1Api(api_client)
+    if kind == SA_KIND:
+        return core.list_namespaced_service_account, {"namespace": namespace}
+    if kind == SECRET_KIND:
+        return core.list_namespaced_secret, {"namespace": namespace}
+    raise ValueError(f"Unsupported informer kind: {kind}")
+
+
+class Informer:
+    """A list+watch cache of one resource kind.
+
+    start() LISTs the resources once and then keeps the cache up to date from
+    a watch stream on a background thread, re-LISTing when the watch falls too
+    far behind (410 Gone).
+
+    :param list_func: the API list function, e.g. CoreV1Api.list_namespaced_secret
+    :param list_kwargs: extra kwargs for list_func, such as the namespace
+    :param watch_timeout: the number of seconds each watch request stays open
+    :param retry_delay: the number of seconds to wait after a failed watch
+    :param page_size: the number of objects fetched per LIST request
+    """
+
+    def __init__(
+        self,
+        list_func: Callable,
+        list_kwargs: Optional[Dict] = None,
+        watch_timeout: int = 300,
+        retry_delay: float = 1,
+        page_size: int = 500,
+    ):
+        self.list_func = list_func
+        self.list_kwargs = list_kwargs if list_kwargs else {}
+        self.watch_timeout = watch_timeout
+        self.retry_delay = retry_delay
+        self.page_size = page_size
+        self.resource_version = None
+        self._objects = {}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._synced = threading.Event()
+        self._stopped = threading.Event()
+        self._watch = None
+        self._thread = None
+
+    def start(self):
+        """LIST the resources, then watch them on a daemon thread. Only the
+        first call does so; concurrent calls wait for it to finish."""
+        with self._start_lock:
+            if self._thread:
+                return
+            self._list()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._watch:
+            self._watch.stop()
+
+    @property
+    def has_synced(self) -> bool:
+        return self._synced.is_set()
+
+    def get(self, name: str):
+        """Return the cached object with this name, or None"""
+        with self._lock:
+            return self._objects.get(name)
+
+    def list(self) -> List:
+        """Return all of the cached objects"""
+        with self._lock:
+            return list(self._objects.values())
+
+    def _list(self):
+        objects = {}
+        kwargs = {**self.list_kwargs, "limit": self.page_size}
+        while True:
+            try:
+                response = self.list_func(**kwargs)
+            except ApiException as exc:
+                # the continue token expired, so start the LIST over
+                if exc.status != 410 or "_continue" not in kwargs:
+                    raise
+                objects = {}
+                del kwargs["_continue"]
+                continue
+            for obj in response.items:
+                objects[obj.metadata.name] = obj
+            if not response.metadata._continue:
+                break
+            kwargs["_continue"] = response.metadata._continue
+        with self._lock:
+            self._objects = objects
+            self.resource_version = response.metadata.resource_version
+        self._synced.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._watch_once()
+            except ApiException as exc:
+                if exc.status == 410:
+                    self._relist()
+                    continue
+                logger.warning("informer watch failed: %s", exc)
+                self._stopped.wait(self.retry_delay)
+            except Exception as exc:
+                logger.warning("informer watch failed: %s", exc)
+                self._stopped.wait(self.retry_delay)
+
+    def _relist(self):
+        try:
+            self._list()
+        except Exception as exc:
+            logger.warning("informer list failed: %s", exc)
+            self._stopped.wait(self.retry_delay)
+
+    def _watch_once(self):
+        self._watch = kubernetes.watch.Watch()
+        for event in self._watch.stream(
+            self.list_func,
+            resource_version=self.resource_version,
+            timeout_seconds=self.watch_timeout,
+            **self.list_kwargs,
+        ):
+            if self._stopped.is_set():
+                break
+            event_type = event["type"]
+            if event_type == "ERROR":
+                if event["raw_object"].get("code") == 410:
+                    self._relist()
+                    return
+                raise ApiException(
+                    status=event["raw_object"].get("code"),
+                    reason=event["raw_object"].get("message"),
+                )
+            obj = event["object"]
+            with self._lock:
+                if event_type == "DELETED":
+                    self._objects.pop(obj.metadata.name, None)
+                elif event_type in ("ADDED", "MODIFIED"):
+                    self._objects[obj.metadata.name] = obj
+                self.resource_version = obj.metadata.resource_version
+
+
+# started informers, per ApiClient, keyed by (kind, namespace). An informer's
+# list_func holds on to its ApiClient, so entries stay until stop_informers.
+_informers = {}
+_informers_lock = threading.Lock()
+
+
+def start_informer(
+    api_client: kubernetes.client.ApiClient,
+    kind: str,
+    namespace: Optional[str] = None,
+    **kwargs,
+) -> Informer:
+    """Start the shared informer of a resource kind for this ApiClient
+
+    Once started, CSRResource and SAResource lookups through the same
+    ApiClient are answered from the informer's cache. Starting an informer
+    that is already running returns the running one.
+
+    The informer's watch thread and the ApiClient are kept until
+    stop_informers(api_client) is called, which every caller must do once it
+    is done with the client.
+
+    :param kind: one of CSR_KIND, SA_KIND or SECRET_KIND
+    :param namespace: the namespace of SA_KIND and SECRET_KIND informers
+    :param kwargs: extra Informer arguments
+    """
+    key = (kind, None if kind == CSR_KIND else namespace)
+    with _informers_lock:
+        informers = _informers.setdefault(api_client, {})
+        informer = informers.get(key)
+        if informer is None:
+            list_func, list_kwargs = _list_func(api_client, kind, namespace)
+            informer = Informer(list_func, list_kwargs, **kwargs)
+            informers[key] = informer
+    informer.start()
+    return informer
+
+
+def get_informer(
+    api_client: kubernetes.client.ApiClient, kind: str, namespace: Optional[str] = None
+) -> Optional[Informer]:
+    """Return the synced informer of a resource kind for this ApiClient, or None"""
+    key = (kind, None if kind == CSR_KIND else namespace)
+    with _informers_lock:
+        informer = _informers.get(api_client, {}).get(key)
+    return informer if informer and informer.has_synced else None
+
+
+def stop_informers(api_client: kubernetes.client.ApiClient):
+    """Stop and forget all of the informers of this ApiClient"""
+    with _informers_lock:
+        informers = _informers.pop(api_client, {})
+    for informer in informers.values():
+        informer.stop()
@@ -0,0 +1,168 @@
+from typing import Optional, Callable, Dict, IO, Iterable, Iterator, Set, Tuple
+from datetime import datetime, timezone
+import base64
+import json
+import kubernetes
+from ..cert_index import pem_to_der, read_cert_fields
+from ..loader import iter_pem_blocks
+from .labels import MANAGED_BY_SELECTOR
+from .sa_resource import SA_NAME_ANNOTATION, SA_TOKEN_SECRET_TYPE
+
+
+INVENTORY_KINDS = ("csr", "serviceaccount")
+
+
+def paginate(list_func: Callable, page_size: int = 500, **kwargs) -> Iterator[Dict]:
+    """Yield the raw JSON items of a list API function, one page at a time
+
+    Responses are not deserialized into kubernetes client models, which is
+    much faster for large lists. Only one page is held in memory at a time.
+
+    :param list_func: the API list function, e.g. CoreV1Api.list_namespaced_secret
+    :param page_size: the number of items fetched per LIST request
+    :param kwargs: extra kwargs for list_func, such as a label_selector
+    """
+    kwargs["limit"] = page_size
+    while True:
+        response = list_func(_preload_content=False, **kwargs)
+        try:
+            page = json.loads(response.data)
+        finally:
+            response.release_conn()
+        yield from page.get("items") or []
+        continue_token = (page.get("metadata") or {}).get("continue")
+        if not continue_token:
+            return
+        kwargs["_continue"] = continue_token
+
+
+def cert_expiry(certificate: Optional[str]) -> Optional[str]:
+    """Return the ISO not-after time of a base64 encoded PEM certificate, such
+    as a CSR's status.certificate, or None"""
+    if not certificate:
+        return None
+    try:
+        for label, block in iter_pem_blocks(base64.b64decode(certificate)):
+            if label == "CERTIFICATE":
+                not_after = read_cert_fields(pem_to_der(block))["not_after"]
+                return datetime.fromtimestamp(not_after, timezone.utc).isoformat()
+    except (ValueError, IndexError):
+        pass
+    return None
+
+
+def csr_record(csr: Dict) -> Dict:
+    """Return the inventory record of a raw CSR object"""
+    metadata = csr.get("metadata") or {}
+    status = csr.get("status") or {}
+    condition_types = {c.get("type") for c in status.get("conditions") or []}
+    certificate = status.get("certificate")
+    return {
+        "kind": "csr",
+        "name": metadata.get("name"),
+        "namespace": None,
+        "created": metadata.get("creationTimestamp"),
+        "approved": "Approved" in condition_types,
+        "denied": "Denied" in condition_types,
+        "issued": bool(certificate),
+        "cert_not_after": cert_expiry(certificate),
+    }
+
+
+def service_account_record(sa: Dict, token_secret_owners: Set[Tuple[str, str]]) -> Dict:
+    """Return the inventory record of a raw ServiceAccount object
+
+    :param token_secret_owners: the (namespace, name) of every ServiceAccount
+        with a token Secret, from token_secret_owners
+    """
+    metadata = sa.get("metadata") or {}
+    namespace, name = metadata.get("namespace"), metadata.get("name")
+    return {
+        "kind": "serviceaccount",
+        "name": name,
+        "namespace": namespace,
+        "created": metadata.get("creationTimestamp"),
+        "token_secret": (namespace, name) in token_secret_owners,
+    }
+
+
+def token_secret_owners(
+    api_instance: kubernetes.client.CoreV1Api,
+    namespace: Optional[str] = None,
+    page_size: int = 500,
+) -> Set[Tuple[str, str]]:
+    """Return the (namespace, name) of every ServiceAccount that a token Secret
+    exists for
+
+    Token Secrets are found by type and service account annotation rather than
+    through the ServiceAccount's secrets, which are empty on Kubernetes 1.24+
+    and may name a Secret that was deleted.
+
+    :param namespace: an optional namespace to limit Secrets to. Defaults to
+        all namespaces.
+    :param page_size: the number of Secrets fetched per LIST request
+    """
+    list_kwargs = {"field_selector": f"type={SA_TOKEN_SECRET_TYPE}"}
+    if namespace:
+        list_func = api_instance.list_namespaced_secret
+        list_kwargs["namespace"] = namespace
+    else:
+        list_func = api_instance.list_secret_for_all_namespaces
+    owners = set()
+    for secret in paginate(list_func, page_size, **list_kwargs):
+        metadata = secret.get("metadata") or {}
+        sa_name = (metadata.get("annotations") or {}).get(SA_NAME_ANNOTATION)
+        if sa_name:
+            owners.add((metadata.get("namespace"), sa_name))
+    return owners
+
+
+def iter_inventory(
+    api_client: kubernetes.client.ApiClient,
+    namespace: Optional[str] = None,
+    label_selector: Optional[str] = MANAGED_BY_SELECTOR,
+    page_size: int = 500,
+    kinds: Iterable[str] = INVENTORY_KINDS,
+) -> Iterator[Dict]:
+    """Yield an inventory record for every CSR and ServiceAccount created by
+    this tool
+
+    :param namespace: an optional namespace to limit ServiceAccounts to.
+        Defaults to all namespaces.
+    :param label_selector: the label selector of the objects to include.
+        Defaults to the managed-by label this tool adds.
+    :param page_size: the number of objects fetched per LIST request
+    :param kinds: the kinds of objects to include, from INVENTORY_KINDS
+    """
+    list_kwargs = {"label_selector": label_selector} if label_selector else {}
+    if "csr" in kinds:
+        api_instance = kubernetes.client.CertificatesV1beta1Api(api_client)
+        for csr in paginate(
+            api_instance.list_certificate_signing_request, page_size, **list_kwargs
+        ):
+            yield csr_record(csr)
+    if "serviceaccount" in kinds:
+        api_instance = kubernetes.client.CoreV1Api(api_client)
+        owners = token_secret_owners(api_instance, namespace, page_size)
+        if namespace:
+            list_func = api_instance.list_namespaced_service_account
+            list_kwargs["namespace"] = namespace
+        else:
+            list_func = api_instance.list_service_account_for_all_namespaces
+        for sa in paginate(list_func, page_size, **list_kwargs):
+            yield service_account_record(sa, owners)
+
+
+def write_inventory(api_client: kubernetes.client.ApiClient, out: IO, **kwargs) -> int:
+    """Write the inventory to out as JSON lines
+
+    :param out: a text file object
+    :param kwargs: iter_inventory arguments
+    :returns: the number of records written
+    """
+    count = 0
+    for record in iter_inventory(api_client, **kwargs):
+        out.write(json.dumps(record, sort_keys=True))
+        out.write("\n")
+        count += 1
+    return count
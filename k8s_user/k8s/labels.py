@@ -0,0 +1,14 @@
+from typing import Optional, Dict
+
+
+# the recommended Kubernetes label marking the resources this tool creates
+MANAGED_BY_LABEL = "app.kubernetes.io/managed-by"
+MANAGED_BY = "k8s_user"
+MANAGED_BY_SELECTOR = f"{MANAGED_BY_LABEL}={MANAGED_BY}"
+
+
+def with_managed_by(metadata: Optional[Dict] = None) -> Dict:
+    """Return a copy of a V1ObjectMeta fields dict with the managed-by label added"""
+    metadata = dict(metadata) if metadata else {}
+    metadata["labels"] = {**(metadata.get("labels") or {}), MANAGED_BY_LABEL: MANAGED_BY}
+    return metadata
@@ -0,0 +1,97 @@
+from typing import Optional, Iterator
+import random
+import time
+from ..metrics import count_poll_iteration
+
+
+class PollPolicy:
+    """How the wait loops poll the Kubernetes API.
+
+    The first attempt is made immediately. After each failed attempt the loop
+    sleeps for the current delay, randomized by +/- jitter, and the delay is
+    multiplied by backoff up to max_delay. Polling stops at the deadline,
+    timeout seconds after start().
+
+    :param timeout: the overall number of seconds to wait
+    :param initial_delay: the number of seconds to sleep after the first attempt
+    :param max_delay: the largest number of seconds to sleep between attempts
+    :param backoff: the factor the delay grows by after each attempt
+    :param jitter: the fraction of each delay to randomize by, from 0 to 1
+    """
+
+    def __init__(
+        self,
+        timeout: float = 10,
+        initial_delay: float = 0.1,
+        max_delay: float = 2,
+        backoff: float = 2,
+        jitter: float = 0.1,
+    ):
+        if not 0 <= jitter <= 1:
+            raise ValueError("jitter must be between 0 and 1")
+        if backoff < 1:
+            raise ValueError("backoff must be at least 1")
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.jitter = jitter
+
+    def __repr__(self):
+        return (
+            f"PollPolicy(timeout={self.timeout}, initial_delay={self.initial_delay}, "
+            f"max_delay={self.max_delay}, backoff={self.backoff}, jitter={self.jitter})"
+        )
+
+    def start(
+        self, timeout: Optional[float] = None, deadline: Optional[float] = None
+    ) -> "Poll":
+        """Start polling
+
+        :param timeout: an optional number of seconds overriding self.timeout
+        :param deadline: an optional time.monotonic() deadline to share with an
+            enclosing wait loop. The earlier of it and the timeout is used.
+        """
+        end = time.monotonic() + (self.timeout if timeout is None else timeout)
+        if deadline is not None:
+            end = min(end, deadline)
+        return Poll(self, end)
+
+    def delays(self) -> Iterator[float]:
+        """Yield the sleep before each retry, without the deadline cap"""
+        delay = self.initial_delay
+        while True:
+            yield delay * (1 + random.uniform(-self.jitter, self.jitter))
+            delay = min(delay * self.backoff, self.max_delay)
+
+
+DEFAULT_POLL_POLICY = PollPolicy()
+
+
+class Poll:
+    """One run of a PollPolicy, iterated once per attempt.
+
+    Iterating yields the attempt number, sleeping between attempts, and stops
+    once the deadline has passed. Nested wait loops should pass
+    poll.deadline down, so the deadline bounds the whole wait rather than each
+    loop.
+    """
+
+    def __init__(self, policy: PollPolicy, deadline: float):
+        self.policy = policy
+        self.deadline = deadline
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def __iter__(self) -> Iterator[int]:
+        delays = self.policy.delays()
+        attempt = 0
+        while True:
+            count_poll_iteration()
+            yield attempt
+            attempt += 1
+            remaining = self.remaining()
+            if not remaining:
+                return
+            time.sleep(min(next(delays), remaining))
@@ -1,8 +1,19 @@
 from typing import Optional, Dict, List
+import base64
 import time
 from datetime import datetime, timezone
 import kubernetes
 from kubernetes.client.rest import ApiException
+from .informer import SA_KIND, SECRET_KIND, get_informer
+from .polling import DEFAULT_POLL_POLICY, PollPolicy
+
+
+SA_TOKEN_SECRET_TYPE = "kubernetes.io/service-account-token"
+SA_NAME_ANNOTATION = "kubernetes.io/service-account.name"
+
+# TokenRequest failures that fall back to reading the token Secret: the API
+# server lacks the token subresource, or RBAC does not allow creating tokens
+TOKEN_REQUEST_FALLBACK_STATUSES = (403, 404, 405)
 
 
 class SAResource:
@@ -11,13 +22,19 @@ class SAResource:
         name: str,
         namespace: str,
         metadata: Optional[Dict] = None,
-        extra_kwargs: Dict = {},
+        extra_kwargs: Optional[Dict] = None,
+        poll_policy: Optional[PollPolicy] = None,
     ):
         self._resource_cache = None
+        self._resource_primed = False
         self._resource_token_secret_cache = None
+        # whether create() made the ServiceAccount
+        self.created = False
         self.name = name
         self.namespace = namespace
-        self.metadata = metadata if isinstance(metadata, dict) else {}
+        self.metadata = dict(metadata) if isinstance(metadata, dict) else {}
+        self.poll_policy = poll_policy if poll_policy else DEFAULT_POLL_POLICY
+        extra_kwargs = extra_kwargs if extra_kwargs else {}
         self.automount_service_account_token = extra_kwargs.get(
             "automount_service_account_token", False
         )
@@ -25,8 +42,7 @@ class SAResource:
     def get_text(self):
         """Return the text of the ServiceAccount that will be set to the
         kubernetes api."""
-        metadata = self.metadata
-        metadata.update({"name": self.name})
+        metadata = {**self.metadata, "name": self.name}
         return kubernetes.client.V1ServiceAccount(
             kind="ServiceAccount",
             metadata=kubernetes.client.V1ObjectMeta(**metadata),
@@ -36,10 +52,16 @@ class SAResource:
     def get_resource(self, api_client: kubernetes.client.ApiClient, cache=True):
         """Get the ServiceAccount object from the kubernetes cluster based on 
         the self.name. If cache is set to True, then cache the result and fetch from
-        the cache on subsequent lookups.
+        the cache on subsequent lookups. If a ServiceAccount informer was started
+        for this api_client and namespace, cached lookups are answered from the
+        informer instead.
         """
-        if cache and self._resource_cache:
-            return self._resource_cache
+        if cache:
+            informer = get_informer(api_client, SA_KIND, self.namespace)
+            if informer:
+                return informer.get(self.name)
+            if self._resource_cache or self._resource_primed:
+                return self._resource_cache
         api_instance = kubernetes.client.CoreV1Api(api_client)
 
         try:
@@ -53,6 +75,13 @@ class SAResource:
         self._resource_cache = response
         return response
 
+    def prime(self, resource):
+        """Seed the cache with a ServiceAccount object looked up elsewhere, e.g.
+        by one LIST of its namespace. None records that the ServiceAccount does
+        not exist. Cached lookups then skip the GET."""
+        self._resource_cache = resource
+        self._resource_primed = True
+
     def resource_exists(
         self, api_client: kubernetes.client.ApiClient, cache: Optional[bool] = True
     ) -> bool:
@@ -60,21 +89,38 @@ class SAResource:
         return bool(self.get_resource(api_client, cache))
 
     def create(self, api_client: kubernetes.client.ApiClient):
-        """Create the ServiceAccount in the kubernetes cluster"""
+        """Create the ServiceAccount in the kubernetes cluster, unless it exists"""
         if not self.resource_exists(api_client):
             api_instance = kubernetes.client.CoreV1Api(api_client)
-            return api_instance.create_namespaced_service_account(
-                namespace=self.namespace, body=self.get_text()
-            )
+            try:
+                response = api_instance.create_namespaced_service_account(
+                    namespace=self.namespace, body=self.get_text()
+                )
+            except ApiException as exc:
+                # 409 means it was created since it was looked up
+                if exc.status != 409:
+                    raise
+                return self.get_resource(api_client, cache=False)
+            self.created = True
+            return response
         else:
             return self.get_resource(api_client)
 
     def get_token_secret_resource_name(
-        self, api_client: kubernetes.client.ApiClient, timeout: int = 10
+        self,
+        api_client: kubernetes.client.ApiClient,
+        timeout: Optional[float] = None,
+        deadline: Optional[float] = None,
     ):
-        start = time.time()
-        cert = None
-        while time.time() - start < timeout:
+        """Wait for the ServiceAccount to reference its token Secret and return
+        the Secret name, or None on timeout.
+
+        :param timeout: an optional number of seconds to wait, overriding the
+            poll policy timeout
+        :param deadline: an optional time.monotonic() deadline shared with the caller
+        """
+        token = None
+        for _ in self.poll_policy.start(timeout=timeout, deadline=deadline):
             sa = self.get_resource(api_client, cache=False)
             try:
                 token = [s for s in sa.secrets if "token" in s.name][0].name
@@ -82,16 +128,24 @@ class SAResource:
                 token = None
             if token:
                 break
-            time.sleep(1)
         return token
 
     def get_token_secret_resource(
-        self, api_client: kubernetes.client.ApiClient, cache=True
+        self,
+        api_client: kubernetes.client.ApiClient,
+        cache=True,
+        deadline: Optional[float] = None,
     ):
-        if cache and self._resource_token_secret_cache:
-            return self._resource_token_secret_cache
+        if cache:
+            informer = get_informer(api_client, SECRET_KIND, self.namespace)
+            if informer:
+                return self.find_token_secret(informer.list())
+            if self._resource_token_secret_cache:
+                return self._resource_token_secret_cache
         api_instance = kubernetes.client.CoreV1Api(api_client)
-        token_resource_name = self.get_token_secret_resource_name(api_client)
+        token_resource_name = self.get_token_secret_resource_name(
+            api_client, deadline=deadline
+        )
         try:
             response = api_instance.read_namespaced_secret(
                 name=token_resource_name, namespace=self.namespace
@@ -103,16 +157,172 @@ class SAResource:
         self._resource_token_secret_cache = response
         return response
 
-    def get_token(self, api_client: kubernetes.client.ApiClient, timeout: int = 10):
-        start = time.time()
-        token = None
-        while time.time() - start < timeout:
-            secret = self.get_token_secret_resource(api_client, cache=False)
-            try:
-                token = secret.data["token"]
-            except (IndexError, AttributeError):
-                token = None
+    def find_token_secret(self, secrets: List):
+        """Return the token Secret of this ServiceAccount from a list of Secrets,
+        or None"""
+        for secret in secrets:
+            annotations = secret.metadata.annotations or {}
+            if (
+                secret.type == SA_TOKEN_SECRET_TYPE
+                and annotations.get(SA_NAME_ANNOTATION) == self.name
+            ):
+                return secret
+        return None
+
+    def request_token(
+        self,
+        api_client: kubernetes.client.ApiClient,
+        audiences: Optional[List[str]] = None,
+        expiration_seconds: Optional[int] = None,
+    ) -> Optional[str]:
+        """Create a token for the ServiceAccount with the TokenRequest API
+
+        :param audiences: the intended audiences of the token. Defaults to the
+            API server's audience.
+        :param expiration_seconds: the requested lifetime of the token. The API
+            server may return a token with a different lifetime.
+        :returns: the token
+        """
+        # POST serviceaccounts/{name}/token directly, since not every supported
+        # kubernetes client has create_namespaced_service_account_token
+        spec = {}
+        if audiences:
+            spec["audiences"] = list(audiences)
+        if expiration_seconds:
+            spec["expirationSeconds"] = int(expiration_seconds)
+        response = api_client.call_api(
+            "/api/v1/namespaces/{namespace}/serviceaccounts/{name}/token",
+            "POST",
+            path_params={"namespace": self.namespace, "name": self.name},
+            body={
+                "apiVersion": "authentication.k8s.io/v1",
+                "kind": "TokenRequest",
+                "spec": spec,
+            },
+            header_params={
+                "Accept": "application/json",
+                "Content-Type": "application/json",
+            },
+            auth_settings=["BearerToken"],
+            response_type="object",
+            _return_http_data_only=True,
+        )
+        return (response.get("status") or {}).get("token")
+
+    def get_secret_token(
+        self,
+        api_client: kubernetes.client.ApiClient,
+        timeout: Optional[float] = None,
+    ) -> Optional[str]:
+        """Wait for the ServiceAccount token Secret and return its decoded token,
+        or None on timeout.
+
+        This lists the token Secrets of the namespace once and then watches them
+        from that resourceVersion, returning as soon as this ServiceAccount's
+        token data appears. If the watch fails or ends early, fall back to
+        polling with self.poll_policy until the deadline. Token Secrets are not
+        created automatically since Kubernetes 1.24.
+
+        :param timeout: an optional number of seconds to wait, overriding the
+            poll policy timeout
+        """
+        poll = self.poll_policy.start(timeout=timeout)
+        try:
+            token = self._watch_secret_token(api_client, poll.deadline)
+        except ApiException:
+            token = None
+        if token:
+            return token
+        for _ in poll:
+            secret = self.get_token_secret_resource(
+                api_client, cache=False, deadline=poll.deadline
+            )
+            token = self._secret_token(secret)
             if token:
                 break
-            time.sleep(1)
         return token
+
+    def _watch_secret_token(
+        self, api_client: kubernetes.client.ApiClient, deadline: float
+    ) -> Optional[str]:
+        """Watch the namespace's token Secrets until this ServiceAccount's token
+        appears or the deadline passes"""
+        api_instance = kubernetes.client.CoreV1Api(api_client)
+        field_selector = f"type={SA_TOKEN_SECRET_TYPE}"
+        secrets = api_instance.list_namespaced_secret(
+            self.namespace, field_selector=field_selector
+        )
+        secret = self.find_token_secret(secrets.items)
+        token = self._secret_token(secret)
+        if token:
+            self._resource_token_secret_cache = secret
+            return token
+        remaining = deadline - time.monotonic()
+        if remaining < 1:
+            return None
+        watch = kubernetes.watch.Watch()
+        try:
+            for event in watch.stream(
+                api_instance.list_namespaced_secret,
+                self.namespace,
+                field_selector=field_selector,
+                resource_version=secrets.metadata.resource_version,
+                timeout_seconds=int(remaining),
+                _request_timeout=remaining + 5,
+            ):
+                if event["type"] == "ERROR":
+                    break
+                if event["type"] in ("ADDED", "MODIFIED"):
+                    secret = self.find_token_secret([event["object"]])
+                    token = self._secret_token(secret)
+                    if token:
+                        self._resource_token_secret_cache = secret
+                        return token
+                if time.monotonic() >= deadline:
+                    break
+        finally:
+            watch.stop()
+        return None
+
+    @staticmethod
+    def _secret_token(secret) -> Optional[str]:
+        """Return the decoded token of a token Secret object, or None"""
+        try:
+            return base64.b64decode(secret.data["token"]).decode("utf-8")
+        except (IndexError, KeyError, AttributeError, TypeError):
+            return None
+
+    def get_token(
+        self,
+        api_client: kubernetes.client.ApiClient,
+        timeout: Optional[float] = None,
+        token_request: bool = True,
+        audiences: Optional[List[str]] = None,
+        expiration_seconds: Optional[int] = None,
+    ) -> Optional[str]:
+        """Return a token for the ServiceAccount
+
+        The token is created with the TokenRequest API in a single call. If the
+        cluster does not support it, or token_request is False, fall back to
+        waiting for the ServiceAccount token Secret.
+
+        :param timeout: an optional number of seconds to wait for the token
+            Secret, overriding the poll policy timeout
+        :param token_request: whether to try the TokenRequest API first
+        :param audiences: the intended audiences of a requested token
+        :param expiration_seconds: the requested lifetime of a requested token
+        """
+        if token_request:
+            try:
+                token = self.request_token(
+                    api_client,
+                    audiences=audiences,
+                    expiration_seconds=expiration_seconds,
+                )
+            except ApiException as exc:
+                if exc.status not in TOKEN_REQUEST_FALLBACK_STATUSES:
+                    raise
+                token = None
+            if token:
+                return token
+        return self.get_secret_token(api_client, timeout=timeout)
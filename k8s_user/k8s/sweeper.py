@@ -0,0 +1,129 @@
+from typing import Optional, Iterator
+from datetime import datetime, timedelta, timezone
+import collections
+from concurrent.futures import FIRST_COMPLETED, Executor, as_completed, wait
+import kubernetes
+from kubernetes.client.rest import ApiException
+from ..executors import ExecutorScope
+from .labels import MANAGED_BY_SELECTOR
+
+
+SweepResult = collections.namedtuple("SweepResult", "scanned expired deleted errors")
+
+
+def iter_csrs(
+    api_client: kubernetes.client.ApiClient,
+    label_selector: Optional[str] = MANAGED_BY_SELECTOR,
+    page_size: int = 500,
+) -> Iterator:
+    """Yield the CSR objects matching label_selector, one page of LISTs at a time
+
+    If the continue token expires (410 Gone) during a long listing, the LIST
+    starts over and skips the CSRs up to the last one yielded. The API server
+    lists CSRs in name order, so no CSR is yielded twice.
+
+    :param page_size: the number of CSRs fetched per LIST request
+    """
+    api_instance = kubernetes.client.CertificatesV1beta1Api(api_client)
+    kwargs = {"limit": page_size}
+    if label_selector:
+        kwargs["label_selector"] = label_selector
+    last_name = resume_after = None
+    while True:
+        try:
+            page = api_instance.list_certificate_signing_request(**kwargs)
+        except ApiException as exc:
+            if exc.status != 410 or "_continue" not in kwargs:
+                raise
+            del kwargs["_continue"]
+            resume_after = last_name
+            continue
+        for csr in page.items:
+            if resume_after is not None and csr.metadata.name <= resume_after:
+                continue
+            last_name = csr.metadata.name
+            yield csr
+        if not page.metadata._continue:
+            return
+        kwargs["_continue"] = page.metadata._continue
+
+
+def sweep_csrs(
+    api_client: kubernetes.client.ApiClient,
+    retention: timedelta,
+    label_selector: Optional[str] = MANAGED_BY_SELECTOR,
+    dry_run: bool = False,
+    page_size: int = 500,
+    max_workers: Optional[int] = 10,
+    executor: Optional[Executor] = None,
+    now: Optional[datetime] = None,
+) -> SweepResult:
+    """Delete the CSRs created by this tool that are older than retention
+
+    CSRs are listed page by page and deleted concurrently while the next pages
+    are listed. At most twice max_workers deletes are pending at a time, so
+    memory use does not grow with the number of expired CSRs. Each delete is conditional on the listed object's uid, so a CSR
+    that was re-created under the same name is kept.
+
+    :param retention: how long to keep CSRs after they were created
+    :param label_selector: the label selector of the CSRs to consider.
+        Defaults to the managed-by label the CSR workflow adds.
+    :param dry_run: if True, only count the CSRs that would be deleted
+    :param page_size: the number of CSRs fetched per LIST request
+    :param max_workers: the number of concurrent deletes, which also bounds the
+        pending deletes when an executor is given
+    :param executor: an optional concurrent.futures.Executor to delete on
+    :returns: a SweepResult with the number of CSRs scanned, older than
+        retention and deleted, and a dict of CSR name to delete error
+    """
+    now = now if now else datetime.now(timezone.utc)
+    cutoff = now - retention
+    api_instance = kubernetes.client.CertificatesV1beta1Api(api_client)
+
+    def _delete(csr):
+        try:
+            api_instance.delete_certificate_signing_request(
+                csr.metadata.name,
+                body=kubernetes.client.V1DeleteOptions(
+                    preconditions=kubernetes.client.V1Preconditions(
+                        uid=csr.metadata.uid
+                    )
+                ),
+            )
+        except ApiException as exc:
+            # a 404 means the CSR is already gone
+            if exc.status != 404:
+                return csr.metadata.name, f"{exc.status} {exc.reason}"
+        return csr.metadata.name, None
+
+    scanned = expired = deleted = 0
+    errors = {}
+    max_pending = 2 * (max_workers or 10)
+
+    def _collect(done):
+        nonlocal deleted
+        for future in done:
+            scope.futures.pop(future)
+            name, error = future.result()
+            if error:
+                errors[name] = error
+            else:
+                deleted += 1
+
+    with ExecutorScope(executor, max_workers) as scope:
+        for csr in iter_csrs(api_client, label_selector, page_size):
+            scanned += 1
+            created = csr.metadata.creation_timestamp
+            if created is None or created > cutoff:
+                continue
+            expired += 1
+            if dry_run:
+                continue
+            if len(scope.futures) >= max_pending:
+                done, _ = wait(scope.futures, return_when=FIRST_COMPLETED)
+                _collect(done)
+            scope.submit(_delete, csr)
+        _collect(as_completed(scope.futures))
+    return SweepResult(
+        scanned=scanned, expired=expired, deleted=deleted, errors=errors
+    )
@@ -0,0 +1,176 @@
+from typing import Optional, Dict, Tuple, Any
+import collections
+import functools
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from .executors import ExecutorScope
+from .pki import generate_private_key
+
+
+def _generate_key_pem(algorithm: str, key_size: int) -> bytes:
+    """Generate a private key and return it as unencrypted PKCS8 PEM bytes.
+
+    This runs in the pool's worker processes. Key objects can not be pickled,
+    so keys are handed back to the parent process as PEM.
+    """
+    key = generate_private_key(algorithm=algorithm, key_size=key_size)
+    return key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+
+
+class KeyPoolStats:
+    """Counters describing how well a KeyPool is keeping up with demand."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.errors = 0
+        self.refill_latency_total = 0.0
+        self.refill_latency_max = 0.0
+
+    @property
+    def refill_latency_mean(self) -> float:
+        """Return the mean seconds between scheduling a refill and the key being ready."""
+        if not self.refills:
+            return 0.0
+        return self.refill_latency_total / self.refills
+
+    def to_dict(self) -> Dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refills": self.refills,
+            "errors": self.errors,
+            "refill_latency_mean": self.refill_latency_mean,
+            "refill_latency_max": self.refill_latency_max,
+        }
+
+
+class KeyPool:
+    """A pool of pre-generated private keys, filled in the background.
+
+    The pool keeps up to `size` ready keys for every (algorithm, key_size)
+    pair that has been requested or filled. Taking a key from the pool
+    schedules a replacement on the executor, so a steady stream of callers
+    rarely has to wait on key generation. When the pool is empty, the key
+    is generated inline and counted as a miss.
+
+    :param size: the number of ready keys to keep per (algorithm, key_size)
+    :param max_workers: the number of worker processes used to generate keys.
+        Defaults to the number of CPUs. Ignored if executor is given.
+    :param executor: an optional concurrent.futures.Executor to generate keys on
+        instead of a private ProcessPoolExecutor.
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        max_workers: Optional[int] = None,
+        executor: Optional[Executor] = None,
+    ):
+        self.size = size
+        self._scope = ExecutorScope(executor, max_workers, ProcessPoolExecutor)
+        self._condition = threading.Condition(threading.RLock())
+        self._ready = collections.defaultdict(collections.deque)
+        self._pending = collections.Counter()
+        self._closed = False
+        self.stats = KeyPoolStats()
+
+    def fill(self, algorithm: str = "rsa", key_size: int = 4092):
+        """Schedule background generation of keys until the pool for this
+        (algorithm, key_size) holds `size` keys."""
+        with self._condition:
+            self._schedule_refill((algorithm, key_size))
+
+    def ready(self, algorithm: str = "rsa", key_size: int = 4092) -> int:
+        """Return the number of ready keys for this (algorithm, key_size)"""
+        with self._condition:
+            return len(self._ready[(algorithm, key_size)])
+
+    def wait(
+        self,
+        algorithm: str = "rsa",
+        key_size: int = 4092,
+        timeout: Optional[float] = None,
+    ) -> bool:
+        """Block until the pool for this (algorithm, key_size) is full or all
+        scheduled refills have finished. Returns True if the pool is full."""
+        pool_key = (algorithm, key_size)
+        with self._condition:
+            self._condition.wait_for(
+                lambda: len(self._ready[pool_key]) >= self.size
+                or not self._pending[pool_key],
+                timeout=timeout,
+            )
+            return len(self._ready[pool_key]) >= self.size
+
+    def get(self, algorithm: str = "rsa", key_size: int = 4092) -> Any:
+        """Take a key from the pool, generating one inline if the pool is empty.
+
+        :returns: a key object
+        """
+        pool_key = (algorithm, key_size)
+        with self._condition:
+            try:
+                key_pem = self._ready[pool_key].popleft()
+                self.stats.hits += 1
+            except IndexError:
+                key_pem = None
+                self.stats.misses += 1
+            self._schedule_refill(pool_key)
+
+        if key_pem is None:
+            return generate_private_key(algorithm=algorithm, key_size=key_size)
+        return serialization.load_pem_private_key(
+            key_pem, password=None, backend=default_backend()
+        )
+
+    def close(self, wait: bool = True):
+        """Stop refilling the pool, cancel the refills that have not started and
+        shut down its executor if the pool owns it."""
+        with self._condition:
+            self._closed = True
+        self._scope.close(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _schedule_refill(self, pool_key: Tuple[str, int]):
+        if self._closed:
+            return
+        missing = self.size - len(self._ready[pool_key]) - self._pending[pool_key]
+        for _ in range(missing):
+            self._pending[pool_key] += 1
+            future = self._scope.submit(_generate_key_pem, *pool_key)
+            future.add_done_callback(
+                functools.partial(self._refilled, pool_key, time.monotonic())
+            )
+
+    def _refilled(self, pool_key: Tuple[str, int], submitted: float, future: Future):
+        latency = time.monotonic() - submitted
+        with self._condition:
+            self._pending[pool_key] -= 1
+            self._scope.futures.pop(future, None)
+            if future.cancelled():
+                # close() cancels the refills that have not started
+                pass
+            elif future.exception():
+                self.stats.errors += 1
+            else:
+                self._ready[pool_key].append(future.result())
+                self.stats.refills += 1
+                self.stats.refill_latency_total += latency
+                self.stats.refill_latency_max = max(
+                    self.stats.refill_latency_max, latency
+                )
+            self._condition.notify_all()
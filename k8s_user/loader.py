@@ -0,0 +1,155 @@
+from typing import Optional, Dict, Iterator, Tuple, Any, Union
+import collections
+import mmap
+import os
+import re
+from concurrent.futures import Executor, as_completed
+from .executors import ExecutorScope
+from .pki import Cert, CSR, Key
+
+
+PEM_BLOCK_RE = re.compile(
+    rb"-----BEGIN ([A-Z0-9 ]+)-----\r?\n.*?-----END \1-----\r?\n?", re.DOTALL
+)
+
+
+# maps the file name suffixes written by the CSR workflow save steps to
+# UserPEMs fields
+PEM_FILE_SUFFIXES = {
+    ".key.pem": "key",
+    ".csr.pem": "csr",
+    ".crt.pem": "cert",
+}
+
+
+UserPEMs = collections.namedtuple("UserPEMs", "user_name key csr cert")
+
+
+def iter_pem_blocks(data: Any) -> Iterator[Tuple[str, bytes]]:
+    """Yield (label, block) pairs for every PEM object in data
+
+    :param data: a bytes-like object, such as bytes or an mmap, holding one
+        or more concatenated PEM objects
+    """
+    for match in PEM_BLOCK_RE.finditer(data):
+        yield match.group(1).decode("ascii"), match.group(0)
+
+
+def iter_pem_file(path: str) -> Iterator[Tuple[str, bytes]]:
+    """Yield (label, block) pairs for every PEM object in a file
+
+    The file is memory mapped, so only the matched blocks are copied.
+    """
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from iter_pem_blocks(data)
+
+
+def parse_pem_block(
+    label: str,
+    block: bytes,
+    password: Optional[str] = None,
+    common_name: Optional[str] = None,
+) -> Union[Key, CSR, Cert]:
+    """Parse a single PEM block into a pki Key, CSR or Cert
+
+    :param label: the PEM label, e.g. "CERTIFICATE"
+    :param block: the PEM bytes of the object
+    :param password: an optional password to decrypt private keys
+    :param common_name: an optional common name to give a CSR wrapper
+    """
+    if label == "CERTIFICATE":
+        return Cert(crt_data=block)
+    if label in ("CERTIFICATE REQUEST", "NEW CERTIFICATE REQUEST"):
+        return CSR(key=None, common_name=common_name, csr_data=block)
+    if label.endswith("PRIVATE KEY"):
+        return Key(key_data=block, key_file_password=password)
+    raise ValueError(f"Unsupported PEM object: {label}")
+
+
+def load_bundle(
+    path: str,
+    password: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    executor: Optional[Executor] = None,
+) -> Iterator[Union[Key, CSR, Cert]]:
+    """Parse every PEM object in a multi-object bundle, such as a CA bundle
+
+    Objects are parsed in parallel and yielded in the order they appear in
+    the bundle.
+
+    :param path: a filesystem path to a file of concatenated PEM objects
+    :param password: an optional password to decrypt private keys
+    :param max_workers: the number of parsing threads. Ignored if executor is given.
+    :param executor: an optional concurrent.futures.Executor to parse on
+    """
+    with ExecutorScope(executor, max_workers) as scope:
+        yield from scope.executor.map(
+            lambda pem: parse_pem_block(*pem, password=password),
+            iter_pem_file(path),
+        )
+
+
+def group_user_files(path: str) -> Dict[str, Dict[str, str]]:
+    """Group the PEM files of a credentials directory by user name
+
+    :param path: a directory holding <user>.key.pem, <user>.csr.pem and
+        <user>.crt.pem files
+    :returns: a dict mapping user names to a dict of UserPEMs field to file path
+    """
+    users = collections.defaultdict(dict)
+    with os.scandir(path) as entries:
+        for entry in entries:
+            for suffix, field in PEM_FILE_SUFFIXES.items():
+                if entry.name.endswith(suffix) and entry.is_file():
+                    users[entry.name[: -len(suffix)]][field] = entry.path
+                    break
+    return users
+
+
+def load_user_files(
+    user_name: str, paths: Dict[str, str], password: Optional[str] = None
+) -> UserPEMs:
+    """Parse the key, CSR and cert files of one user
+
+    :param user_name: the user name the files belong to
+    :param paths: a dict of UserPEMs field to file path, from group_user_files
+    :param password: an optional password to decrypt the key
+    """
+    loaded = dict(user_name=user_name, key=None, csr=None, cert=None)
+    for field, path in paths.items():
+        for label, block in iter_pem_file(path):
+            loaded[field] = parse_pem_block(
+                label, block, password=password, common_name=user_name
+            )
+            break
+    if loaded["csr"] is not None:
+        loaded["csr"].key = loaded["key"]
+    return UserPEMs(**loaded)
+
+
+def load_directory(
+    path: str,
+    password: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    executor: Optional[Executor] = None,
+) -> Iterator[UserPEMs]:
+    """Parse every user's key, CSR and cert in a credentials directory
+
+    Users are parsed in parallel and yielded as they complete, so callers can
+    start on the first users while the rest of the directory is loading.
+
+    :param path: a directory holding <user>.key.pem, <user>.csr.pem and
+        <user>.crt.pem files, as written by the CSR workflow
+    :param password: an optional password to decrypt the keys
+    :param max_workers: the number of parsing threads. Ignored if executor is given.
+    :param executor: an optional concurrent.futures.Executor to parse on
+    :returns: an iterator of UserPEMs. Fields without a file are None.
+    """
+    with ExecutorScope(executor, max_workers) as scope:
+        for user_name, paths in group_user_files(path).items():
+            scope.submit(load_user_files, user_name, paths, password)
+        for future in as_completed(scope.futures):
+            yield future.result()
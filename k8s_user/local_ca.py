@@ -0,0 +1,174 @@
+from typing import Optional, Iterable, Iterator, Tuple, Any
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from cryptography.x509.oid import ExtendedKeyUsageOID
+from .executors import ExecutorScope
+from .pki import Cert, CSR, Key
+from .verify import public_key_bytes
+
+
+# allow for clock skew between this machine and the cluster
+NOT_VALID_BEFORE_SKEW = timedelta(minutes=5)
+
+
+def issue_client_cert(ca_crt: Any, ca_key: Any, csr: Any, days: int = 365) -> Any:
+    """Issue a client auth certificate for an x509 CSR
+
+    :param ca_crt: the x509 CA certificate
+    :param ca_key: the CA key object
+    :param csr: the x509 CSR to issue a certificate for
+    :param days: how many days the certificate is valid for
+    :returns: an x509 certificate
+    """
+    now = datetime.now(timezone.utc)
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(csr.subject)
+        .issuer_name(ca_crt.subject)
+        .public_key(csr.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - NOT_VALID_BEFORE_SKEW)
+        .not_valid_after(now + timedelta(days=days))
+        .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True)
+        .add_extension(
+            x509.KeyUsage(
+                digital_signature=True,
+                key_encipherment=isinstance(csr.public_key(), rsa.RSAPublicKey),
+                content_commitment=False,
+                data_encipherment=False,
+                key_agreement=False,
+                key_cert_sign=False,
+                crl_sign=False,
+                encipher_only=False,
+                decipher_only=False,
+            ),
+            critical=True,
+        )
+        .add_extension(
+            x509.ExtendedKeyUsage([ExtendedKeyUsageOID.CLIENT_AUTH]), critical=False
+        )
+        .add_extension(
+            x509.AuthorityKeyIdentifier.from_issuer_public_key(ca_key.public_key()),
+            critical=False,
+        )
+    )
+    try:
+        san = csr.extensions.get_extension_for_class(x509.SubjectAlternativeName)
+    except x509.ExtensionNotFound:
+        san = None
+    if san and len(san.value):
+        builder = builder.add_extension(san.value, critical=False)
+    signing_hash = (
+        None if isinstance(ca_key, ed25519.Ed25519PrivateKey) else hashes.SHA256()
+    )
+    return builder.sign(ca_key, signing_hash, default_backend())
+
+
+class LocalCA:
+    """Issue user certs directly from a cluster CA cert and key held locally.
+
+    This is meant for dev and CI clusters (kind, k3d, ...) where the CA key
+    is available, and replaces the create/approve/get_cert round trips of
+    the CertificateSigningRequest API.
+
+    :param ca_cert: the CA Cert. Alternatively use ca_cert_file.
+    :param ca_key: the CA Key. Alternatively use ca_key_file.
+    :param ca_cert_file: a filesystem path to the PEM CA cert
+    :param ca_key_file: a filesystem path to the PEM CA key
+    :param ca_key_password: an optional password to decrypt ca_key_file
+    :param days: how many days issued certificates are valid for
+    """
+
+    def __init__(
+        self,
+        ca_cert: Optional[Cert] = None,
+        ca_key: Optional[Key] = None,
+        ca_cert_file: Optional[str] = None,
+        ca_key_file: Optional[str] = None,
+        ca_key_password: Optional[str] = None,
+        days: int = 365,
+    ):
+        self.ca_cert = ca_cert if ca_cert else Cert(crt_file=ca_cert_file)
+        if not self.ca_cert.crt:
+            raise ValueError("Must supply ca_cert or ca_cert_file")
+        if not (ca_key or ca_key_file):
+            # Key() would generate a new key, which did not sign ca_cert
+            raise ValueError("Must supply ca_key or ca_key_file")
+        self.ca_key = (
+            ca_key
+            if ca_key
+            else Key(key_file=ca_key_file, key_file_password=ca_key_password)
+        )
+        if public_key_bytes(self.ca_key.key.public_key()) != public_key_bytes(
+            self.ca_cert.crt.public_key()
+        ):
+            raise ValueError("ca_key does not belong to ca_cert")
+        self.days = days
+
+    def sign(self, csr: CSR) -> Cert:
+        """Issue a Cert for a CSR"""
+        crt = issue_client_cert(
+            self.ca_cert.crt, self.ca_key.key, csr.csr, days=self.days
+        )
+        return Cert(crt_data=crt.public_bytes(serialization.Encoding.PEM))
+
+    def sign_many(
+        self,
+        csrs: Iterable[Tuple[str, bytes]],
+        max_workers: Optional[int] = None,
+        executor: Optional[Executor] = None,
+    ) -> Iterator[Tuple[str, bytes]]:
+        """Issue certs for many CSRs across a process pool
+
+        Results are yielded in completion order.
+
+        :param csrs: an iterable of (user name, CSR PEM bytes) pairs
+        :param max_workers: the number of worker processes. Defaults to the
+            number of CPUs. Ignored if executor is given.
+        :param executor: an optional concurrent.futures.Executor to sign on.
+            Its workers must be able to run _sign_csr_pem.
+        :returns: an iterator of (user name, cert PEM bytes) pairs
+        """
+        ca_cert_pem = self.ca_cert.pem
+        ca_key_pem = self.ca_key.pem
+        with ExecutorScope(executor, max_workers, ProcessPoolExecutor) as scope:
+            for name, csr_pem in csrs:
+                scope.submit(
+                    _sign_csr_pem,
+                    ca_cert_pem,
+                    ca_key_pem,
+                    name,
+                    csr_pem,
+                    self.days,
+                )
+            for future in as_completed(scope.futures):
+                yield future.result()
+
+
+# CA objects loaded once per worker process by _sign_csr_pem
+_worker_ca = {}
+
+
+def _sign_csr_pem(
+    ca_cert_pem: bytes, ca_key_pem: bytes, name: str, csr_pem: bytes, days: int
+) -> Tuple[str, bytes]:
+    """Issue a cert in a worker process for LocalCA.sign_many"""
+    cache_key = (ca_cert_pem, ca_key_pem)
+    ca = _worker_ca.get(cache_key)
+    if ca is None:
+        ca = (
+            x509.load_pem_x509_certificate(ca_cert_pem, default_backend()),
+            serialization.load_pem_private_key(
+                ca_key_pem, password=None, backend=default_backend()
+            ),
+        )
+        _worker_ca.clear()
+        _worker_ca[cache_key] = ca
+    ca_crt, ca_key = ca
+    csr = x509.load_pem_x509_csr(csr_pem, default_backend())
+    crt = issue_client_cert(ca_crt, ca_key, csr, days=days)
+    return name, crt.public_bytes(serialization.Encoding.PEM)
@@ -0,0 +1,218 @@
+from typing import Dict, Iterable, List
+import bisect
+import collections
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+StepTiming = collections.namedtuple(
+    "StepTiming", "name seconds api_calls poll_iterations error"
+)
+
+# histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+PROMETHEUS_PREFIX = "k8s_user_step"
+
+# the counters of the step running on the current thread, if any
+_local = threading.local()
+# serializes instrument_api_client, which batch workers call on a shared client
+_instrument_lock = threading.Lock()
+
+
+class StepTimer:
+    """Measure a workflow step: its monotonic wall time, and the API calls and
+    poll iterations made on this thread while it runs.
+
+    Use it as a context manager around the step. The StepTiming is on
+    .timing after the block exits, also if the step raised.
+
+    :param extra_seconds: time spent on the step outside of the block, e.g.
+        generating its key on another executor, added to the wall time
+    """
+
+    def __init__(self, name: str, extra_seconds: float = 0.0):
+        self.name = name
+        self.extra_seconds = extra_seconds
+        self.api_calls = 0
+        self.poll_iterations = 0
+        self.timing = None
+
+    def __enter__(self):
+        self._outer = getattr(_local, "timer", None)
+        _local.timer = self
+        self._start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.monotonic() - self._start + self.extra_seconds
+        _local.timer = self._outer
+        self.timing = StepTiming(
+            name=self.name,
+            seconds=seconds,
+            api_calls=self.api_calls,
+            poll_iterations=self.poll_iterations,
+            error=exc_type.__name__ if exc_type else None,
+        )
+
+
+def count_api_call():
+    """Count an API call against the step running on this thread"""
+    timer = getattr(_local, "timer", None)
+    if timer:
+        timer.api_calls += 1
+
+
+def count_poll_iteration():
+    """Count a poll iteration against the step running on this thread"""
+    timer = getattr(_local, "timer", None)
+    if timer:
+        timer.poll_iterations += 1
+
+
+def instrument_api_client(api_client):
+    """Count every request made through api_client with count_api_call
+
+    This wraps the client's call_api, which all the generated API methods go
+    through. Instrumenting a client twice has no further effect.
+    """
+    with _instrument_lock:
+        # compared with True, as any attribute of a mock api_client is truthy
+        if getattr(api_client, "_k8s_user_instrumented", False) is True:
+            return api_client
+        call_api = api_client.call_api
+
+        def counted_call_api(*args, **kwargs):
+            count_api_call()
+            return call_api(*args, **kwargs)
+
+        api_client.call_api = counted_call_api
+        api_client._k8s_user_instrumented = True
+    return api_client
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # the last count is for observations above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.api_calls = 0
+        self.poll_iterations = 0
+        self.errors = 0
+
+    def observe(self, timing: StepTiming):
+        self.counts[bisect.bisect_left(self.buckets, timing.seconds)] += 1
+        self.sum += timing.seconds
+        self.count += 1
+        self.api_calls += timing.api_calls
+        self.poll_iterations += timing.poll_iterations
+        self.errors += 1 if timing.error else 0
+
+    def cumulative_counts(self) -> List[int]:
+        counts = []
+        total = 0
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class StepHistograms:
+    """Step timings aggregated per step name across many users
+
+    Safe to update from several threads, e.g. from batch.create_users.
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, timing: StepTiming):
+        with self._lock:
+            if timing.name not in self._histograms:
+                self._histograms[timing.name] = _Histogram(self.buckets)
+            self._histograms[timing.name].observe(timing)
+
+    def observe_user(self, user):
+        """Add the step_timings of a user, e.g. after K8sUser.create"""
+        for timing in getattr(user, "step_timings", None) or []:
+            self.observe(timing)
+
+    def to_dict(self) -> Dict:
+        """Return the histograms as a JSON serializable dict keyed by step name"""
+        with self._lock:
+            return {
+                name: {
+                    "count": histogram.count,
+                    "sum_seconds": histogram.sum,
+                    "api_calls": histogram.api_calls,
+                    "poll_iterations": histogram.poll_iterations,
+                    "errors": histogram.errors,
+                    "buckets": {
+                        str(bound): count
+                        for bound, count in zip(
+                            list(self.buckets) + ["+Inf"],
+                            histogram.cumulative_counts(),
+                        )
+                    },
+                }
+                for name, histogram in sorted(self._histograms.items())
+            }
+
+    def to_prometheus(self) -> str:
+        """Return the histograms in the Prometheus text exposition format"""
+        step_dicts = self.to_dict()
+        lines = [
+            f"# HELP {PROMETHEUS_PREFIX}_duration_seconds Wall time of k8s_user workflow steps.",
+            f"# TYPE {PROMETHEUS_PREFIX}_duration_seconds histogram",
+        ]
+        for name, step in step_dicts.items():
+            for bound, count in step["buckets"].items():
+                lines.append(
+                    f'{PROMETHEUS_PREFIX}_duration_seconds_bucket{{step="{name}",le="{bound}"}} {count}'
+                )
+            lines.append(
+                f'{PROMETHEUS_PREFIX}_duration_seconds_sum{{step="{name}"}} {step["sum_seconds"]}'
+            )
+            lines.append(
+                f'{PROMETHEUS_PREFIX}_duration_seconds_count{{step="{name}"}} {step["count"]}'
+            )
+        for counter, help_text in [
+            ("api_calls", "Kubernetes API calls made by k8s_user workflow steps."),
+            ("poll_iterations", "Poll iterations of k8s_user workflow steps."),
+            ("errors", "k8s_user workflow steps that raised."),
+        ]:
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{counter}_total {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{counter}_total counter")
+            for name, step in step_dicts.items():
+                lines.append(
+                    f'{PROMETHEUS_PREFIX}_{counter}_total{{step="{name}"}} {step[counter]}'
+                )
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: str):
+        _write_atomic(path, json.dumps(self.to_dict(), indent=2, sort_keys=True) + "\n")
+
+    def write_prometheus_textfile(self, path: str):
+        """Write the histograms for the node_exporter textfile collector. The file
+        is replaced atomically, so the collector never reads a partial file."""
+        _write_atomic(path, self.to_prometheus())
+
+
+def _write_atomic(path: str, text: str):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".k8s_user_metrics")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
@@ -1,13 +1,16 @@
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Iterable, Iterator, Union
 from datetime import datetime, timezone
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+import abc
 import base64
 import collections
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
 from cryptography.x509.oid import NameOID
 from cryptography.hazmat.primitives import serialization
+from .executors import ExecutorScope
 
 
 NAME_ATTRIBUTE_MAPING = {
@@ -29,7 +32,113 @@ NAME_ATTRIBUTE_MAPING = {
 KeyBundle = collections.namedtuple("KeyBundle", "user_name user_key user_csr user_cert")
 
 
-class Key:
+KeyProfile = collections.namedtuple("KeyProfile", "name algorithm key_size")
+
+
+CSRandKeyPEM = collections.namedtuple("CSRandKeyPEM", "common_name key_pem csr_pem")
+
+
+# Ed25519 client certificates are only usable if the cluster's signer and
+# apiserver accept them; EC P-256/P-384 and RSA are accepted everywhere.
+KEY_PROFILES = {
+    profile.name: profile
+    for profile in [
+        KeyProfile(name="rsa-2048", algorithm="rsa", key_size=2048),
+        KeyProfile(name="rsa-3072", algorithm="rsa", key_size=3072),
+        KeyProfile(name="rsa-4096", algorithm="rsa", key_size=4096),
+        KeyProfile(name="ec-p256", algorithm="ec", key_size=256),
+        KeyProfile(name="ec-p384", algorithm="ec", key_size=384),
+        KeyProfile(name="ed25519", algorithm="ed25519", key_size=256),
+    ]
+}
+
+
+EC_CURVES = {
+    256: ec.SECP256R1,
+    384: ec.SECP384R1,
+}
+
+
+def get_key_profile(key_profile: Any) -> KeyProfile:
+    """Return a KeyProfile from a KeyProfile or the name of one in KEY_PROFILES"""
+    if isinstance(key_profile, KeyProfile):
+        return key_profile
+    try:
+        return KEY_PROFILES[key_profile]
+    except KeyError:
+        raise ValueError(f"Unknown key profile: {key_profile}") from None
+
+
+def generate_private_key(algorithm: str = "rsa", key_size: int = 4092) -> Any:
+    """Generate a new private key
+
+    :param algorithm: the key algorithm; one of "rsa", "ec" or "ed25519".
+    :param key_size: the size of the RSA key, or the size of the EC curve
+        (256 or 384). Ignored for ed25519. Defaults to 4092
+    :returns: a key object
+    """
+    if algorithm == "rsa":
+        return rsa.generate_private_key(
+            public_exponent=65537, key_size=key_size, backend=default_backend()
+        )
+    if algorithm == "ec":
+        try:
+            curve = EC_CURVES[key_size]
+        except KeyError:
+            raise ValueError(f"Unsupported EC key size: {key_size}") from None
+        return ec.generate_private_key(curve(), backend=default_backend())
+    if algorithm == "ed25519":
+        return ed25519.Ed25519PrivateKey.generate()
+    raise ValueError(f"Unsupported key algorithm: {algorithm}")
+
+
+class EncodingCacheMixin(abc.ABC):
+    """Cache the encoded forms of a wrapped key, CSR or cert object.
+
+    Subclasses implement serialize() and call clear_encodings() whenever the
+    wrapped object is generated or loaded.
+    """
+
+    @abc.abstractmethod
+    def serialize(self, encoding: Any) -> bytes:
+        return None
+
+    def clear_encodings(self):
+        """Drop the cached encodings of the wrapped object"""
+        self._encodings = {}
+
+    def _encoded(self, name: str, encode) -> Any:
+        encodings = self.__dict__.setdefault("_encodings", {})
+        if name not in encodings:
+            encodings[name] = encode()
+        return encodings[name]
+
+    @property
+    def pem(self) -> bytes:
+        """Return a PEM representation of the wrapped object."""
+        return self._encoded(
+            "pem", lambda: self.serialize(serialization.Encoding.PEM)
+        )
+
+    @property
+    def der(self) -> bytes:
+        """Return a DER representation of the wrapped object."""
+        return self._encoded(
+            "der", lambda: self.serialize(serialization.Encoding.DER)
+        )
+
+    @property
+    def base64_bytes(self) -> bytes:
+        """Return the base64-encoded PEM representation as bytes."""
+        return self._encoded("base64_bytes", lambda: base64.b64encode(self.pem))
+
+    @property
+    def base64(self) -> str:
+        """Return a base64-encoded representation of the wrapped object."""
+        return self._encoded("base64", lambda: self.base64_bytes.decode("utf-8"))
+
+
+class Key(EncodingCacheMixin):
     """A wrapper object to manage a Key
 
     This can be used to generate a Key or it can be used to load
@@ -42,6 +151,8 @@ class Key:
         key_data: Optional[bytes] = None,
         key_file: Optional[str] = None,
         key_file_password: Optional[str] = None,
+        key_pool: Optional[Any] = None,
+        key_profile: Optional[Any] = None,
     ):
         """
         :param key_size: the size of the RSA key generated. Defaults to 4092
@@ -51,12 +162,23 @@ class Key:
             a new key will not be generated.
         :param key_password: an optional encryption password for the key_file if the key_file
             attribute is provided.
+        :param key_pool: an optional keypool.KeyPool to take a pre-generated key from
+            instead of generating one inline.
+        :param key_profile: an optional KeyProfile, or the name of one in KEY_PROFILES,
+            selecting the algorithm and size of the generated key. Overrides key_size.
         """
         self.created = False
+        self.algorithm = "rsa"
         self.key_size = key_size
+        if key_profile:
+            key_profile = get_key_profile(key_profile)
+            self.algorithm = key_profile.algorithm
+            self.key_size = key_profile.key_size
+        self.key_profile = key_profile
         self.key_data = key_data
         self.key_file = key_file
         self.key_file_password = key_file_password
+        self.key_pool = key_pool
 
         if self.key_file or self.key_data:
             self.load()
@@ -70,6 +192,8 @@ class Key:
         :param key_data: a byte string of Key data in PEM format
         :returns: a key object
         """
+        if isinstance(password, str):
+            password = password.encode("utf-8")
         private_key = serialization.load_pem_private_key(
             key_data, password=password, backend=default_backend()
         )
@@ -97,34 +221,128 @@ class Key:
             )
         else:
             raise ValueError("Must supply key_data or key_file")
+        self.clear_encodings()
 
     def generate(self):
-        """Generate a Key based on this object's attributes"""
-        self.key = rsa.generate_private_key(
-            public_exponent=65537, key_size=self.key_size, backend=default_backend()
-        )
+        """Generate a Key based on this object's attributes
 
-    @property
-    def base64(self) -> str:
-        """Return a base64-encoded representation of this Key."""
-        return base64.b64encode(self.pem).decode("utf-8")
+        If a key_pool was given, the key is taken from the pool.
+        """
+        if self.key_pool:
+            self.key = self.key_pool.get(
+                algorithm=self.algorithm, key_size=self.key_size
+            )
+        else:
+            self.key = generate_private_key(
+                algorithm=self.algorithm, key_size=self.key_size
+            )
+        self.clear_encodings()
 
-    @property
-    def pem(self) -> str:
-        """Return a PEM representation of this Key."""
+    def serialize(self, encoding: Any) -> bytes:
+        """Return this Key serialized with the given encoding, unencrypted."""
         return self.key.private_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PrivateFormat.TraditionalOpenSSL,
+            encoding=encoding,
+            format=self.private_format,
             encryption_algorithm=serialization.NoEncryption(),
         )
 
+    def encrypted_pem(self, password: str) -> bytes:
+        """Return this Key as PKCS8 PEM, encrypted with password"""
+        return self.key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.BestAvailableEncryption(
+                password.encode("utf-8")
+            ),
+        )
+
+    @property
+    def private_format(self) -> Any:
+        """Return the serialization format used for this Key.
+
+        Ed25519 keys have no traditional OpenSSL format, so they use PKCS8.
+        """
+        if isinstance(self.key, ed25519.Ed25519PrivateKey):
+            return serialization.PrivateFormat.PKCS8
+        return serialization.PrivateFormat.TraditionalOpenSSL
+
     def save(self, path: str):
         """Save a PEM representation of this Key to the provided path"""
         with open(path, "wb") as f:
             f.write(self.pem)
 
 
-class CSR:
+class CSRTemplate:
+    """Subject attributes, SANs and signing hash shared by many CSRs
+
+    Everything but the common name and key is resolved once, so generating
+    a CSR from a template only has to add the CN and sign.
+    """
+
+    def __init__(
+        self,
+        additional_subject: Optional[Dict] = None,
+        dnsnames: Optional[List] = None,
+        groups: Optional[List] = None,
+        signing_hash_algo: Optional[Any] = None,
+    ):
+        """
+        :param additional_subject: a dictionary where the keys are the x509 subject
+            attributes from cryptography.x509.NameOID OR a short name abbreviation
+            for those attributes. See the NAME_ATTRIBUTE_MAPING above.
+        :param dnsnames: a list of Subject Alternative Name (SAN) DNS names, as
+            strings or x509.GeneralName objects.
+        :param groups: a list of Kubernetes groups, added to the subject as
+            Organization (O) attributes.
+        :param signing_hash_algo: a hash algorithm to sign the key with. Default is
+            hashes.SHA256. Ignored for Ed25519 keys, which do not take a hash.
+        """
+        self.signing_hash_algo = (
+            signing_hash_algo if signing_hash_algo else hashes.SHA256
+        )
+        self._signing_hash = self.signing_hash_algo()
+        self.attributes = [
+            x509.NameAttribute(NameOID.ORGANIZATION_NAME, group)
+            for group in (groups if groups else [])
+        ] + [
+            x509.NameAttribute(NAME_ATTRIBUTE_MAPING.get(a, a), v)
+            for a, v in (additional_subject if additional_subject else {}).items()
+        ]
+        self.subject_alternative_name = x509.SubjectAlternativeName(
+            [
+                x509.DNSName(name) if isinstance(name, str) else name
+                for name in (dnsnames if dnsnames else [])
+            ]
+        )
+
+    def attribute_list(self, common_name: Optional[str]) -> List:
+        """Return the subject attributes of a CSR for common_name"""
+        if not common_name:
+            return list(self.attributes)
+        return [x509.NameAttribute(NameOID.COMMON_NAME, common_name)] + self.attributes
+
+    def signing_hash(self, key: Any) -> Any:
+        """Return the hash instance used to sign a CSR with the given key object."""
+        if isinstance(key, ed25519.Ed25519PrivateKey):
+            return None
+        return self._signing_hash
+
+    def sign(self, key: Any, common_name: Optional[str]) -> Any:
+        """Build and sign a CSR for common_name
+
+        :param key: a key object
+        :param common_name: The Common Name (CN) for the certificate
+        :returns: a csr object
+        """
+        return (
+            x509.CertificateSigningRequestBuilder()
+            .subject_name(x509.Name(self.attribute_list(common_name)))
+            .add_extension(self.subject_alternative_name, critical=False)
+            .sign(key, self.signing_hash(key), default_backend())
+        )
+
+
+class CSR(EncodingCacheMixin):
     """A wrapper object to manage a CSR
 
     This can be used to generate a CSR or it can be used to load
@@ -134,16 +352,18 @@ class CSR:
     def __init__(
         self,
         key: Key,
-        common_name: str,
+        common_name: Optional[str],
         additional_subject: Optional[Dict] = None,
         dnsnames: Optional[Dict] = None,
         csr_data: Optional[bytes] = None,
         csr_file: Optional[str] = None,
         signing_hash_algo: Optional[Any] = None,
+        template: Optional[CSRTemplate] = None,
     ):
         """
         :param key: a pki.Key object to associate with this CSR.
-        :param common_name: The Common Name (CN) for the certificate
+        :param common_name: The Common Name (CN) for the certificate. May be None
+            when loading an existing CSR.
         :param additional_subject: a dictionary where the keys are the x509 subject
             attributes from cryptography.x509.NameOID OR a short name abbreviation
             for those attributes. See the NAME_ATTRIBUTE_MAPING above.
@@ -157,26 +377,27 @@ class CSR:
             If this is given, a CSR will not be generated, but the provided one will be
             used.
         :param signing_hash_algo: a hash algorithm to sign the key with. Default is
-            hashes.SHA256
+            hashes.SHA256. Ignored for Ed25519 keys, which do not take a hash.
+        :param template: an optional CSRTemplate holding the precompiled subject
+            attributes, SANs and signing hash. If given, additional_subject,
+            dnsnames and signing_hash_algo are ignored.
         """
         self.created = False
         self.key = key
+        self.common_name = common_name
         self.csr_data = csr_data
         self.csr_file = csr_file
-        self.signing_hash_algo = (
-            signing_hash_algo if signing_hash_algo else hashes.SHA256
+        self.template = (
+            template
+            if template
+            else CSRTemplate(
+                additional_subject=additional_subject,
+                dnsnames=dnsnames,
+                signing_hash_algo=signing_hash_algo,
+            )
         )
-
-        if not additional_subject:
-            additional_subject = {}
-        self.attribue_list = [x509.NameAttribute(NameOID.COMMON_NAME, common_name)] + [
-            x509.NameAttribute(NAME_ATTRIBUTE_MAPING.get(a, a), v)
-            for a, v in additional_subject.items()
-        ]
-
-        if not dnsnames:
-            dnsnames = {}
-        self.dnsnames = dnsnames
+        self.signing_hash_algo = self.template.signing_hash_algo
+        self.attribue_list = self.template.attribute_list(common_name)
 
         if self.csr_file or self.csr_data:
             self.load()
@@ -210,30 +431,26 @@ class CSR:
             self.csr = self.load_file(path=self.csr_file)
         else:
             raise ValueError("Must supply csr_data or csr_file")
+        self.clear_encodings()
 
     def generate(self):
         """Generate a CSR based on this object's attributes"""
-        self.csr = (
-            x509.CertificateSigningRequestBuilder()
-            .subject_name(x509.Name(self.attribue_list))
-            .add_extension(x509.SubjectAlternativeName(self.dnsnames), critical=False,)
-            .sign(self.key.key, self.signing_hash_algo(), default_backend())
-        )
+        self.csr = self.template.sign(self.key.key, self.common_name)
+        self.clear_encodings()
+
+    @property
+    def signing_hash(self) -> Any:
+        """Return the hash instance used to sign this CSR with its key."""
+        return self.template.signing_hash(self.key.key)
 
     @property
     def subject(self) -> str:
         """Return a subject string based on this object's attributes"""
         return self.csr.subject.rfc4514_string()
 
-    @property
-    def pem(self) -> str:
-        """Return a PEM representation of this CSR."""
-        return self.csr.public_bytes(serialization.Encoding.PEM)
-
-    @property
-    def base64(self) -> str:
-        """Return a base64-encoded representation of this CSR."""
-        return base64.b64encode(self.pem).decode("utf-8")
+    def serialize(self, encoding: Any) -> bytes:
+        """Return this CSR serialized with the given encoding."""
+        return self.csr.public_bytes(encoding)
 
     def save(self, path: str):
         """Save a PEM representation of this CSR to the provided path"""
@@ -241,7 +458,7 @@ class CSR:
             f.write(self.pem)
 
 
-class Cert:
+class Cert(EncodingCacheMixin):
     """A wrapper object to manage a Cert
 
     This can be used to load and act upon an existing Cert.
@@ -282,16 +499,11 @@ class Cert:
             self.crt = self.load_file(path=crt_file)
         else:
             self.crt = None
+        self.clear_encodings()
 
-    @property
-    def pem(self) -> str:
-        """Return a PEM representation of this Cert."""
-        return self.crt.public_bytes(serialization.Encoding.PEM)
-
-    @property
-    def base64(self) -> str:
-        """Return a base64-encoded representation of this Cert."""
-        return base64.b64encode(self.pem).decode("utf-8")
+    def serialize(self, encoding: Any) -> bytes:
+        """Return this Cert serialized with the given encoding."""
+        return self.crt.public_bytes(encoding)
 
     @property
     def subject(self) -> str:
@@ -320,6 +532,11 @@ class CSRandKey:
         key_file: Optional[str] = None,
         key_file_password: Optional[str] = None,
         csr_file: Optional[str] = None,
+        key_pool: Optional[Any] = None,
+        key_profile: Optional[Any] = None,
+        key_data: Optional[bytes] = None,
+        csr_data: Optional[bytes] = None,
+        template: Optional[CSRTemplate] = None,
     ):
         """
         :param common_name: The Common Name (CN) for the certificate
@@ -337,14 +554,100 @@ class CSRandKey:
             is specified, a key_file must be provided as well that matches this CSR.
             If this is given, a CSR will not be generated, but the provided one will be
             used.
+        :param key_pool: an optional keypool.KeyPool to take a pre-generated key from
+            instead of generating one inline.
+        :param key_profile: an optional KeyProfile, or the name of one in KEY_PROFILES,
+            selecting the algorithm and size of the generated key. Overrides key_size.
+        :param key_data: an optional bytestring of an existing PEM key. Use this
+            instead of key_file when the key is already in memory.
+        :param csr_data: an optional bytestring of an existing PEM CSR. If this is
+            specified, key_data or key_file must be provided as well.
+        :param template: an optional CSRTemplate for the generated CSR. If given,
+            additional_subject and dnsnames are ignored.
         """
         self.key = Key(
-            key_size=key_size, key_file=key_file, key_file_password=key_file_password,
+            key_size=key_size,
+            key_data=key_data,
+            key_file=key_file,
+            key_file_password=key_file_password,
+            key_pool=key_pool,
+            key_profile=key_profile,
         )
         self.csr = CSR(
             key=self.key,
             common_name=common_name,
             additional_subject=additional_subject,
             dnsnames=dnsnames,
+            csr_data=csr_data,
             csr_file=csr_file,
+            template=template,
+        )
+
+    @classmethod
+    def from_pem(cls, result: CSRandKeyPEM) -> "CSRandKey":
+        """Build a CSRandKey from a CSRandKeyPEM returned by generate_many"""
+        return cls(
+            common_name=result.common_name,
+            key_data=result.key_pem,
+            csr_data=result.csr_pem,
         )
+
+    @classmethod
+    def generate_many(
+        cls,
+        entries: Iterable[Union[str, Dict]],
+        key_size: Optional[int] = 4092,
+        key_profile: Optional[Any] = None,
+        max_workers: Optional[int] = None,
+        executor: Optional[Executor] = None,
+    ) -> Iterator[CSRandKeyPEM]:
+        """Generate keys and CSRs for many users across a process pool.
+
+        Results are yielded in completion order, so callers can start using
+        the first CSRs while the rest are still being generated.
+
+        :param entries: an iterable of common names, or of dicts with a
+            "common_name" key and optional "additional_subject" and "dnsnames"
+            keys, as accepted by CSRandKey.
+        :param key_size: the size of the RSA keys generated. Defaults to 4092
+        :param key_profile: an optional KeyProfile, or the name of one in
+            KEY_PROFILES. Overrides key_size.
+        :param max_workers: the number of worker processes. Defaults to the
+            number of CPUs. Ignored if executor is given.
+        :param executor: an optional concurrent.futures.Executor to generate on
+            instead of a private ProcessPoolExecutor.
+        :returns: an iterator of CSRandKeyPEM tuples holding PEM bytes. Use
+            CSRandKey.from_pem to turn one into a CSRandKey.
+        """
+        with ExecutorScope(executor, max_workers, ProcessPoolExecutor) as scope:
+            for entry in entries:
+                if isinstance(entry, str):
+                    entry = {"common_name": entry}
+                scope.submit(
+                    _generate_csr_and_key_pem,
+                    key_size=key_size,
+                    key_profile=key_profile,
+                    **entry,
+                )
+            for future in as_completed(scope.futures):
+                yield future.result()
+
+
+def _generate_csr_and_key_pem(
+    common_name: str,
+    additional_subject: Optional[Dict] = None,
+    dnsnames: Optional[Dict] = None,
+    key_size: Optional[int] = 4092,
+    key_profile: Optional[Any] = None,
+) -> CSRandKeyPEM:
+    """Generate a key and CSR in a worker process for CSRandKey.generate_many"""
+    candk = CSRandKey(
+        common_name=common_name,
+        additional_subject=additional_subject,
+        dnsnames=dnsnames,
+        key_size=key_size,
+        key_profile=key_profile,
+    )
+    return CSRandKeyPEM(
+        common_name=common_name, key_pem=candk.key.pem, csr_pem=candk.csr.pem
+    )
@@ -0,0 +1,180 @@
+from typing import Optional, Dict, List, Any
+from datetime import datetime
+import collections
+import sqlite3
+import threading
+import time
+from .cert_index import read_cert_fields
+from .pki import Cert, CSR, Key
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS credentials (
+    name TEXT NOT NULL,
+    cluster TEXT NOT NULL,
+    kind TEXT,
+    namespace TEXT,
+    key_pem BLOB,
+    key_encrypted INTEGER NOT NULL DEFAULT 0,
+    csr_pem BLOB,
+    cert_pem BLOB,
+    not_after INTEGER,
+    token TEXT,
+    kubeconfig_path TEXT,
+    context_name TEXT,
+    updated_at INTEGER NOT NULL,
+    PRIMARY KEY (name, cluster)
+);
+CREATE INDEX IF NOT EXISTS credentials_cluster ON credentials (cluster);
+CREATE INDEX IF NOT EXISTS credentials_not_after ON credentials (not_after);
+"""
+
+
+# the cluster name of credentials saved without one, as the CLI defaults to
+DEFAULT_CLUSTER = "default"
+
+
+StoredCredentials = collections.namedtuple(
+    "StoredCredentials",
+    "name cluster kind namespace key_pem key_encrypted csr_pem cert_pem "
+    "not_after token kubeconfig_path context_name updated_at",
+)
+
+
+class CredentialStore:
+    """A local SQLite store of user credentials.
+
+    Credentials are keyed by user name and cluster name, and indexed by
+    cluster and certificate expiry. A cluster name of None stands for
+    DEFAULT_CLUSTER. Keys are encrypted with key_password when one is given.
+
+    :param path: the filesystem path of the SQLite database. It is created
+        if it does not exist.
+    :param key_password: an optional password used to encrypt the stored keys
+    """
+
+    def __init__(self, path: str, key_password: Optional[str] = None):
+        self.path = path
+        self.key_password = key_password
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def put(self, name: str, cluster: Optional[str], **fields):
+        """Insert or update the given columns for a user on a cluster"""
+        cluster = cluster or DEFAULT_CLUSTER
+        fields["updated_at"] = int(time.time())
+        columns = ", ".join(["name", "cluster"] + list(fields))
+        placeholders = ", ".join("?" for _ in range(len(fields) + 2))
+        updates = ", ".join(f"{column} = excluded.{column}" for column in fields)
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"INSERT INTO credentials ({columns}) VALUES ({placeholders}) "
+                f"ON CONFLICT (name, cluster) DO UPDATE SET {updates}",
+                [name, cluster] + list(fields.values()),
+            )
+
+    def get(self, name: str, cluster: Optional[str]) -> Optional[StoredCredentials]:
+        """Return the stored credentials of a user on a cluster, or None"""
+        rows = self._select(
+            "WHERE name = ? AND cluster = ?", [name, cluster or DEFAULT_CLUSTER]
+        )
+        return rows[0] if rows else None
+
+    def find(
+        self,
+        name: Optional[str] = None,
+        cluster: Optional[str] = None,
+        kind: Optional[str] = None,
+        expires_before: Optional[datetime] = None,
+    ) -> List[StoredCredentials]:
+        """Return the stored credentials matching all of the given filters,
+        ordered by certificate expiry"""
+        clauses = []
+        params = []
+        for column, value in [("name", name), ("cluster", cluster), ("kind", kind)]:
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if expires_before is not None:
+            clauses.append("not_after <= ?")
+            params.append(int(expires_before.timestamp()))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._select(f"{where} ORDER BY not_after", params)
+
+    def save_key(self, name: str, cluster: Optional[str], key: Key):
+        """Store a user's Key, encrypted if the store has a key_password"""
+        key_pem = key.encrypted_pem(self.key_password) if self.key_password else key.pem
+        self.put(
+            name, cluster, key_pem=key_pem, key_encrypted=int(bool(self.key_password))
+        )
+
+    def load_key(self, name: str, cluster: Optional[str]) -> Optional[Key]:
+        """Return the stored Key of a user, or None"""
+        stored = self.get(name, cluster)
+        if not stored or not stored.key_pem:
+            return None
+        return Key(
+            key_data=stored.key_pem,
+            key_file_password=self.key_password if stored.key_encrypted else None,
+        )
+
+    def save_csr(self, name: str, cluster: Optional[str], csr: CSR):
+        """Store a user's CSR"""
+        self.put(name, cluster, kind="csr", csr_pem=csr.pem)
+
+    def save_cert(self, name: str, cluster: Optional[str], cert: Cert):
+        """Store a user's Cert and index its expiry"""
+        self.put(
+            name,
+            cluster,
+            kind="csr",
+            cert_pem=cert.pem,
+            not_after=read_cert_fields(cert.der)["not_after"],
+        )
+
+    def load_cert(self, name: str, cluster: Optional[str]) -> Optional[Cert]:
+        """Return the stored Cert of a user, or None"""
+        stored = self.get(name, cluster)
+        if not stored or not stored.cert_pem:
+            return None
+        return Cert(crt_data=stored.cert_pem)
+
+    def save_token(self, name: str, cluster: Optional[str], token: str, namespace: str):
+        """Store a service account user's token"""
+        self.put(name, cluster, kind="sa", token=token, namespace=namespace)
+
+    def save_kubeconfig(
+        self,
+        name: str,
+        cluster: Optional[str],
+        kubeconfig_path: str,
+        context_name: str,
+    ):
+        """Store where a user's kubeconfig was written"""
+        self.put(
+            name,
+            cluster,
+            kubeconfig_path=kubeconfig_path,
+            context_name=context_name,
+        )
+
+    def _select(self, clause: str, params: List[Any]) -> List[StoredCredentials]:
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {', '.join(StoredCredentials._fields)} "
+                f"FROM credentials {clause}",
+                params,
+            ).fetchall()
+        return [StoredCredentials(*row) for row in rows]
@@ -6,9 +6,11 @@ from abc import ABC, abstractmethod
 import yaml
 from .k8s.csr_resource import CSRResource
 from .k8s.kubeconfig import CSRKubeConfig, TokenKubeConfig
+from .metrics import instrument_api_client
 from .pki import Cert, CSRandKey, KeyBundle
-from .workflows.csr_workflow import UserCSRWorkflow
+from .workflows.csr_workflow import ParallelUserCSRWorkflow, UserCSRWorkflow
 from .workflows.sa_workflow import UserTokenWorkflow
+from .workflows.aio import AsyncUserCSRWorkflow, AsyncUserTokenWorkflow
 
 
 class K8sUser(ABC):
@@ -16,6 +18,8 @@ class K8sUser(ABC):
 
     def __init__(self, name: str):
         self.name = name
+        # a metrics.StepTiming per workflow step run by the last create
+        self.step_timings = []
 
     @abstractmethod
     def get_user_create_workflow_klass(self):
@@ -25,9 +29,22 @@ class K8sUser(ABC):
     def get_kubeconfig_klass(self):
         return None
 
+    def get_async_user_create_workflow_klass(self):
+        return None
+
     def additional_inputs(self, inputs: Dict) -> Dict:
         return inputs
 
+    def workflow_inputs(self, api_client, inputs: Dict) -> Dict:
+        return {
+            **dict(
+                api_client=api_client,
+                kubeconfig_klass=self.get_kubeconfig_klass(),
+                user=self,
+            ),
+            **self.additional_inputs(inputs),
+        }
+
     def create(self, api_client, inputs: Dict) -> None:
         user_create_workflow_klass = self.get_user_create_workflow_klass()
         if not user_create_workflow_klass:
@@ -35,18 +52,32 @@ class K8sUser(ABC):
                 "create method requires a get_user_create_workflow_klass"
             )
         self.api_client = api_client
+        self.step_timings = []
+        instrument_api_client(api_client)
 
         user_create_workflow_klass(
-            inputs={
-                **dict(
-                    api_client=api_client,
-                    kubeconfig_klass=self.get_kubeconfig_klass(),
-                    user=self,
-                ),
-                **self.additional_inputs(inputs),
-            },
+            inputs=self.workflow_inputs(api_client, inputs),
         ).start()
 
+    async def create_async(self, api_client, inputs: Dict) -> None:
+        """Create the user on the running event loop
+
+        Blocking steps run on the thread_executor input, and key generation on
+        the process_executor input. Both default to the loop's default executor.
+        """
+        user_create_workflow_klass = self.get_async_user_create_workflow_klass()
+        if not user_create_workflow_klass:
+            raise NotImplementedError(
+                "create_async method requires a get_async_user_create_workflow_klass"
+            )
+        self.api_client = api_client
+        self.step_timings = []
+        instrument_api_client(api_client)
+
+        await user_create_workflow_klass(
+            inputs=self.workflow_inputs(api_client, inputs),
+        ).start_async()
+
 
 class CSRK8sUser(K8sUser):
     def get_kubeconfig_klass(self):
@@ -55,6 +86,16 @@ class CSRK8sUser(K8sUser):
     def get_user_create_workflow_klass(self):
         return UserCSRWorkflow
 
+    def get_async_user_create_workflow_klass(self):
+        return AsyncUserCSRWorkflow
+
+
+class ParallelCSRK8sUser(CSRK8sUser):
+    """A CSRK8sUser whose independent workflow steps run concurrently"""
+
+    def get_user_create_workflow_klass(self):
+        return ParallelUserCSRWorkflow
+
 
 class TokenK8sUser(K8sUser):
     def get_kubeconfig_klass(self):
@@ -62,3 +103,6 @@ class TokenK8sUser(K8sUser):
 
     def get_user_create_workflow_klass(self):
         return UserTokenWorkflow
+
+    def get_async_user_create_workflow_klass(self):
+        return AsyncUserTokenWorkflow
@@ -0,0 +1,142 @@
+from typing import Optional, Dict, Iterator, List, Any
+import collections
+from concurrent.futures import Executor, as_completed
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from .executors import ExecutorScope
+from .loader import group_user_files, load_user_files
+from .pki import Cert, CSR, Key
+
+
+VerifyResult = collections.namedtuple("VerifyResult", "user_name ok errors")
+
+
+def public_key_bytes(public_key: Any) -> bytes:
+    """Return the DER SubjectPublicKeyInfo of a public key object"""
+    return public_key.public_bytes(
+        serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+
+
+def is_signed_by(crt: Any, issuer: Any) -> bool:
+    """Return if the x509 certificate crt was issued by the x509 certificate issuer"""
+    try:
+        if hasattr(crt, "verify_directly_issued_by"):
+            # cryptography 40+, which also handles RSA-PSS signatures
+            crt.verify_directly_issued_by(issuer)
+        else:
+            _verify_signature(crt, issuer)
+    except (ValueError, TypeError, InvalidSignature):
+        return False
+    return True
+
+
+def _verify_signature(crt: Any, issuer: Any):
+    """Check crt's signature with the issuer's public key on cryptography
+    releases without Certificate.verify_directly_issued_by"""
+    if crt.issuer != issuer.subject:
+        raise ValueError("issuer name does not match")
+    issuer_key = issuer.public_key()
+    if isinstance(issuer_key, rsa.RSAPublicKey):
+        issuer_key.verify(
+            crt.signature,
+            crt.tbs_certificate_bytes,
+            padding.PKCS1v15(),
+            crt.signature_hash_algorithm,
+        )
+    elif isinstance(issuer_key, ec.EllipticCurvePublicKey):
+        issuer_key.verify(
+            crt.signature,
+            crt.tbs_certificate_bytes,
+            ec.ECDSA(crt.signature_hash_algorithm),
+        )
+    elif isinstance(issuer_key, ed25519.Ed25519PublicKey):
+        issuer_key.verify(crt.signature, crt.tbs_certificate_bytes)
+    else:
+        raise TypeError("unsupported issuer key type")
+
+
+def verify_user(
+    user_name: str,
+    key: Optional[Key] = None,
+    csr: Optional[CSR] = None,
+    cert: Optional[Cert] = None,
+    ca_cert: Optional[Cert] = None,
+) -> VerifyResult:
+    """Check that a user's key, CSR and cert belong together
+
+    The CSR and cert must carry the key's public key, the CSR signature must
+    be valid, and the cert must be issued by ca_cert if one is given. Any of
+    key, csr and cert may be None, in which case the checks that need them
+    are skipped.
+    """
+    errors = []
+    key_public = public_key_bytes(key.key.public_key()) if key else None
+    if csr:
+        if not csr.csr.is_signature_valid:
+            errors.append("csr signature is not valid")
+        if key_public and public_key_bytes(csr.csr.public_key()) != key_public:
+            errors.append("csr public key does not match key")
+    if cert:
+        cert_public = public_key_bytes(cert.crt.public_key())
+        if key_public and cert_public != key_public:
+            errors.append("cert public key does not match key")
+        if csr and cert_public != public_key_bytes(csr.csr.public_key()):
+            errors.append("cert public key does not match csr")
+        if ca_cert and not is_signed_by(cert.crt, ca_cert.crt):
+            errors.append("cert is not issued by the cluster CA")
+    return VerifyResult(user_name=user_name, ok=not errors, errors=errors)
+
+
+def verify_user_files(
+    user_name: str,
+    paths: Dict[str, str],
+    ca_cert: Optional[Cert] = None,
+    password: Optional[str] = None,
+) -> VerifyResult:
+    """Load and verify one user's files
+
+    :param paths: a dict of loader.UserPEMs field to file path
+    :returns: a VerifyResult. Files that can not be parsed are reported as errors.
+    """
+    if not paths:
+        return VerifyResult(user_name=user_name, ok=False, errors=["no files found"])
+    try:
+        user = load_user_files(user_name, paths, password=password)
+    except (ValueError, TypeError) as exc:
+        return VerifyResult(user_name=user_name, ok=False, errors=[str(exc)])
+    return verify_user(
+        user.user_name, key=user.key, csr=user.csr, cert=user.cert, ca_cert=ca_cert
+    )
+
+
+def verify_directory(
+    creds_dir: str,
+    user_names: Optional[List[str]] = None,
+    ca_cert: Optional[Cert] = None,
+    password: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    executor: Optional[Executor] = None,
+) -> Iterator[VerifyResult]:
+    """Verify the users in a credentials directory in parallel
+
+    Results are yielded per user as they complete.
+
+    :param creds_dir: a directory holding <user>.key.pem, <user>.csr.pem and
+        <user>.crt.pem files
+    :param user_names: an optional list of users to verify. Defaults to every
+        user with files in creds_dir.
+    :param ca_cert: an optional cluster CA Cert the user certs must be issued by
+    :param password: an optional password to decrypt the keys
+    :param max_workers: the number of threads. Ignored if executor is given.
+    :param executor: an optional concurrent.futures.Executor to verify on
+    """
+    users = group_user_files(creds_dir)
+    if user_names is not None:
+        users = {name: users.get(name, {}) for name in user_names}
+    with ExecutorScope(executor, max_workers) as scope:
+        for user_name, paths in users.items():
+            scope.submit(verify_user_files, user_name, paths, ca_cert, password)
+        for future in as_completed(scope.futures):
+            yield future.result()
@@ -2,13 +2,28 @@ import sys
 import abc
 from typing import Dict
 import collections
+from concurrent.futures import FIRST_COMPLETED, wait
+from ..checkpoint import get_checkpoint
+from ..executors import ExecutorScope
+from ..metrics import StepTimer
 
 StepReturn = collections.namedtuple("StepReturn", "next_step message")
+# the outcome of creating one user. error is the exception it raised, or None.
+UserResult = collections.namedtuple("UserResult", "user_name error user")
 
 
 class BaseStep(abc.ABC):
 
     name = "base"
+    # the names of the steps that must have run before this one, used by
+    # GraphWorkflowBase. Linear workflows follow StepReturn.next_step instead.
+    depends_on = ()
+    # whether a resumed workflow skips this step if a previous run completed
+    # it. Steps whose results later steps use in memory must not be skipped.
+    skip_on_resume = False
+    # seconds spent on this step before run(), e.g. generating its key on
+    # another executor, which are added to its StepTiming
+    pre_run_seconds = 0.0
 
     def __init__(self, inputs: Dict):
         self.user = inputs.get("user")
@@ -20,7 +35,14 @@ class BaseStep(abc.ABC):
 
     def _run(self):
         print(f"Running: {self.name}", file=sys.stdout)
-        step_return = self.run()
+        timer = StepTimer(self.name, extra_seconds=self.pre_run_seconds)
+        try:
+            with timer:
+                step_return = self.run()
+        finally:
+            step_timings = getattr(self.user, "step_timings", None)
+            if isinstance(step_timings, list):
+                step_timings.append(timer.timing)
         print(f"  {step_return.message}", file=sys.stdout)
         return step_return
 
@@ -34,10 +56,18 @@ class EndStep(BaseStep):
 
 
 class WorkflowBase(abc.ABC):
+    """A workflow of steps, each naming the next one in its StepReturn.
 
-    step_instances = {}
+    If a checkpoint_dir input is given, the completed steps are saved to a
+    checkpoint.Checkpoint of the user, which the steps get as the checkpoint
+    input. A rerun then skips the completed steps marked skip_on_resume. The
+    checkpoint is removed when the workflow finishes.
+    """
 
     def __init__(self, inputs: Dict):
+        self.step_instances = {}
+        self.checkpoint = get_checkpoint(inputs)
+        inputs = {**inputs, "checkpoint": self.checkpoint}
         self.start_step = self.get_start_step().name
         for step_class in self.steps:
             self.step_instances[step_class.name] = step_class(inputs)
@@ -46,7 +76,87 @@ class WorkflowBase(abc.ABC):
     def get_start_step(self):
         return None
 
+    def resumed_step(self, step: BaseStep) -> bool:
+        """Return if step was completed by a previous run and can be skipped"""
+        if (
+            self.checkpoint
+            and step.skip_on_resume
+            and self.checkpoint.is_completed(step.name)
+        ):
+            print(f"Skipping: {step.name} (completed by a previous run)", file=sys.stdout)
+            return True
+        return False
+
+    def step_done(self, step: BaseStep, step_return: StepReturn):
+        if self.checkpoint:
+            self.checkpoint.step_done(step.name, step_return.next_step)
+
+    def finished(self):
+        if self.checkpoint:
+            self.checkpoint.clear()
+
     def start(self):
         step_return = StepReturn(self.start_step, "")
         while step_return.next_step:
-            step_return = self.step_instances[step_return.next_step]._run()
+            step = self.step_instances[step_return.next_step]
+            if self.resumed_step(step):
+                step_return = StepReturn(self.checkpoint.next_step(step.name), "")
+                continue
+            step_return = step._run()
+            self.step_done(step, step_return)
+        self.finished()
+
+
+class GraphWorkflowBase(WorkflowBase):
+    """A workflow that runs each step as soon as the steps in its depends_on
+    have run, so independent steps run concurrently. StepReturn.next_step is
+    ignored.
+    """
+
+    max_workers = 4
+
+    def __init__(self, inputs: Dict):
+        self.step_instances = {}
+        self.executor = inputs.get("step_executor")
+        self.checkpoint = get_checkpoint(inputs)
+        inputs = {**inputs, "checkpoint": self.checkpoint}
+        for step_class in self.steps:
+            self.step_instances[step_class.name] = step_class(inputs)
+        for step in self.step_instances.values():
+            unknown = set(step.depends_on) - set(self.step_instances)
+            if unknown:
+                raise ValueError(
+                    f"step {step.name} depends on unknown steps {sorted(unknown)}"
+                )
+
+    def get_start_step(self):
+        return None
+
+    def start(self):
+        done = set()
+        pending = dict(self.step_instances)
+        # steps that already started can not be cancelled. The scope waits for
+        # them, so no step is still changing the cluster once start() raises.
+        with ExecutorScope(self.executor, self.max_workers, wait=True) as scope:
+            running = scope.futures
+            while pending or running:
+                for name, step in list(pending.items()):
+                    if self.resumed_step(step):
+                        done.add(name)
+                        del pending[name]
+                    elif done.issuperset(step.depends_on):
+                        running[scope.submit(step._run)] = name
+                        del pending[name]
+                if not running and pending:
+                    raise ValueError(
+                        f"steps {sorted(pending)} have circular dependencies"
+                    )
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    step_return = future.result()
+                    name = running.pop(future)
+                    self.step_done(self.step_instances[name], step_return)
+                    done.add(name)
+        self.finished()
@@ -0,0 +1,170 @@
+"""asyncio execution of the user workflows
+
+The kubernetes client calls made by the steps block, so each step runs on a
+thread executor while the event loop interleaves many workflows. Key
+generation, which is CPU bound, runs on a process executor.
+"""
+from typing import Optional, Dict, Iterable, List, Tuple
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from ..executors import ExecutorScope
+from ..keypool import _generate_key_pem
+from ..metrics import StepHistograms
+from ..pki import get_key_profile
+from . import StepReturn, BaseStep, UserResult, WorkflowBase
+from .csr_workflow import GetCSRandKeyStep, UserCSRWorkflow
+from .sa_workflow import ResourceExistsStep, UserTokenWorkflow
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+
+
+class AsyncStepMixin:
+    """Adds run_async to a workflow step. By default the step's blocking run()
+    is offloaded to the thread_executor input."""
+
+    def __init__(self, inputs):
+        self.thread_executor = inputs.get("thread_executor")
+        self.process_executor = inputs.get("process_executor")
+        super().__init__(inputs)
+
+    async def run_async(self) -> StepReturn:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.thread_executor, self._run)
+
+
+class AsyncBaseStep(AsyncStepMixin, BaseStep):
+    """Base class for steps written for the async engine"""
+
+
+class _PregeneratedKey:
+    """A single key handed to pki.Key in place of a keypool.KeyPool"""
+
+    def __init__(self, algorithm: str, key_size: int, key_pem: bytes):
+        self.algorithm = algorithm
+        self.key_size = key_size
+        self.key_pem = key_pem
+
+    def get(self, algorithm: str = "rsa", key_size: int = 4092):
+        if (algorithm, key_size) != (self.algorithm, self.key_size):
+            raise ValueError(f"No pre-generated {algorithm} {key_size} key")
+        return serialization.load_pem_private_key(
+            self.key_pem, password=None, backend=default_backend()
+        )
+
+
+class AsyncGetCSRandKeyStep(AsyncStepMixin, GetCSRandKeyStep):
+    """GetCSRandKeyStep that generates a new key on the process_executor"""
+
+    async def run_async(self) -> StepReturn:
+        resumed = self.checkpoint and self.checkpoint.get("key_pem")
+        if not (self.in_key or self.key_pool or self.store or resumed):
+            if self.key_profile:
+                profile = get_key_profile(self.key_profile)
+                algorithm, key_size = profile.algorithm, profile.key_size
+            else:
+                algorithm, key_size = "rsa", 4092
+            loop = asyncio.get_running_loop()
+            start = time.monotonic()
+            key_pem = await loop.run_in_executor(
+                self.process_executor, _generate_key_pem, algorithm, key_size
+            )
+            # counted in this step's StepTiming
+            self.pre_run_seconds = time.monotonic() - start
+            self.key_pool = _PregeneratedKey(algorithm, key_size, key_pem)
+        return await super().run_async()
+
+
+class AsyncWorkflowBase(WorkflowBase):
+    """A workflow whose steps are awaited on an event loop.
+
+    Steps without run_async are offloaded to the thread_executor input.
+    """
+
+    def __init__(self, inputs: Dict):
+        self.thread_executor = inputs.get("thread_executor")
+        super().__init__(inputs)
+
+    async def start_async(self):
+        loop = asyncio.get_running_loop()
+        step_return = StepReturn(self.start_step, "")
+        while step_return.next_step:
+            step = self.step_instances[step_return.next_step]
+            if self.resumed_step(step):
+                step_return = StepReturn(self.checkpoint.next_step(step.name), "")
+                continue
+            if hasattr(step, "run_async"):
+                step_return = await step.run_async()
+            else:
+                step_return = await loop.run_in_executor(
+                    self.thread_executor, step._run
+                )
+            self.step_done(step, step_return)
+        self.finished()
+
+
+class AsyncUserCSRWorkflow(AsyncWorkflowBase):
+    steps = [
+        AsyncGetCSRandKeyStep if step is GetCSRandKeyStep else step
+        for step in UserCSRWorkflow.steps
+    ]
+
+    def get_start_step(self):
+        return AsyncGetCSRandKeyStep
+
+
+class AsyncUserTokenWorkflow(AsyncWorkflowBase):
+    steps = list(UserTokenWorkflow.steps)
+
+    def get_start_step(self):
+        return ResourceExistsStep
+
+
+async def create_users(
+    api_client,
+    users: Iterable[Tuple[object, Dict]],
+    max_concurrency: int = 10,
+    thread_executor: Optional[Executor] = None,
+    process_executor: Optional[Executor] = None,
+    histograms: Optional[StepHistograms] = None,
+) -> List[UserResult]:
+    """Create many users concurrently on the running event loop
+
+    :param api_client: the kubernetes ApiClient shared by all users
+    :param users: an iterable of (K8sUser, inputs) pairs
+    :param max_concurrency: the number of users created at once
+    :param thread_executor: an optional executor for the blocking steps.
+        Defaults to a thread pool of max_concurrency threads.
+    :param process_executor: an optional executor for key generation. Its
+        workers must be able to run keypool._generate_key_pem. Defaults to a
+        process pool with a worker per CPU, so key generation does not hold
+        the GIL needed by the threads making API calls.
+    :param histograms: optional metrics.StepHistograms to add the step timings
+        of every user to, including the users that failed
+    :returns: a UserResult per user, in the order given
+    """
+    thread_scope = ExecutorScope(thread_executor, max_concurrency)
+    # worker processes are only started once a key is generated
+    process_scope = ExecutorScope(process_executor, executor_class=ProcessPoolExecutor)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _create(user, inputs):
+        async with semaphore:
+            try:
+                await user.create_async(
+                    api_client,
+                    {
+                        **inputs,
+                        "thread_executor": thread_scope.executor,
+                        "process_executor": process_scope.executor,
+                    },
+                )
+            except Exception as exc:
+                return UserResult(user_name=user.name, error=exc, user=user)
+            finally:
+                if histograms is not None:
+                    histograms.observe_user(user)
+        return UserResult(user_name=user.name, error=None, user=user)
+
+    with thread_scope, process_scope:
+        return await asyncio.gather(*[_create(user, inputs) for user, inputs in users])
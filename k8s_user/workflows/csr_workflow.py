@@ -2,9 +2,12 @@ import os
 from typing import Dict
 import collections
 import base64
+from ..checkpoint import csr_fingerprint
 from ..pki import Cert, CSRandKey, KeyBundle
 from ..k8s.csr_resource import CSRResource
-from . import StepReturn, BaseStep, EndStep, WorkflowBase
+from ..k8s.labels import with_managed_by
+from ..verify import verify_user
+from . import StepReturn, BaseStep, EndStep, GraphWorkflowBase, WorkflowBase
 
 
 class GetCSRandKeyStep(BaseStep):
@@ -16,20 +19,82 @@ class GetCSRandKeyStep(BaseStep):
         self.in_key_password = inputs.get("in_key_password")
         self.in_csr = inputs.get("in_csr")
         self.metadata = inputs.get("metadata")
+        self.key_pool = inputs.get("key_pool")
+        self.key_profile = inputs.get("key_profile")
+        self.csr_template = inputs.get("csr_template")
+        self.poll_policy = inputs.get("poll_policy")
+        self.store = inputs.get("store")
+        self.cluster_name = inputs.get("cluster_name")
+        self.checkpoint = inputs.get("checkpoint")
         super().__init__(inputs)
 
     def run(self) -> StepReturn:
+        key_data = None
+        csr_data = None
+        key_password = self.in_key_password
+        stored = (
+            self.store.get(self.user.name, self.cluster_name)
+            if self.store and not self.in_key
+            else None
+        )
+        store_password = self.store.key_password if self.store else None
+        if self.checkpoint and self.checkpoint.get("key_pem") and not self.in_key:
+            # resume with the key and CSR of the interrupted run
+            key_data = self.checkpoint.get_bytes("key_pem")
+            key_password = None
+            if self.checkpoint.get("key_encrypted"):
+                if not store_password:
+                    raise ValueError(
+                        "The checkpointed key is encrypted; resume with the same "
+                        "store and key password"
+                    )
+                key_password = store_password
+            if not self.in_csr:
+                csr_data = self.checkpoint.get_bytes("csr_pem")
+        elif stored and stored.key_pem:
+            key_data = stored.key_pem
+            key_password = self.store.key_password if stored.key_encrypted else None
+            if not self.in_csr:
+                csr_data = stored.csr_pem
         self.user.candk = CSRandKey(
             common_name=self.user.name,
+            key_data=key_data,
             key_file=self.in_key,
-            key_file_password=self.in_key_password,
+            key_file_password=key_password,
+            csr_data=csr_data,
             csr_file=self.in_csr,
+            key_pool=self.key_pool,
+            key_profile=self.key_profile,
+            template=self.csr_template,
         )
+        if not self.user.candk.csr.created:
+            result = verify_user(
+                self.user.name, key=self.user.candk.key, csr=self.user.candk.csr
+            )
+            if not result.ok:
+                raise ValueError(
+                    f"csr does not belong to key: {'; '.join(result.errors)}"
+                )
         self.user.csr_resource = CSRResource(
             name=self.user.name,
             csr_str=self.user.candk.csr.base64,
-            metadata=self.metadata,
+            metadata=with_managed_by(self.metadata),
+            poll_policy=self.poll_policy,
         )
+        if self.checkpoint:
+            fields = dict(
+                csr_pem=self.user.candk.csr.pem,
+                csr_fingerprint=csr_fingerprint(self.user.candk.csr),
+                csr_resource=self.user.csr_resource.name,
+            )
+            # keys passed in with in_key are not copied to the checkpoint. With
+            # a store key password, the key is encrypted as it is in the store.
+            if self.user.candk.key.created and store_password:
+                fields["key_pem"] = self.user.candk.key.encrypted_pem(store_password)
+                fields["key_encrypted"] = True
+            elif self.user.candk.key.created:
+                fields["key_pem"] = self.user.candk.key.pem
+            self.checkpoint.update(**fields)
         return StepReturn(
             next_step="save_key",
             message=(
@@ -39,47 +104,80 @@ class GetCSRandKeyStep(BaseStep):
         )
 
 
+def _file_contains(path: str, data: bytes) -> bool:
+    with open(path, "rb") as f:
+        return f.read() == data
+
+
 class SaveKeyStep(BaseStep):
 
     name = "save_key"
+    skip_on_resume = True
 
     def __init__(self, inputs):
         self.in_key = inputs.get("in_key")
         self.creds_dir = inputs.get("creds_dir")
+        self.store = inputs.get("store")
+        self.cluster_name = inputs.get("cluster_name")
         super().__init__(inputs)
 
     def run(self) -> StepReturn:
-        saved = False
+        saved_to = []
         if self.creds_dir and not self.in_key:
             key_path = os.path.join(self.creds_dir, f"{self.user.name}.key.pem")
             if os.path.exists(key_path):
-                raise Exception(f"Key already exists at {key_path}")
-            self.user.candk.key.save(key_path)
-            saved = True
+                # a key loaded from the store was saved by the previous run
+                if self.user.candk.key.created or not _file_contains(
+                    key_path, self.user.candk.key.pem
+                ):
+                    raise Exception(f"Key already exists at {key_path}")
+            else:
+                self.user.candk.key.save(key_path)
+                saved_to.append(key_path)
+        if self.store and self.user.candk.key.created:
+            self.store.save_key(self.user.name, self.cluster_name, self.user.candk.key)
+            saved_to.append(self.store.path)
         return StepReturn(
             next_step="save_csr",
-            message=f"key saved to {key_path}" if saved else "skipped save",
+            message=f"key saved to {', '.join(saved_to)}" if saved_to else "skipped save",
         )
 
 
 class SaveCSRStep(BaseStep):
 
     name = "save_csr"
+    skip_on_resume = True
 
     def __init__(self, inputs):
         self.in_csr = inputs.get("in_csr")
         self.creds_dir = inputs.get("creds_dir")
+        self.local_ca = inputs.get("local_ca")
+        self.store = inputs.get("store")
+        self.cluster_name = inputs.get("cluster_name")
         super().__init__(inputs)
 
     def run(self) -> StepReturn:
-        saved = False
+        saved_to = []
         if self.creds_dir and not self.in_csr:
             csr_path = os.path.join(self.creds_dir, f"{self.user.name}.csr.pem")
             self.user.candk.csr.save(csr_path)
-            saved = True
+            saved_to.append(csr_path)
+        if self.store and self.user.candk.csr.created:
+            self.store.save_csr(self.user.name, self.cluster_name, self.user.candk.csr)
+            saved_to.append(self.store.path)
         return StepReturn(
-            next_step="csr_resource_exists",
-            message=f"csr saved to {csr_path}" if saved else "skipped save",
+            next_step="local_sign_cert" if self.local_ca else "csr_resource_exists",
+            message=f"csr saved to {', '.join(saved_to)}" if saved_to else "skipped save",
+        )
+
+
+def check_resumed_csr(csr_resource: CSRResource, api_client):
+    """Raise a ValueError if the existing CSR resource was not created from
+    the CSR of the resumed workflow, so its cert would not match the key"""
+    if not csr_resource.request_matches(api_client):
+        raise ValueError(
+            f"csr resource {csr_resource.name} exists, but does not match the "
+            "csr of this user. Delete it, or the checkpoint, and run again."
         )
 
 
@@ -87,8 +185,14 @@ class ResourceExistsStep(BaseStep):
 
     name = "csr_resource_exists"
 
+    def __init__(self, inputs):
+        self.checkpoint = inputs.get("checkpoint")
+        super().__init__(inputs)
+
     def run(self) -> StepReturn:
         exists = self.user.csr_resource.resource_exists(self.api_client)
+        if exists and self.checkpoint:
+            check_resumed_csr(self.user.csr_resource, self.api_client)
         if exists:
             return StepReturn(
                 next_step="csr_approve_resource", message="csr resource exists"
@@ -122,29 +226,61 @@ class GetCertStep(BaseStep):
 
     name = "get_cert"
 
+    def __init__(self, inputs):
+        self.checkpoint = inputs.get("checkpoint")
+        super().__init__(inputs)
+
     def run(self) -> StepReturn:
+        if self.checkpoint and self.checkpoint.get("cert_pem"):
+            self.user.crt = Cert(crt_data=self.checkpoint.get_bytes("cert_pem"))
+            return StepReturn(next_step="save_cert", message="crt loaded from checkpoint")
         cert_str = self.user.csr_resource.get_cert(self.api_client)
+        if not cert_str:
+            raise ValueError(
+                f"Timed out waiting for the cert of CSR {self.user.csr_resource.name}"
+            )
         self.user.crt = Cert(crt_data=base64.b64decode(cert_str))
+        if self.checkpoint:
+            self.checkpoint.update(cert_pem=self.user.crt.pem)
         return StepReturn(next_step="save_cert", message="crt retrieved from k8s")
 
 
+class LocalSignCertStep(BaseStep):
+
+    name = "local_sign_cert"
+
+    def __init__(self, inputs):
+        self.local_ca = inputs.get("local_ca")
+        super().__init__(inputs)
+
+    def run(self) -> StepReturn:
+        self.user.crt = self.local_ca.sign(self.user.candk.csr)
+        return StepReturn(next_step="save_cert", message="crt signed by local CA")
+
+
 class SaveCertStep(BaseStep):
 
     name = "save_cert"
+    skip_on_resume = True
 
     def __init__(self, inputs):
         self.creds_dir = inputs.get("creds_dir")
+        self.store = inputs.get("store")
+        self.cluster_name = inputs.get("cluster_name")
         super().__init__(inputs)
 
     def run(self) -> StepReturn:
-        saved = False
+        saved_to = []
         if self.creds_dir:
             crt_path = os.path.join(self.creds_dir, f"{self.user.name}.crt.pem")
             self.user.crt.save(crt_path)
-            saved = True
+            saved_to.append(crt_path)
+        if self.store:
+            self.store.save_cert(self.user.name, self.cluster_name, self.user.crt)
+            saved_to.append(self.store.path)
         return StepReturn(
             next_step="make_kubeconfig",
-            message=f"crt saved to {crt_path}" if saved else "skipped save",
+            message=f"crt saved to {', '.join(saved_to)}" if saved_to else "skipped save",
         )
 
 
@@ -162,7 +298,7 @@ class MakeKubeConfigStep(BaseStep):
         keybundle = KeyBundle(
             user_name=self.user.name,
             user_key=self.user.candk.key.base64,
-            user_csr=self.user.candk.key.base64,
+            user_csr=self.user.candk.csr.base64,
             user_cert=self.user.crt.base64,
         )
         self.user.kubeconfig = self.kubeconfig_klass(
@@ -179,10 +315,20 @@ class SaveKubeconfigStep(BaseStep):
 
     def __init__(self, inputs):
         self.out_kubeconfig = inputs.get("out_kubeconfig")
+        self.store = inputs.get("store")
+        self.cluster_name = inputs.get("cluster_name")
+        self.context_name = inputs.get("context_name")
         super().__init__(inputs)
 
     def run(self) -> StepReturn:
         self.user.kubeconfig.save(self.out_kubeconfig)
+        if self.store:
+            self.store.save_kubeconfig(
+                self.user.name,
+                self.cluster_name,
+                self.out_kubeconfig,
+                self.context_name,
+            )
         return StepReturn(
             next_step="end", message=f"kubeconfig saved to {self.out_kubeconfig}"
         )
@@ -197,6 +343,7 @@ class UserCSRWorkflow(WorkflowBase):
         CreateResourceStep,
         ApproveResourceStep,
         GetCertStep,
+        LocalSignCertStep,
         SaveCertStep,
         MakeKubeConfigStep,
         SaveKubeconfigStep,
@@ -205,3 +352,113 @@ class UserCSRWorkflow(WorkflowBase):
 
     def get_start_step(self):
         return GetCSRandKeyStep
+
+
+class LookupResourceStep(BaseStep):
+
+    name = "csr_lookup_resource"
+
+    def __init__(self, inputs):
+        self.local_ca = inputs.get("local_ca")
+        self.poll_policy = inputs.get("poll_policy")
+        super().__init__(inputs)
+
+    def run(self) -> StepReturn:
+        if self.local_ca:
+            self.user.csr_lookup = None
+            return StepReturn(next_step=None, message="skipped lookup")
+        # only the name is needed to look the CSR up, so this does not wait
+        # for the key and CSR to be generated
+        self.user.csr_lookup = CSRResource(
+            name=self.user.name, csr_str=None, poll_policy=self.poll_policy,
+        ).get_resource(self.api_client)
+        return StepReturn(
+            next_step=None,
+            message=(
+                "csr resource exists"
+                if self.user.csr_lookup
+                else "csr resource does not exist yet."
+            ),
+        )
+
+
+class SignCertStep(BaseStep):
+
+    name = "sign_cert"
+    # the key is saved first, so a failed save (e.g. the key file exists
+    # already) stops the workflow before the cluster CSR is created
+    depends_on = ("get_csr_and_key", "csr_lookup_resource", "save_key")
+
+    def __init__(self, inputs):
+        self.local_ca = inputs.get("local_ca")
+        self.checkpoint = inputs.get("checkpoint")
+        super().__init__(inputs)
+
+    def run(self) -> StepReturn:
+        if self.local_ca:
+            self.user.crt = self.local_ca.sign(self.user.candk.csr)
+            return StepReturn(next_step=None, message="crt signed by local CA")
+        if self.checkpoint and self.checkpoint.get("cert_pem"):
+            self.user.crt = Cert(crt_data=self.checkpoint.get_bytes("cert_pem"))
+            return StepReturn(next_step=None, message="crt loaded from checkpoint")
+        csr_resource = self.user.csr_resource
+        csr_resource.prime(self.user.csr_lookup)
+        created = not csr_resource.resource_exists(self.api_client)
+        if created:
+            csr_resource.create(self.api_client)
+        elif self.checkpoint:
+            check_resumed_csr(csr_resource, self.api_client)
+        csr_resource.approve(self.api_client)
+        cert_str = csr_resource.get_cert(self.api_client)
+        if not cert_str:
+            raise ValueError(f"Timed out waiting for the cert of CSR {csr_resource.name}")
+        self.user.crt = Cert(crt_data=base64.b64decode(cert_str))
+        if self.checkpoint:
+            self.checkpoint.update(cert_pem=self.user.crt.pem)
+        return StepReturn(
+            next_step=None,
+            message=(
+                f"csr resource {'created' if created else 'reused'} and approved; "
+                "crt retrieved from k8s"
+            ),
+        )
+
+
+class ParallelSaveKeyStep(SaveKeyStep):
+    depends_on = ("get_csr_and_key",)
+
+
+class ParallelSaveCSRStep(SaveCSRStep):
+    depends_on = ("get_csr_and_key",)
+
+
+class ParallelSaveCertStep(SaveCertStep):
+    depends_on = ("sign_cert",)
+
+
+class ParallelMakeKubeConfigStep(MakeKubeConfigStep):
+    depends_on = ("sign_cert",)
+
+
+class ParallelSaveKubeconfigStep(SaveKubeconfigStep):
+    depends_on = ("make_kubeconfig",)
+
+
+class ParallelUserCSRWorkflow(GraphWorkflowBase):
+    """UserCSRWorkflow with independent steps run concurrently
+
+    The CSR resource is looked up while the key is generated, and the CSR is
+    saved while the CSR resource is created, approved and signed. The key is
+    saved before the CSR resource is created.
+    """
+
+    steps = [
+        GetCSRandKeyStep,
+        LookupResourceStep,
+        ParallelSaveKeyStep,
+        ParallelSaveCSRStep,
+        SignCertStep,
+        ParallelSaveCertStep,
+        ParallelMakeKubeConfigStep,
+        ParallelSaveKubeconfigStep,
+    ]
@@ -1,5 +1,6 @@
 import collections
 from . import StepReturn, BaseStep, EndStep, WorkflowBase
+from ..k8s.labels import with_managed_by
 from ..k8s.sa_resource import SAResource
 
 
@@ -11,16 +12,23 @@ class ResourceExistsStep(BaseStep):
     name = "sa_resource_exists"
 
     def __init__(self, inputs):
-        self.name = inputs.get("name")
         self.namespace = inputs.get("namespace")
         self.metadata = inputs.get("metadata")
+        self.poll_policy = inputs.get("poll_policy")
+        self.service_accounts = inputs.get("service_accounts")
         super().__init__(inputs)
 
     def run(self) -> StepReturn:
 
         self.user.sa_resource = SAResource(
-            name=self.user.name, namespace=self.namespace, metadata=self.metadata,
+            name=self.user.name,
+            namespace=self.namespace,
+            metadata=with_managed_by(self.metadata),
+            poll_policy=self.poll_policy,
         )
+        if self.service_accounts is not None:
+            # the ServiceAccounts of the namespace were listed up front
+            self.user.sa_resource.prime(self.service_accounts.get(self.user.name))
         exists = self.user.sa_resource.resource_exists(self.api_client)
         return StepReturn(
             next_step="sa_get_or_create_resource",
@@ -41,9 +49,29 @@ class GetTokenStep(BaseStep):
 
     name = "get_token"
 
+    def __init__(self, inputs):
+        self.namespace = inputs.get("namespace")
+        self.store = inputs.get("store")
+        self.cluster_name = inputs.get("cluster_name")
+        self.token_request = inputs.get("token_request", True)
+        self.token_audiences = inputs.get("token_audiences")
+        self.token_expiration_seconds = inputs.get("token_expiration_seconds")
+        super().__init__(inputs)
+
     def run(self) -> StepReturn:
-        token_str = self.user.sa_resource.get_token(self.api_client)
+        token_str = self.user.sa_resource.get_token(
+            self.api_client,
+            token_request=self.token_request,
+            audiences=self.token_audiences,
+            expiration_seconds=self.token_expiration_seconds,
+        )
+        if not token_str:
+            raise ValueError(f"No token available for ServiceAccount {self.user.name}")
         self.user.token = token_str
+        if self.store:
+            self.store.save_token(
+                self.user.name, self.cluster_name, token_str, self.namespace
+            )
         return StepReturn(next_step="make_kubeconfig", message="token generated")
 
 
@@ -74,10 +102,20 @@ class SaveKubeconfigStep(BaseStep):
 
     def __init__(self, inputs):
         self.out_kubeconfig = inputs.get("out_kubeconfig")
+        self.store = inputs.get("store")
+        self.cluster_name = inputs.get("cluster_name")
+        self.context_name = inputs.get("context_name")
         super().__init__(inputs)
 
     def run(self) -> StepReturn:
         self.user.kubeconfig.save(self.out_kubeconfig)
+        if self.store:
+            self.store.save_kubeconfig(
+                self.user.name,
+                self.cluster_name,
+                self.out_kubeconfig,
+                self.context_name,
+            )
         return StepReturn(
             next_step="end", message=f"kubeconfig saved to {self.out_kubeconfig}"
         )
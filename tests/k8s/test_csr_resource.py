@@ -1,11 +1,14 @@
 import os
+import threading
 from unittest import mock
 import json
 import pytest
 import kubernetes
 from kubernetes.client.rest import ApiException
 from k8s_user.pki import CSRandKey, CSR, Key
-from k8s_user.k8s.csr_resource import CSRResource
+from k8s_user.k8s.polling import PollPolicy
+from k8s_user.k8s.csr_resource import ApproveResult, CSRResource, approve_many
+from k8s_user.k8s.informer import CSR_KIND, get_informer, stop_informers
 
 
 FIXTURE_DIR = os.path.join(
@@ -149,25 +152,287 @@ def test__csrresource__approve(mock_CertificatesV1beta1Api):
         mock_approve_csr.assert_called_once()
         assert csrr._resource_cache == mock_response
 
-# def test__csrresource__get_cert():
+def _csr_object(certificate=None, resource_version="100"):
+    return kubernetes.client.V1beta1CertificateSigningRequest(
+        metadata=kubernetes.client.V1ObjectMeta(
+            name="joe", resource_version=resource_version),
+        status=kubernetes.client.V1beta1CertificateSigningRequestStatus(
+            certificate=certificate),
+    )
+
+
+def test__csrresource__get_cert__already_issued():
+    csrr = CSRResource(name="joe", csr_str="<csr>")
+    with mock.patch.object(csrr, 'get_resource') as mock__get_resource, \
+            mock.patch('k8s_user.k8s.csr_resource.kubernetes.watch.Watch') as mock_Watch:
+        mock__get_resource.return_value = _csr_object(certificate="Zm9vX2NlcnQ=")
+        assert csrr.get_cert(mock.Mock()) == "Zm9vX2NlcnQ="
+        mock_Watch.assert_not_called()
+
+
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.watch.Watch')
+def test__csrresource__get_cert__watch(mock_Watch, mock_CertificatesV1beta1Api):
+    issued = _csr_object(certificate="Zm9vX2NlcnQ=", resource_version="102")
+    mock_Watch.return_value.stream.return_value = iter([
+        {"type": "MODIFIED", "object": _csr_object(resource_version="101")},
+        {"type": "MODIFIED", "object": issued},
+    ])
+    csrr = CSRResource(name="joe", csr_str="<csr>")
+    with mock.patch.object(csrr, 'get_resource') as mock__get_resource:
+        mock__get_resource.return_value = _csr_object()
+        assert csrr.get_cert(mock.Mock()) == "Zm9vX2NlcnQ="
+        # one read for the resourceVersion, then only the watch
+        mock__get_resource.assert_called_once()
+
+    stream_args, stream_kwargs = mock_Watch.return_value.stream.call_args
+    assert stream_args == (
+        mock_CertificatesV1beta1Api.return_value.list_certificate_signing_request,)
+    assert stream_kwargs["field_selector"] == "metadata.name=joe"
+    assert stream_kwargs["resource_version"] == "100"
+    mock_Watch.return_value.stop.assert_called_once()
+    assert csrr._resource_cache == issued
+
+
+@pytest.mark.parametrize("watch_effect", [
+    pytest.param(ApiException(status=410), id="watch-error"),
+    pytest.param(lambda *args, **kwargs: iter([]), id="watch-ended"),
+])
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.watch.Watch')
+def test__csrresource__get_cert__polling_fallback(
+        mock_Watch, mock_CertificatesV1beta1Api, watch_effect):
+    mock_Watch.return_value.stream.side_effect = watch_effect
+    csrr = CSRResource(
+        name="joe", csr_str="<csr>", poll_policy=PollPolicy(initial_delay=0.01))
+    with mock.patch.object(csrr, 'get_resource') as mock__get_resource:
+        mock__get_resource.side_effect = [
+            _csr_object(), _csr_object(), _csr_object(certificate="Zm9vX2NlcnQ=")]
+        assert csrr.get_cert(mock.Mock()) == "Zm9vX2NlcnQ="
+        assert mock__get_resource.call_count == 3
+
+
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.watch.Watch')
+def test__csrresource__get_cert__timeout(mock_Watch, mock_CertificatesV1beta1Api):
+    mock_Watch.return_value.stream.return_value = iter([])
+    csrr = CSRResource(
+        name="joe", csr_str="<csr>", poll_policy=PollPolicy(initial_delay=0.01))
+    with mock.patch.object(csrr, 'get_resource') as mock__get_resource:
+        mock__get_resource.return_value = _csr_object()
+        assert csrr.get_cert(mock.Mock(), timeout=0.05) is None
+        # the watch is skipped when there is less than a second left
+        mock_Watch.return_value.stream.assert_not_called()
+
+
+def _listed_csr(name, conditions=None):
+    csr = _csr_object()
+    csr.metadata.name = name
+    csr.status.conditions = conditions
+    return csr
+
+
+def _csr_list(*csrs):
+    return kubernetes.client.V1beta1CertificateSigningRequestList(
+        items=list(csrs), metadata=kubernetes.client.V1ListMeta(resource_version="1"))
+
+
+@pytest.fixture
+def informer_api_client():
+    """An api_client whose CSR informer watch blocks until the test ends"""
+    api_client = mock.Mock(spec=kubernetes.client.ApiClient)
+    done = threading.Event()
+    with mock.patch('k8s_user.k8s.informer.kubernetes.watch.Watch') as mock_Watch:
+        mock_Watch.return_value.stream.side_effect = lambda *a, **kw: iter(
+            [] if done.wait(5) else [])
+        yield api_client
+        stop_informers(api_client)
+        done.set()
+
+
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+def test__approve_many__label_selector(mock_CertificatesV1beta1Api):
+    approved = kubernetes.client.V1beta1CertificateSigningRequestCondition(type="Approved")
+    mock_api = mock_CertificatesV1beta1Api.return_value
+    mock_api.list_certificate_signing_request.return_value = _csr_list(
+        _listed_csr("joe"), _listed_csr("jane"), _listed_csr("jim", [approved]))
+
+    results = list(approve_many(mock.Mock(), label_selector="team=a", max_workers=2))
+
+    mock_api.list_certificate_signing_request.assert_called_once_with(label_selector="team=a")
+    assert sorted(results) == [
+        ApproveResult(name="jane", approved=True, error=None),
+        ApproveResult(name="joe", approved=True, error=None),
+    ]
+    # approvals are sent from the listed objects, without a read per CSR
+    assert mock_api.replace_certificate_signing_request_approval.call_count == 2
+    mock_api.read_certificate_signing_request_status.assert_not_called()
+    for call in mock_api.replace_certificate_signing_request_approval.call_args_list:
+        name, body = call[0]
+        assert body.metadata.name == name
+        assert [c.type for c in body.status.conditions] == ["Approved"]
+
+
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+def test__approve_many__names(mock_CertificatesV1beta1Api, informer_api_client):
+    approved = kubernetes.client.V1beta1CertificateSigningRequestCondition(type="Approved")
+    mock_api = mock_CertificatesV1beta1Api.return_value
+    mock_api.list_certificate_signing_request.return_value = _csr_list(
+        _listed_csr("joe"), _listed_csr("jane"), _listed_csr("jim", [approved]),
+        _listed_csr("other"))
+
+    def replace(name, body):
+        if name == "jane":
+            raise ApiException(status=409, reason="Conflict")
+        return body
+    mock_api.replace_certificate_signing_request_approval.side_effect = replace
+
+    results = list(approve_many(
+        informer_api_client, names=["joe", "jane", "jim", "missing"]))
+
+    assert sorted(results) == [
+        ApproveResult(name="jane", approved=False, error="409 Conflict"),
+        ApproveResult(name="jim", approved=False, error="not pending"),
+        ApproveResult(name="joe", approved=True, error=None),
+        ApproveResult(name="missing", approved=False, error="not found"),
+    ]
+    # the CSRs come from the shared informer, which lists them page by page
+    mock_api.list_certificate_signing_request.assert_called_once_with(limit=500)
+    assert get_informer(informer_api_client, CSR_KIND) is not None
+
 
-#     class DummyStatus:
-#         certificate = "foo_cert"
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+def test__approve_many__denied(mock_CertificatesV1beta1Api, informer_api_client):
+    denied = kubernetes.client.V1beta1CertificateSigningRequestCondition(type="Denied")
+    mock_api = mock_CertificatesV1beta1Api.return_value
+    mock_api.list_certificate_signing_request.return_value = _csr_list(
+        _listed_csr("joe"), _listed_csr("jim", [denied]))
+    # joe is denied after it was listed
+    mock_api.replace_certificate_signing_request_approval.side_effect = ApiException(
+        status=409, reason="Conflict")
+    mock_api.read_certificate_signing_request_status.return_value = _listed_csr(
+        "joe", [denied])
+
+    results = list(approve_many(informer_api_client, names=["joe", "jim"]))
+
+    assert sorted(results) == [
+        ApproveResult(name="jim", approved=False, error="denied"),
+        ApproveResult(name="joe", approved=False, error="denied"),
+    ]
+    assert mock_api.replace_certificate_signing_request_approval.call_count == 1
+
+
+def test__approve_many__requires_filter():
+    with pytest.raises(ValueError):
+        list(approve_many(mock.Mock()))
+
+
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+def test__csrresource__approve__single_request(mock_CertificatesV1beta1Api):
+    mock_api = mock_CertificatesV1beta1Api.return_value
+    mock_api.replace_certificate_signing_request_approval.side_effect = lambda name, body: body
+    other = kubernetes.client.V1beta1CertificateSigningRequestCondition(type="Other")
+    known = _listed_csr("joe", [other])
+
+    csrr = CSRResource(name="joe", csr_str="<csr>")
+    csrr._resource_cache = known
+    response = csrr.approve(mock.Mock())
+
+    mock_api.read_certificate_signing_request_status.assert_not_called()
+    name, body = mock_api.replace_certificate_signing_request_approval.call_args[0]
+    assert name == "joe"
+    assert body.metadata.resource_version == "100"
+    # existing conditions are kept
+    assert [c.type for c in body.status.conditions] == ["Other", "Approved"]
+    # the known object, which may be shared with an informer, is not modified
+    assert [c.type for c in known.status.conditions] == ["Other"]
+    assert csrr._resource_cache is response
 
-#     class DummyResponse:
-#         def __init__(self):
-#             self.status = DummyStatus()
 
-#     mock_response = DummyResponse()
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+def test__csrresource__approve__conflict_retry(mock_CertificatesV1beta1Api):
+    mock_api = mock_CertificatesV1beta1Api.return_value
+    approved = []
+
+    def replace(name, body):
+        if body.metadata.resource_version == "100":
+            raise ApiException(status=409, reason="Conflict")
+        approved.append(body)
+        return body
+    mock_api.replace_certificate_signing_request_approval.side_effect = replace
+    fresh = _listed_csr("joe")
+    fresh.metadata.resource_version = "101"
+    mock_api.read_certificate_signing_request_status.return_value = fresh
+
+    csrr = CSRResource(name="joe", csr_str="<csr>")
+    csrr._resource_cache = _listed_csr("joe")
+    csrr.approve(mock.Mock())
+
+    mock_api.read_certificate_signing_request_status.assert_called_once_with("joe")
+    assert mock_api.replace_certificate_signing_request_approval.call_count == 2
+    assert approved[0].metadata.resource_version == "101"
+
+
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+def test__csrresource__approve__conflict_gives_up(mock_CertificatesV1beta1Api):
+    mock_api = mock_CertificatesV1beta1Api.return_value
+    mock_api.replace_certificate_signing_request_approval.side_effect = ApiException(status=409)
+    mock_api.read_certificate_signing_request_status.return_value = _listed_csr("joe")
 
-#     name = "joe"
-#     mock_api_client = mock.Mock(spec=kubernetes.client.ApiClient) 
-#     cak = CSRandKey(common_name=name)
-#     csrr = CSRResource(
-#         name=name,
-#         csr_str=cak.csr.base64)
+    csrr = CSRResource(name="joe", csr_str="<csr>")
+    csrr._resource_cache = _listed_csr("joe")
+    with pytest.raises(ApiException):
+        csrr.approve(mock.Mock(), retries=2)
+    assert mock_api.replace_certificate_signing_request_approval.call_count == 3
 
-#     with mock.patch.object(csrr, 'get_resource') as mock__get_resource:
-#         breakpoint()
-#         mock__get_resource.return_value = mock_response
-#         assert csrr.approve(mock_api_client) == 'foo_cert'
+
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+def test__csrresource__approve__already_approved(mock_CertificatesV1beta1Api):
+    approved = kubernetes.client.V1beta1CertificateSigningRequestCondition(type="Approved")
+    known = _listed_csr("joe", [approved])
+    csrr = CSRResource(name="joe", csr_str="<csr>")
+    csrr._resource_cache = known
+    assert csrr.approve(mock.Mock()) is known
+    mock_CertificatesV1beta1Api.return_value.replace_certificate_signing_request_approval.assert_not_called()
+
+
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+def test__csrresource__approve__denied(mock_CertificatesV1beta1Api):
+    denied = kubernetes.client.V1beta1CertificateSigningRequestCondition(type="Denied")
+    csrr = CSRResource(name="joe", csr_str="<csr>")
+    csrr._resource_cache = _listed_csr("joe", [denied])
+    with pytest.raises(ValueError, match="denied"):
+        csrr.approve(mock.Mock())
+    mock_CertificatesV1beta1Api.return_value.replace_certificate_signing_request_approval.assert_not_called()
+
+
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+def test__csrresource__get_cert__denied(mock_CertificatesV1beta1Api):
+    denied = kubernetes.client.V1beta1CertificateSigningRequestCondition(type="Denied")
+    mock_api = mock_CertificatesV1beta1Api.return_value
+    mock_api.read_certificate_signing_request_status.return_value = _listed_csr(
+        "joe", [denied])
+    csrr = CSRResource(name="joe", csr_str="<csr>")
+    with pytest.raises(ValueError, match="denied"):
+        csrr.get_cert(mock.Mock())
+
+
+def test__csrresource__get_text__does_not_mutate_metadata():
+    metadata = {"labels": {"team": "a"}}
+    first = CSRResource(name="first", csr_str="Y3Ny", metadata=metadata)
+    second = CSRResource(name="second", csr_str="Y3Ny", metadata=metadata)
+
+    assert first.get_text().metadata.name == "first"
+    assert second.get_text().metadata.name == "second"
+    assert metadata == {"labels": {"team": "a"}}
+
+
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+def test__csrresource__prime(mock_CertificatesV1beta1Api):
+    csrr = CSRResource(name="joe", csr_str="Y3Ny")
+    csrr.prime(None)
+
+    assert not csrr.resource_exists(mock.Mock())
+    assert csrr.resource_exists(mock.Mock(), cache=False)
+    mock_CertificatesV1beta1Api.return_value.read_certificate_signing_request_status \
+        .assert_called_once_with("joe")
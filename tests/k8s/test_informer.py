@@ -0,0 +1,221 @@
+import threading
+from unittest import mock
+import pytest
+import kubernetes
+from kubernetes.client.rest import ApiException
+from k8s_user.k8s import informer as informer_module
+from k8s_user.k8s.informer import (
+    CSR_KIND, SA_KIND, SECRET_KIND, Informer, get_informer, start_informer, stop_informers)
+from k8s_user.k8s.csr_resource import CSRResource
+from k8s_user.k8s.sa_resource import SAResource
+
+
+def _sa(name, resource_version="1"):
+    return kubernetes.client.V1ServiceAccount(
+        metadata=kubernetes.client.V1ObjectMeta(name=name, resource_version=resource_version))
+
+
+def _sa_list(*names):
+    return kubernetes.client.V1ServiceAccountList(
+        items=[_sa(name) for name in names],
+        metadata=kubernetes.client.V1ListMeta(resource_version="10"))
+
+
+def test__informer__list():
+    list_func = mock.Mock(return_value=_sa_list("joe", "jane"))
+    informer = Informer(list_func, {"namespace": "default"})
+    assert not informer.has_synced
+    informer._list()
+    list_func.assert_called_once_with(namespace="default", limit=500)
+    assert informer.has_synced
+    assert informer.resource_version == "10"
+    assert informer.get("joe").metadata.name == "joe"
+    assert informer.get("missing") is None
+    assert sorted(sa.metadata.name for sa in informer.list()) == ["jane", "joe"]
+
+
+def test__informer__list_pages():
+    first = _sa_list("joe")
+    first.metadata._continue = "page2"
+    list_func = mock.Mock(side_effect=[
+        first,
+        # the continue token expired, so the LIST starts over
+        ApiException(status=410, reason="Expired"),
+        first,
+        _sa_list("jane"),
+    ])
+    informer = Informer(list_func, {"namespace": "default"}, page_size=1)
+    informer._list()
+    assert list_func.call_args_list == [
+        mock.call(namespace="default", limit=1),
+        mock.call(namespace="default", limit=1, _continue="page2"),
+        mock.call(namespace="default", limit=1),
+        mock.call(namespace="default", limit=1, _continue="page2"),
+    ]
+    assert sorted(sa.metadata.name for sa in informer.list()) == ["jane", "joe"]
+    assert informer.resource_version == "10"
+
+
+@mock.patch('k8s_user.k8s.informer.kubernetes.watch.Watch')
+def test__informer__watch_events(mock_Watch):
+    mock_Watch.return_value.stream.return_value = iter([
+        {"type": "ADDED", "object": _sa("jim", "11")},
+        {"type": "MODIFIED", "object": _sa("joe", "12")},
+        {"type": "DELETED", "object": _sa("jane", "13")},
+    ])
+    list_func = mock.Mock(return_value=_sa_list("joe", "jane"))
+    informer = Informer(list_func, {"namespace": "default"}, watch_timeout=60)
+    informer._list()
+    informer._watch_once()
+
+    mock_Watch.return_value.stream.assert_called_once_with(
+        list_func, resource_version="10", timeout_seconds=60, namespace="default")
+    assert sorted(sa.metadata.name for sa in informer.list()) == ["jim", "joe"]
+    assert informer.get("joe").metadata.resource_version == "12"
+    assert informer.resource_version == "13"
+
+
+@mock.patch('k8s_user.k8s.informer.kubernetes.watch.Watch')
+def test__informer__watch_expired_relists(mock_Watch):
+    mock_Watch.return_value.stream.return_value = iter([
+        {"type": "ERROR", "object": None, "raw_object": {"code": 410, "message": "gone"}},
+    ])
+    list_func = mock.Mock(side_effect=[_sa_list("joe"), _sa_list("joe", "jim")])
+    informer = Informer(list_func)
+    informer._list()
+    informer._watch_once()
+    assert list_func.call_count == 2
+    assert informer.get("jim") is not None
+
+
+@mock.patch('k8s_user.k8s.informer.kubernetes.watch.Watch')
+def test__informer__watch_error(mock_Watch):
+    mock_Watch.return_value.stream.return_value = iter([
+        {"type": "ERROR", "object": None, "raw_object": {"code": 500, "message": "boom"}},
+    ])
+    informer = Informer(mock.Mock(return_value=_sa_list()))
+    informer._list()
+    with pytest.raises(ApiException):
+        informer._watch_once()
+
+
+@pytest.fixture
+def blocking_watch():
+    """Patch Watch so the background watch blocks until the test ends"""
+    done = threading.Event()
+    with mock.patch('k8s_user.k8s.informer.kubernetes.watch.Watch') as mock_Watch:
+        mock_Watch.return_value.stream.side_effect = lambda *a, **kw: iter(
+            [] if done.wait(5) else [])
+        yield mock_Watch
+        done.set()
+
+
+@mock.patch('k8s_user.k8s.informer.kubernetes.client.CoreV1Api')
+def test__start_informer__shared(mock_CoreV1Api, blocking_watch):
+    mock_list = mock_CoreV1Api.return_value.list_namespaced_service_account
+    mock_list.return_value = _sa_list("joe")
+    api_client = mock.Mock(spec=kubernetes.client.ApiClient)
+    try:
+        assert get_informer(api_client, SA_KIND, "default") is None
+        informer = start_informer(api_client, SA_KIND, "default")
+        assert start_informer(api_client, SA_KIND, "default") is informer
+        assert get_informer(api_client, SA_KIND, "default") is informer
+        assert get_informer(api_client, SA_KIND, "other") is None
+        mock_list.assert_called_once_with(namespace="default", limit=500)
+
+        # SAResource lookups are answered from the informer
+        mock_read = mock_CoreV1Api.return_value.read_namespaced_service_account
+        assert SAResource("joe", "default").resource_exists(api_client)
+        assert not SAResource("jim", "default").resource_exists(api_client)
+        mock_read.assert_not_called()
+        # unless the cache is bypassed
+        SAResource("joe", "default").get_resource(api_client, cache=False)
+        mock_read.assert_called_once()
+    finally:
+        stop_informers(api_client)
+    assert get_informer(api_client, SA_KIND, "default") is None
+
+
+
+@mock.patch('k8s_user.k8s.informer.kubernetes.client.CoreV1Api')
+def test__start_informer__concurrent(mock_CoreV1Api, blocking_watch):
+    mock_list = mock_CoreV1Api.return_value.list_namespaced_service_account
+    listing = threading.Event()
+
+    def slow_list(**kwargs):
+        listing.wait(1)
+        return _sa_list("joe")
+    mock_list.side_effect = slow_list
+    api_client = mock.Mock(spec=kubernetes.client.ApiClient)
+    started = []
+    threads = [
+        threading.Thread(
+            target=lambda: started.append(start_informer(api_client, SA_KIND, "default")))
+        for _ in range(4)
+    ]
+    try:
+        for thread in threads:
+            thread.start()
+        listing.set()
+        for thread in threads:
+            thread.join()
+        # one LIST and one watch thread, shared by every caller
+        mock_list.assert_called_once()
+        assert len({id(informer) for informer in started}) == 1
+        assert all(informer.has_synced for informer in started)
+    finally:
+        stop_informers(api_client)
+
+
+@mock.patch('k8s_user.k8s.informer.kubernetes.client.CoreV1Api')
+def test__stop_informers__releases_client(mock_CoreV1Api, blocking_watch):
+    mock_CoreV1Api.return_value.list_namespaced_service_account.return_value = \
+        _sa_list("joe")
+    api_client = mock.Mock(spec=kubernetes.client.ApiClient)
+    informer = start_informer(api_client, SA_KIND, "default")
+    # the registry holds the client until the informers are stopped
+    assert api_client in informer_module._informers
+    stop_informers(api_client)
+    assert api_client not in informer_module._informers
+    assert informer._stopped.is_set()
+
+@mock.patch('k8s_user.k8s.informer.kubernetes.client.CertificatesV1beta1Api')
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+def test__csrresource__informer(mock_csr_api, mock_informer_api, blocking_watch):
+    csr = kubernetes.client.V1beta1CertificateSigningRequest(
+        metadata=kubernetes.client.V1ObjectMeta(name="joe"))
+    mock_informer_api.return_value.list_certificate_signing_request.return_value = \
+        kubernetes.client.V1beta1CertificateSigningRequestList(
+            items=[csr], metadata=kubernetes.client.V1ListMeta(resource_version="1"))
+    api_client = mock.Mock(spec=kubernetes.client.ApiClient)
+    start_informer(api_client, CSR_KIND)
+    try:
+        assert CSRResource("joe", "<csr>").get_resource(api_client) is csr
+        assert CSRResource("jim", "<csr>").get_resource(api_client) is None
+        mock_csr_api.return_value.read_certificate_signing_request_status.assert_not_called()
+    finally:
+        stop_informers(api_client)
+
+
+@mock.patch('k8s_user.k8s.informer.kubernetes.client.CoreV1Api')
+def test__saresource__token_secret_informer(mock_CoreV1Api, blocking_watch):
+    def secret(name, sa_name, secret_type="kubernetes.io/service-account-token"):
+        return kubernetes.client.V1Secret(
+            type=secret_type,
+            metadata=kubernetes.client.V1ObjectMeta(
+                name=name, annotations={"kubernetes.io/service-account.name": sa_name}))
+    token_secret = secret("joe-token-abcde", "joe")
+    mock_CoreV1Api.return_value.list_namespaced_secret.return_value = \
+        kubernetes.client.V1SecretList(
+            items=[secret("jim-token-abcde", "jim"), secret("joe-other", "joe", "Opaque"),
+                   token_secret],
+            metadata=kubernetes.client.V1ListMeta(resource_version="1"))
+    api_client = mock.Mock(spec=kubernetes.client.ApiClient)
+    start_informer(api_client, SECRET_KIND, "default")
+    try:
+        sar = SAResource("joe", "default")
+        with mock.patch.object(sar, 'get_token_secret_resource_name') as mock_name:
+            assert sar.get_token_secret_resource(api_client) is token_secret
+            mock_name.assert_not_called()
+    finally:
+        stop_informers(api_client)
@@ -0,0 +1,104 @@
+import base64
+import io
+import json
+from datetime import datetime
+from unittest import mock
+from cryptography.hazmat.primitives import serialization
+from k8s_user.k8s.inventory import cert_expiry, iter_inventory, paginate, write_inventory
+from k8s_user.k8s.labels import MANAGED_BY_SELECTOR
+from k8s_user.pki import Key
+from ..utils import get_self_signed_cert_for_key
+
+
+def _response(items, continue_token=None):
+    response = mock.Mock()
+    response.data = json.dumps(
+        {"items": items, "metadata": {"continue": continue_token}}).encode()
+    return response
+
+
+def _certificate():
+    crt = get_self_signed_cert_for_key(Key(key_profile="ec-p256").key)
+    return crt, base64.b64encode(crt.public_bytes(serialization.Encoding.PEM)).decode()
+
+
+def test__paginate():
+    list_func = mock.Mock(side_effect=[
+        _response([{"n": 1}, {"n": 2}], "page-1"), _response([{"n": 3}])])
+    assert [i["n"] for i in paginate(list_func, page_size=2, label_selector="a=b")] == [1, 2, 3]
+    assert list_func.call_args_list == [
+        mock.call(_preload_content=False, label_selector="a=b", limit=2),
+        mock.call(_preload_content=False, label_selector="a=b", limit=2, _continue="page-1"),
+    ]
+
+
+def test__cert_expiry():
+    crt, certificate = _certificate()
+    assert datetime.fromisoformat(cert_expiry(certificate)) == crt.not_valid_after_utc
+    assert cert_expiry(None) is None
+    assert cert_expiry(base64.b64encode(b"not a cert").decode()) is None
+
+
+@mock.patch('k8s_user.k8s.inventory.kubernetes.client.CoreV1Api')
+@mock.patch('k8s_user.k8s.inventory.kubernetes.client.CertificatesV1beta1Api')
+def test__iter_inventory(mock_CertificatesV1beta1Api, mock_CoreV1Api):
+    crt, certificate = _certificate()
+    mock_list_csrs = mock_CertificatesV1beta1Api.return_value.list_certificate_signing_request
+    mock_list_csrs.side_effect = [
+        _response([
+            {"metadata": {"name": "joe", "creationTimestamp": "2020-01-01T00:00:00Z"},
+             "status": {"conditions": [{"type": "Approved"}], "certificate": certificate}},
+        ], "page-1"),
+        _response([
+            {"metadata": {"name": "jane", "creationTimestamp": "2020-01-02T00:00:00Z"},
+             "status": {}},
+        ]),
+    ]
+    mock_list_secrets = mock_CoreV1Api.return_value.list_secret_for_all_namespaces
+    mock_list_secrets.return_value = _response([
+        {"metadata": {"name": "jim-token-abcde", "namespace": "ns1",
+                      "annotations": {"kubernetes.io/service-account.name": "jim"}}},
+        {"metadata": {"name": "unannotated", "namespace": "ns2"}},
+    ])
+    mock_list_sas = mock_CoreV1Api.return_value.list_service_account_for_all_namespaces
+    mock_list_sas.return_value = _response([
+        {"metadata": {"name": "jim", "namespace": "ns1", "creationTimestamp": "2020-01-03T00:00:00Z"}},
+        {"metadata": {"name": "jim", "namespace": "ns2", "creationTimestamp": "2020-01-04T00:00:00Z"},
+         "secrets": [{"name": "jim-token-deleted"}]},
+    ])
+
+    records = list(iter_inventory(mock.Mock(), page_size=1))
+
+    assert records == [
+        {"kind": "csr", "name": "joe", "namespace": None, "created": "2020-01-01T00:00:00Z",
+         "approved": True, "denied": False, "issued": True,
+         "cert_not_after": crt.not_valid_after_utc.isoformat()},
+        {"kind": "csr", "name": "jane", "namespace": None, "created": "2020-01-02T00:00:00Z",
+         "approved": False, "denied": False, "issued": False, "cert_not_after": None},
+        {"kind": "serviceaccount", "name": "jim", "namespace": "ns1",
+         "created": "2020-01-03T00:00:00Z", "token_secret": True},
+        {"kind": "serviceaccount", "name": "jim", "namespace": "ns2",
+         "created": "2020-01-04T00:00:00Z", "token_secret": False},
+    ]
+    assert mock_list_csrs.call_args[1]["label_selector"] == MANAGED_BY_SELECTOR
+    assert mock_list_sas.call_args[1]["label_selector"] == MANAGED_BY_SELECTOR
+    assert mock_list_secrets.call_args[1]["field_selector"] == \
+        "type=kubernetes.io/service-account-token"
+
+
+@mock.patch('k8s_user.k8s.inventory.kubernetes.client.CoreV1Api')
+def test__write_inventory__namespace(mock_CoreV1Api):
+    mock_list_secrets = mock_CoreV1Api.return_value.list_namespaced_secret
+    mock_list_secrets.return_value = _response([])
+    mock_list_sas = mock_CoreV1Api.return_value.list_namespaced_service_account
+    mock_list_sas.return_value = _response([
+        {"metadata": {"name": "jim", "namespace": "ns1"}}])
+    out = io.StringIO()
+
+    assert write_inventory(
+        mock.Mock(), out, namespace="ns1", kinds=["serviceaccount"]) == 1
+
+    assert mock_list_sas.call_args[1]["namespace"] == "ns1"
+    assert mock_list_secrets.call_args[1]["namespace"] == "ns1"
+    lines = out.getvalue().splitlines()
+    assert [json.loads(line)["name"] for line in lines] == ["jim"]
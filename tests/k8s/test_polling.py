@@ -0,0 +1,57 @@
+import time
+from unittest import mock
+import pytest
+from k8s_user.k8s.polling import PollPolicy
+
+
+def test__pollpolicy__delays():
+    policy = PollPolicy(initial_delay=0.1, max_delay=1, backoff=2, jitter=0)
+    delays = policy.delays()
+    assert [next(delays) for _ in range(6)] == [0.1, 0.2, 0.4, 0.8, 1, 1]
+
+
+def test__pollpolicy__jitter():
+    policy = PollPolicy(initial_delay=1, backoff=1, jitter=0.25)
+    delays = policy.delays()
+    samples = [next(delays) for _ in range(200)]
+    assert all(0.75 <= d <= 1.25 for d in samples)
+    assert len(set(samples)) > 1
+
+
+@pytest.mark.parametrize("kwargs", [
+    pytest.param(dict(jitter=1.5), id="jitter"),
+    pytest.param(dict(backoff=0.5), id="backoff"),
+])
+def test__pollpolicy__invalid(kwargs):
+    with pytest.raises(ValueError):
+        PollPolicy(**kwargs)
+
+
+@mock.patch('k8s_user.k8s.polling.time.sleep')
+def test__poll__sleeps_between_attempts(mock_sleep):
+    policy = PollPolicy(timeout=60, initial_delay=0.1, max_delay=0.3, jitter=0)
+    attempts = []
+    for attempt in policy.start():
+        attempts.append(attempt)
+        if attempt == 4:
+            break
+    assert attempts == [0, 1, 2, 3, 4]
+    assert [c[0][0] for c in mock_sleep.call_args_list] == [0.1, 0.2, 0.3, 0.3]
+
+
+def test__poll__deadline():
+    policy = PollPolicy(timeout=0.2, initial_delay=0.05, jitter=0)
+    start = time.monotonic()
+    attempts = list(policy.start())
+    elapsed = time.monotonic() - start
+    assert 2 <= len(attempts) <= 5
+    assert 0.2 <= elapsed < 0.4
+
+
+def test__poll__shared_deadline():
+    policy = PollPolicy(timeout=60)
+    outer = policy.start(timeout=1)
+    inner = policy.start(deadline=outer.deadline)
+    assert inner.deadline == outer.deadline
+    # a shorter timeout still wins over the shared deadline
+    assert policy.start(timeout=0.1, deadline=outer.deadline).deadline < outer.deadline
@@ -1,9 +1,11 @@
 import os
+import time
 from unittest import mock
 import json
 import pytest
 import kubernetes
 from kubernetes.client.rest import ApiException
+from k8s_user.k8s.polling import PollPolicy
 from k8s_user.k8s.sa_resource import SAResource
 
 
@@ -122,6 +124,35 @@ def test__saresource__create__existing(mock_CoreV1Api):
             assert sar.create(mock_api_client) == mock_response
 
 
+@mock.patch('k8s_user.k8s.sa_resource.kubernetes.client.CoreV1Api')
+def test__saresource__create__primed(mock_CoreV1Api):
+    mock_api = mock_CoreV1Api.return_value
+    mock_api_client = mock.Mock(spec=kubernetes.client.ApiClient)
+    sar = SAResource(name="joe", namespace="default")
+    # primed as missing, so create skips the GET
+    sar.prime(None)
+    sar.create(mock_api_client)
+    mock_api.read_namespaced_service_account.assert_not_called()
+    mock_api.create_namespaced_service_account.assert_called_once()
+    assert sar.created
+
+
+@mock.patch('k8s_user.k8s.sa_resource.kubernetes.client.CoreV1Api')
+def test__saresource__create__conflict(mock_CoreV1Api):
+    mock_response = {'dummy': "response"}
+    mock_api = mock_CoreV1Api.return_value
+    mock_api.create_namespaced_service_account.side_effect = ApiException(status=409)
+    mock_api.read_namespaced_service_account.return_value = mock_response
+    mock_api_client = mock.Mock(spec=kubernetes.client.ApiClient)
+    sar = SAResource(name="joe", namespace="default")
+    sar.prime(None)
+    # created by someone else since it was listed
+    assert sar.create(mock_api_client) == mock_response
+    mock_api.read_namespaced_service_account.assert_called_once_with(
+        name="joe", namespace="default")
+    assert not sar.created
+
+
 @mock.patch('k8s_user.k8s.sa_resource.kubernetes.client.CoreV1Api')
 def test__saresource__get_token_secret_resource(mock_CoreV1Api):
 
@@ -147,7 +178,7 @@ def test__saresource__get_token(mock_CoreV1Api):
 
     class DummSecret:
         def __init__(self):
-            self.data = {"token": "mytoken"}
+            self.data = {"token": "bXl0b2tlbg=="}
 
     name = "joe"
     namespace = "default"
@@ -155,6 +186,128 @@ def test__saresource__get_token(mock_CoreV1Api):
     sar = SAResource(
         name=name,
         namespace=namespace)
-    with mock.patch.object(sar, 'get_token_secret_resource') as mock__get_token_secret_resource:
+    with mock.patch.object(sar, 'get_token_secret_resource') as mock__get_token_secret_resource, \
+            mock.patch.object(sar, '_watch_secret_token', return_value=None):
         mock__get_token_secret_resource.return_value = DummSecret()
-        assert sar.get_token(mock_api_client) == "mytoken"
\ No newline at end of file
+        assert sar.get_token(mock_api_client, token_request=False) == "mytoken"
+
+@mock.patch('k8s_user.k8s.sa_resource.kubernetes.client.CoreV1Api')
+def test__saresource__get_token__shared_deadline(mock_CoreV1Api):
+    """The nested wait for the token secret is bounded by the get_token deadline"""
+    mock_CoreV1Api.return_value.read_namespaced_secret.side_effect = ApiException(status=404)
+    mock_api_client = mock.Mock(spec=kubernetes.client.ApiClient)
+    sar = SAResource(
+        name="joe",
+        namespace="default",
+        poll_policy=PollPolicy(timeout=0.3, initial_delay=0.02, max_delay=0.05),
+    )
+    start = time.monotonic()
+    with mock.patch.object(sar, 'get_resource') as mock__get_resource, \
+            mock.patch.object(sar, '_watch_secret_token', return_value=None):
+        # the SA never references a token secret
+        mock__get_resource.return_value = kubernetes.client.V1ServiceAccount(secrets=None)
+        assert sar.get_token(mock_api_client, token_request=False) is None
+    assert time.monotonic() - start < 0.6
+
+
+def test__saresource__request_token():
+    mock_api_client = mock.Mock(spec=kubernetes.client.ApiClient)
+    mock_api_client.call_api.return_value = {"status": {"token": "requested-token"}}
+    sar = SAResource(name="joe", namespace="default")
+    with mock.patch.object(sar, 'get_token_secret_resource') as mock__get_token_secret_resource:
+        assert sar.get_token(
+            mock_api_client, audiences=["vault"], expiration_seconds=3600) == "requested-token"
+        mock__get_token_secret_resource.assert_not_called()
+
+    args, kwargs = mock_api_client.call_api.call_args
+    assert args == ("/api/v1/namespaces/{namespace}/serviceaccounts/{name}/token", "POST")
+    assert kwargs["path_params"] == {"namespace": "default", "name": "joe"}
+    assert kwargs["body"] == {
+        "apiVersion": "authentication.k8s.io/v1",
+        "kind": "TokenRequest",
+        "spec": {"audiences": ["vault"], "expirationSeconds": 3600},
+    }
+
+
+@pytest.mark.parametrize("status", [403, 404, 405])
+def test__saresource__request_token__fallback(status):
+    mock_api_client = mock.Mock(spec=kubernetes.client.ApiClient)
+    mock_api_client.call_api.side_effect = ApiException(status=status)
+    sar = SAResource(name="joe", namespace="default")
+    with mock.patch.object(sar, 'get_secret_token') as mock__get_secret_token:
+        mock__get_secret_token.return_value = "secret-token"
+        assert sar.get_token(mock_api_client) == "secret-token"
+
+
+def test__saresource__request_token__error():
+    mock_api_client = mock.Mock(spec=kubernetes.client.ApiClient)
+    mock_api_client.call_api.side_effect = ApiException(status=500)
+    sar = SAResource(name="joe", namespace="default")
+    with pytest.raises(ApiException):
+        sar.get_token(mock_api_client)
+
+
+def _token_secret(name, sa_name, token=None, resource_version="1"):
+    return kubernetes.client.V1Secret(
+        type="kubernetes.io/service-account-token",
+        data={"token": token} if token else None,
+        metadata=kubernetes.client.V1ObjectMeta(
+            name=name,
+            resource_version=resource_version,
+            annotations={"kubernetes.io/service-account.name": sa_name}))
+
+
+def _secret_list(*secrets):
+    return kubernetes.client.V1SecretList(
+        items=list(secrets), metadata=kubernetes.client.V1ListMeta(resource_version="10"))
+
+
+@mock.patch('k8s_user.k8s.sa_resource.kubernetes.watch.Watch')
+@mock.patch('k8s_user.k8s.sa_resource.kubernetes.client.CoreV1Api')
+def test__saresource__get_secret_token__listed(mock_CoreV1Api, mock_Watch):
+    mock_CoreV1Api.return_value.list_namespaced_secret.return_value = _secret_list(
+        _token_secret("jim-token-a", "jim", "amltdG9rZW4="),
+        _token_secret("joe-token-a", "joe", "am9ldG9rZW4="))
+    sar = SAResource(name="joe", namespace="default")
+    assert sar.get_secret_token(mock.Mock()) == "joetoken"
+    mock_CoreV1Api.return_value.list_namespaced_secret.assert_called_once_with(
+        "default", field_selector="type=kubernetes.io/service-account-token")
+    mock_Watch.assert_not_called()
+
+
+@mock.patch('k8s_user.k8s.sa_resource.kubernetes.watch.Watch')
+@mock.patch('k8s_user.k8s.sa_resource.kubernetes.client.CoreV1Api')
+def test__saresource__get_secret_token__watch(mock_CoreV1Api, mock_Watch):
+    mock_list = mock_CoreV1Api.return_value.list_namespaced_secret
+    mock_list.return_value = _secret_list(_token_secret("jim-token-a", "jim", "amltdG9rZW4="))
+    mock_Watch.return_value.stream.return_value = iter([
+        {"type": "ADDED", "object": _token_secret("joe-token-a", "joe", None, "11")},
+        {"type": "MODIFIED", "object": _token_secret("jim-token-a", "jim", "amltdG9rZW4=", "12")},
+        {"type": "MODIFIED", "object": _token_secret("joe-token-a", "joe", "am9ldG9rZW4=", "13")},
+    ])
+    sar = SAResource(name="joe", namespace="default")
+    with mock.patch.object(sar, 'get_resource') as mock__get_resource:
+        assert sar.get_secret_token(mock.Mock()) == "joetoken"
+        # the ServiceAccount is never re-read
+        mock__get_resource.assert_not_called()
+
+    stream_args, stream_kwargs = mock_Watch.return_value.stream.call_args
+    assert stream_args == (mock_list, "default")
+    assert stream_kwargs["field_selector"] == "type=kubernetes.io/service-account-token"
+    assert stream_kwargs["resource_version"] == "10"
+    mock_Watch.return_value.stop.assert_called_once()
+    assert sar._resource_token_secret_cache.metadata.resource_version == "13"
+
+
+@mock.patch('k8s_user.k8s.sa_resource.kubernetes.watch.Watch')
+@mock.patch('k8s_user.k8s.sa_resource.kubernetes.client.CoreV1Api')
+def test__saresource__get_secret_token__polling_fallback(mock_CoreV1Api, mock_Watch):
+    mock_CoreV1Api.return_value.list_namespaced_secret.return_value = _secret_list()
+    mock_Watch.return_value.stream.side_effect = ApiException(status=410)
+    sar = SAResource(
+        name="joe", namespace="default", poll_policy=PollPolicy(initial_delay=0.01))
+    with mock.patch.object(sar, 'get_token_secret_resource') as mock__get_token_secret_resource:
+        mock__get_token_secret_resource.side_effect = [
+            None, _token_secret("joe-token-a", "joe", "am9ldG9rZW4=")]
+        assert sar.get_secret_token(mock.Mock()) == "joetoken"
+        assert mock__get_token_secret_resource.call_count == 2
@@ -0,0 +1,137 @@
+from concurrent.futures import Future, wait
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+import kubernetes
+from kubernetes.client.rest import ApiException
+from k8s_user.k8s.labels import MANAGED_BY_SELECTOR, with_managed_by
+from k8s_user.k8s.sweeper import iter_csrs, sweep_csrs
+
+
+NOW = datetime(2020, 6, 1, tzinfo=timezone.utc)
+
+
+def _csr(name, age_days):
+    return kubernetes.client.V1beta1CertificateSigningRequest(
+        metadata=kubernetes.client.V1ObjectMeta(
+            name=name,
+            uid=f"uid-{name}",
+            creation_timestamp=NOW - timedelta(days=age_days),
+        ))
+
+
+def _pages(*pages):
+    """Return CSR list responses chained with continue tokens"""
+    responses = []
+    for i, items in enumerate(pages):
+        responses.append(kubernetes.client.V1beta1CertificateSigningRequestList(
+            items=items,
+            metadata=kubernetes.client.V1ListMeta(
+                _continue=f"page-{i + 1}" if i + 1 < len(pages) else None),
+        ))
+    return responses
+
+
+def test__with_managed_by():
+    metadata = {"labels": {"team": "a"}, "annotations": {"x": "y"}}
+    assert with_managed_by(metadata) == {
+        "labels": {"team": "a", "app.kubernetes.io/managed-by": "k8s_user"},
+        "annotations": {"x": "y"},
+    }
+    # the input is not modified
+    assert metadata["labels"] == {"team": "a"}
+    assert with_managed_by(None) == {"labels": {"app.kubernetes.io/managed-by": "k8s_user"}}
+
+
+@mock.patch('k8s_user.k8s.sweeper.kubernetes.client.CertificatesV1beta1Api')
+def test__iter_csrs__paginates(mock_CertificatesV1beta1Api):
+    mock_list = mock_CertificatesV1beta1Api.return_value.list_certificate_signing_request
+    mock_list.side_effect = _pages([_csr("a", 1), _csr("b", 1)], [_csr("c", 1)])
+
+    names = [csr.metadata.name for csr in iter_csrs(mock.Mock(), page_size=2)]
+
+    assert names == ["a", "b", "c"]
+    assert mock_list.call_args_list == [
+        mock.call(limit=2, label_selector=MANAGED_BY_SELECTOR),
+        mock.call(limit=2, label_selector=MANAGED_BY_SELECTOR, _continue="page-1"),
+    ]
+
+
+@mock.patch('k8s_user.k8s.sweeper.kubernetes.client.CertificatesV1beta1Api')
+def test__iter_csrs__continue_expired(mock_CertificatesV1beta1Api):
+    mock_list = mock_CertificatesV1beta1Api.return_value.list_certificate_signing_request
+    first, _ = _pages([_csr("a", 1), _csr("b", 1)], [])
+    mock_list.side_effect = [
+        first,
+        ApiException(status=410, reason="Expired"),
+        # the LIST starts over, and a and b are not yielded again
+        *_pages([_csr("a", 1), _csr("b", 1)], [_csr("c", 1)]),
+    ]
+
+    names = [csr.metadata.name for csr in iter_csrs(mock.Mock(), page_size=2)]
+
+    assert names == ["a", "b", "c"]
+    assert mock_list.call_count == 4
+    assert "_continue" not in mock_list.call_args_list[2][1]
+
+
+@mock.patch('k8s_user.k8s.sweeper.kubernetes.client.CertificatesV1beta1Api')
+def test__sweep_csrs__bounded_pending(mock_CertificatesV1beta1Api):
+    mock_api = mock_CertificatesV1beta1Api.return_value
+    mock_api.list_certificate_signing_request.side_effect = _pages(
+        [_csr(f"csr{i:03}", 40) for i in range(100)])
+    executor = mock.Mock()
+    submitted = []
+
+    def submit(func, csr):
+        future = Future()
+        future.set_result(func(csr))
+        submitted.append(future)
+        return future
+    executor.submit.side_effect = submit
+
+    with mock.patch('k8s_user.k8s.sweeper.wait', wraps=wait) as mock_wait:
+        result = sweep_csrs(
+            mock.Mock(), timedelta(days=30), max_workers=2, executor=executor, now=NOW)
+
+    assert result.deleted == 100
+    # no more than 2 * max_workers deletes were pending before waiting
+    assert all(len(c[0][0]) <= 4 for c in mock_wait.call_args_list)
+    assert mock_wait.call_count > 0
+
+
+@mock.patch('k8s_user.k8s.sweeper.kubernetes.client.CertificatesV1beta1Api')
+def test__sweep_csrs(mock_CertificatesV1beta1Api):
+    mock_api = mock_CertificatesV1beta1Api.return_value
+    mock_api.list_certificate_signing_request.side_effect = _pages(
+        [_csr("new", 1), _csr("old", 40)], [_csr("gone", 50), _csr("locked", 60)])
+
+    def delete(name, body):
+        if name == "gone":
+            raise ApiException(status=404)
+        if name == "locked":
+            raise ApiException(status=403, reason="Forbidden")
+    mock_api.delete_certificate_signing_request.side_effect = delete
+
+    result = sweep_csrs(mock.Mock(), timedelta(days=30), page_size=2, now=NOW)
+
+    assert result.scanned == 4
+    assert result.expired == 3
+    assert result.deleted == 2
+    assert result.errors == {"locked": "403 Forbidden"}
+    deleted = {
+        c[0][0]: c[1]["body"].preconditions.uid
+        for c in mock_api.delete_certificate_signing_request.call_args_list
+    }
+    assert deleted == {"old": "uid-old", "gone": "uid-gone", "locked": "uid-locked"}
+
+
+@mock.patch('k8s_user.k8s.sweeper.kubernetes.client.CertificatesV1beta1Api')
+def test__sweep_csrs__dry_run(mock_CertificatesV1beta1Api):
+    mock_api = mock_CertificatesV1beta1Api.return_value
+    mock_api.list_certificate_signing_request.side_effect = _pages(
+        [_csr("new", 1), _csr("old", 40)])
+
+    result = sweep_csrs(mock.Mock(), timedelta(days=30), dry_run=True, now=NOW)
+
+    assert result == (2, 1, 0, {})
+    mock_api.delete_certificate_signing_request.assert_not_called()
@@ -0,0 +1,207 @@
+import os
+import base64
+import threading
+from unittest import mock
+import pytest
+import yaml
+import kubernetes
+from kubernetes.client.rest import ApiException
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from k8s_user.batch import (
+    SAProvisionResult, create_users, provision_service_accounts, sa_kubeconfig_path,
+)
+from k8s_user.k8s.csr_resource import CSRResource
+from k8s_user.k8s.informer import SA_KIND, get_informer, stop_informers
+from k8s_user.k8s.kubeconfig import ClusterConfigGen
+from k8s_user.k8s.sa_resource import SAResource
+from k8s_user.metrics import StepHistograms
+from k8s_user.user import CSRK8sUser
+from .utils import get_self_signed_cert_for_key
+
+
+def _sa_list(*names):
+    return kubernetes.client.V1ServiceAccountList(
+        items=[kubernetes.client.V1ServiceAccount(
+            metadata=kubernetes.client.V1ObjectMeta(name=name)) for name in names],
+        metadata=kubernetes.client.V1ListMeta(resource_version="1"))
+
+
+@pytest.fixture
+def informer_api_client():
+    """An api_client whose informer watches block until the test ends"""
+    api_client = mock.Mock()
+    done = threading.Event()
+    with mock.patch('k8s_user.k8s.informer.kubernetes.watch.Watch') as mock_Watch:
+        mock_Watch.return_value.stream.side_effect = lambda *a, **kw: iter(
+            [] if done.wait(5) else [])
+        yield api_client
+        stop_informers(api_client)
+        done.set()
+
+
+@mock.patch.object(ClusterConfigGen, 'host', new_callable=mock.PropertyMock)
+@mock.patch.object(ClusterConfigGen, 'cluster_ca_cert', new_callable=mock.PropertyMock)
+@mock.patch('k8s_user.batch.kubernetes.client.CoreV1Api')
+def test__provision_service_accounts(
+        mock_CoreV1Api, mock_cluster_ca_cert, mock_host, informer_api_client, tmpdir):
+    mock_cluster_ca_cert.return_value = "<ca-cert-data>"
+    mock_host.return_value = "test-host"
+    mock_api = mock_CoreV1Api.return_value
+    mock_api.list_namespaced_service_account.side_effect = lambda namespace, **kwargs: {
+        "ns1": _sa_list("joe", "other"),
+        "ns2": _sa_list(),
+    }[namespace]
+
+    def create(namespace, body):
+        if (body.metadata.name, namespace) == ("jane", "ns2"):
+            raise ApiException(status=409, reason="AlreadyExists")
+    mock_api.create_namespaced_service_account.side_effect = create
+
+    def request_token(self, api_client, audiences=None, expiration_seconds=None):
+        return f"token-{self.name}-{self.namespace}"
+
+    out_dir = str(tmpdir)
+    histograms = StepHistograms()
+    with mock.patch.object(SAResource, 'request_token', request_token):
+        results = sorted(provision_service_accounts(
+            informer_api_client, ["joe", "jane"], ["ns1", "ns2"], out_dir=out_dir,
+            max_workers=4, histograms=histograms))
+
+    assert results == [
+        SAProvisionResult("jane", "ns1", True, sa_kubeconfig_path("jane", "ns1", out_dir), None),
+        SAProvisionResult("jane", "ns2", False, sa_kubeconfig_path("jane", "ns2", out_dir), None),
+        SAProvisionResult("joe", "ns1", False, sa_kubeconfig_path("joe", "ns1", out_dir), None),
+        SAProvisionResult("joe", "ns2", True, sa_kubeconfig_path("joe", "ns2", out_dir), None),
+    ]
+    # one LIST per namespace, by the shared informers, and no per-user reads but
+    # after the 409
+    assert sorted(
+        c[1]["namespace"] for c in mock_api.list_namespaced_service_account.call_args_list
+    ) == ["ns1", "ns2"]
+    assert get_informer(informer_api_client, SA_KIND, "ns1") is not None
+    mock_api.read_namespaced_service_account.assert_called_once_with(
+        name="jane", namespace="ns2")
+    assert mock_api.create_namespaced_service_account.call_count == 3
+    # every user went through the TokenK8sUser workflow
+    step_metrics = histograms.to_dict()
+    assert step_metrics["sa_resource_exists"]["count"] == 4
+    assert step_metrics["save_kubeconfig"]["count"] == 4
+
+    path = os.path.join(out_dir, "joe-ns2-kubeconfig.yaml")
+    with open(path) as f:
+        kubeconfig_yaml = yaml.safe_load(f)
+    assert kubeconfig_yaml['users'][0]['name'] == 'joe'
+    assert kubeconfig_yaml['users'][0]['user']['token'] == 'token-joe-ns2'
+
+
+@mock.patch('k8s_user.batch.kubernetes.client.CoreV1Api')
+def test__provision_service_accounts__errors(mock_CoreV1Api, informer_api_client, tmpdir):
+    mock_api = mock_CoreV1Api.return_value
+
+    def list_sas(namespace, **kwargs):
+        if namespace == "forbidden":
+            raise ApiException(status=403, reason="Forbidden")
+        return _sa_list("joe")
+    mock_api.list_namespaced_service_account.side_effect = list_sas
+    out_dir = str(tmpdir)
+    with open(sa_kubeconfig_path("joe", "ns1", out_dir), "w") as f:
+        f.write("existing")
+
+    results = sorted(provision_service_accounts(
+        informer_api_client, ["joe"], ["ns1", "forbidden"], out_dir=out_dir))
+
+    assert [(r.namespace, r.error) for r in results] == [
+        ("forbidden", "403 Forbidden"),
+        ("ns1", "kubeconfig file exists already"),
+    ]
+    mock_api.create_namespaced_service_account.assert_not_called()
+
+
+@mock.patch.object(ClusterConfigGen, 'host', new_callable=mock.PropertyMock)
+@mock.patch.object(ClusterConfigGen, 'cluster_ca_cert', new_callable=mock.PropertyMock)
+@mock.patch('k8s_user.batch.kubernetes.client.CoreV1Api')
+def test__provision_service_accounts__creates_before_all_lists_complete(
+        mock_CoreV1Api, mock_cluster_ca_cert, mock_host, informer_api_client, tmpdir):
+    mock_cluster_ca_cert.return_value = "<ca-cert-data>"
+    mock_host.return_value = "test-host"
+    mock_api = mock_CoreV1Api.return_value
+    fast_created = threading.Event()
+
+    def list_sas(namespace, **kwargs):
+        # the slow namespace's LIST only completes once a user of the fast
+        # namespace has been created
+        if namespace == "slow":
+            assert fast_created.wait(5)
+        return _sa_list()
+    mock_api.list_namespaced_service_account.side_effect = list_sas
+
+    def create(namespace, body):
+        if namespace == "fast":
+            fast_created.set()
+    mock_api.create_namespaced_service_account.side_effect = create
+
+    def request_token(self, api_client, audiences=None, expiration_seconds=None):
+        return f"token-{self.name}-{self.namespace}"
+
+    with mock.patch.object(SAResource, 'request_token', request_token):
+        results = list(provision_service_accounts(
+            informer_api_client, ["joe"], ["slow", "fast"], out_dir=str(tmpdir),
+            max_workers=4))
+
+    assert [(r.namespace, r.error) for r in results] == [("fast", None), ("slow", None)]
+
+
+@mock.patch.object(ClusterConfigGen, 'host', new_callable=mock.PropertyMock)
+@mock.patch.object(ClusterConfigGen, 'cluster_ca_cert', new_callable=mock.PropertyMock)
+def test__create_users__stress(mock_cluster_ca_cert, mock_host, tmpdir):
+    mock_cluster_ca_cert.return_value = "<ca-cert-data>"
+    mock_host.return_value = "test-host"
+    users = {f"user{i}": CSRK8sUser(f"user{i}") for i in range(200)}
+
+    def get_cert(self, *args, **kwargs):
+        # the CSR resource is named after its user
+        cert = get_self_signed_cert_for_key(users[self.name].candk.key.key)
+        return base64.b64encode(cert.public_bytes(serialization.Encoding.PEM))
+
+    metadata = {"labels": {"team": "a"}}
+    histograms = StepHistograms()
+    with mock.patch.object(CSRResource, 'get_cert', get_cert):
+        results = list(create_users(
+            mock.MagicMock(),
+            [(user, {
+                "key_profile": "ec-p256",
+                "metadata": metadata,
+                "out_kubeconfig": os.path.join(str(tmpdir), f"{name}.yaml"),
+            }) for name, user in users.items()],
+            max_workers=64,
+            histograms=histograms,
+        ))
+
+    assert sorted(result.user_name for result in results) == sorted(users)
+    assert [result.error for result in results if result.error] == []
+    assert metadata == {"labels": {"team": "a"}}
+    step_metrics = histograms.to_dict()
+    assert step_metrics["get_csr_and_key"]["count"] == 200
+    assert step_metrics["save_kubeconfig"]["count"] == 200
+    for name, user in users.items():
+        with open(os.path.join(str(tmpdir), f"{name}.yaml")) as c:
+            kubeconfig_user = yaml.safe_load(c)["users"][0]
+        assert kubeconfig_user["name"] == name
+        cert = x509.load_pem_x509_certificate(
+            base64.b64decode(kubeconfig_user["user"]["client-certificate-data"]))
+        key = serialization.load_pem_private_key(
+            base64.b64decode(kubeconfig_user["user"]["client-key-data"]), password=None)
+        assert cert.public_key().public_numbers() == key.public_key().public_numbers()
+        assert user.csr_resource.get_text().metadata.name == name
+
+
+def test__create_users__error_is_reported():
+    user = mock.Mock(spec=CSRK8sUser)
+    user.name = "baduser"
+    user.create.side_effect = ValueError("boom")
+
+    results = list(create_users(mock.Mock(), [(user, {})]))
+
+    assert results[0].user_name == "baduser"
+    assert isinstance(results[0].error, ValueError)
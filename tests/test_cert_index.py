@@ -0,0 +1,144 @@
+import os
+import shutil
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+import pytest
+from cryptography.hazmat.primitives import serialization
+from k8s_user.cert_index import CertIndex, _parse_time, read_cert_fields
+from k8s_user.pki import Cert
+from .utils import get_self_signed_cert
+
+
+FIXTURE_DIR = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    'fixtures',
+    )
+
+
+@pytest.mark.parametrize("fixture", ["03_cert.pem", "test04.crt.pem"])
+def test__read_cert_fields(fixture):
+    ct = Cert(crt_file=os.path.join(FIXTURE_DIR, fixture))
+    fields = read_cert_fields(ct.der)
+    assert fields["subject"] == ct.subject
+    assert fields["serial"] == ct.crt.serial_number
+    assert fields["not_before"] == int(
+        ct.crt.not_valid_before.replace(tzinfo=timezone.utc).timestamp())
+    assert fields["not_after"] == int(
+        ct.crt.not_valid_after.replace(tzinfo=timezone.utc).timestamp())
+
+
+def test__read_cert_fields__self_signed():
+    cert = get_self_signed_cert(os.path.join(FIXTURE_DIR, "test04.key.pem"))
+    fields = read_cert_fields(cert.public_bytes(serialization.Encoding.DER))
+    assert fields["subject"] == cert.subject.rfc4514_string()
+    assert fields["serial"] == cert.serial_number
+
+
+def _make_creds_dir(tmp_path):
+    shutil.copy(os.path.join(FIXTURE_DIR, "03_cert.pem"), tmp_path / "jane.crt.pem")
+    shutil.copy(os.path.join(FIXTURE_DIR, "test04.crt.pem"), tmp_path / "joe.crt.pem")
+    shutil.copy(os.path.join(FIXTURE_DIR, "test04.key.pem"), tmp_path / "joe.key.pem")
+    return tmp_path
+
+
+def test__certindex__update(tmp_path):
+    creds_dir = _make_creds_dir(tmp_path)
+    index = CertIndex(str(creds_dir))
+    assert index.update() == 2
+    assert sorted(index.records) == ["jane.crt.pem", "joe.crt.pem"]
+    assert os.path.exists(index.index_path)
+
+    # a fresh index loads the saved records and re-reads nothing
+    index = CertIndex(str(creds_dir))
+    with mock.patch("k8s_user.cert_index.read_cert_file_fields") as mock_read:
+        assert index.update() == 0
+        mock_read.assert_not_called()
+
+
+def test__certindex__update__changed_and_removed(tmp_path):
+    creds_dir = _make_creds_dir(tmp_path)
+    index = CertIndex(str(creds_dir))
+    index.update()
+
+    shutil.copy(os.path.join(FIXTURE_DIR, "test04.crt.pem"), creds_dir / "jane.crt.pem")
+    stat = os.stat(creds_dir / "jane.crt.pem")
+    os.utime(creds_dir / "jane.crt.pem", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    os.remove(creds_dir / "joe.crt.pem")
+
+    assert index.update() == 1
+    assert list(index.records) == ["jane.crt.pem"]
+    joe = Cert(crt_file=os.path.join(FIXTURE_DIR, "test04.crt.pem"))
+    assert index.records["jane.crt.pem"]["serial"] == joe.crt.serial_number
+
+
+def test__certindex__update__unreadable(tmp_path):
+    (tmp_path / "bad.crt.pem").write_text(
+        "-----BEGIN CERTIFICATE-----\nAAAA\n-----END CERTIFICATE-----\n")
+    index = CertIndex(str(tmp_path))
+    assert index.update() == 0
+    assert "bad.crt.pem" in index.errors
+
+
+def test__certindex__update__became_unreadable(tmp_path):
+    creds_dir = _make_creds_dir(tmp_path)
+    index = CertIndex(str(creds_dir))
+    index.update()
+
+    (creds_dir / "jane.crt.pem").write_text(
+        "-----BEGIN CERTIFICATE-----\nAAAA\n-----END CERTIFICATE-----\n")
+    assert index.update() == 0
+    assert "jane.crt.pem" in index.errors
+
+    # the stale record is dropped from the saved index too
+    assert list(CertIndex(str(creds_dir)).records) == ["joe.crt.pem"]
+
+
+def test__certindex__update__os_errors(tmp_path):
+    creds_dir = _make_creds_dir(tmp_path)
+    index = CertIndex(str(creds_dir))
+
+    def read(path):
+        if path.endswith("jane.crt.pem"):
+            raise PermissionError(13, "Permission denied")
+        raise FileNotFoundError(2, "No such file or directory")
+    with mock.patch("k8s_user.cert_index.read_cert_file_fields", side_effect=read):
+        assert index.update() == 0
+    assert sorted(index.errors) == ["jane.crt.pem", "joe.crt.pem"]
+    assert "Permission denied" in index.errors["jane.crt.pem"]
+
+
+def test__certindex__load__corrupt(tmp_path):
+    creds_dir = _make_creds_dir(tmp_path)
+    (creds_dir / CertIndex.INDEX_FILE_NAME).write_text('{"jane.crt.pem": {"subj')
+    index = CertIndex(str(creds_dir))
+    assert index.records == {}
+    assert index.update() == 2
+
+
+@pytest.mark.parametrize("utc_time, year", [
+    (b"500101000000Z", 1950),
+    (b"680101000000Z", 1968),
+    (b"991231235959Z", 1999),
+    (b"000101000000Z", 2000),
+    (b"490101000000Z", 2049),
+])
+def test__parse_time__utctime_century(utc_time, year):
+    epoch = _parse_time(0x17, utc_time)
+    assert datetime.fromtimestamp(epoch, timezone.utc).year == year
+
+
+def test__certindex__expiring_within(tmp_path):
+    creds_dir = _make_creds_dir(tmp_path)
+    index = CertIndex(str(creds_dir))
+    index.update()
+    entries = {e.path: e for e in index.entries()}
+    jane = entries[str(creds_dir / "jane.crt.pem")]
+    joe = entries[str(creds_dir / "joe.crt.pem")]
+    first, last = sorted([jane, joe], key=lambda e: e.not_after)
+
+    now = first.not_after - timedelta(days=5)
+    assert index.expiring_within(1, now=now) == []
+    assert [e.path for e in index.expiring_within(6, now=now)] == [first.path]
+
+    now = last.not_after + timedelta(days=1)
+    assert [e.path for e in index.expiring_within(0, now=now)] == [first.path, last.path]
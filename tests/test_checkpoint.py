@@ -0,0 +1,58 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from k8s_user.checkpoint import Checkpoint, csr_fingerprint, get_checkpoint
+from k8s_user.pki import CSRandKey
+
+
+def test__checkpoint(tmpdir):
+    checkpoint = Checkpoint(str(tmpdir), "joe")
+    assert not checkpoint.resumed
+    assert not os.path.exists(checkpoint.path)
+
+    checkpoint.update(key_pem=b"key", csr_resource="joe")
+    checkpoint.step_done("get_csr_and_key", "save_key")
+
+    loaded = Checkpoint(str(tmpdir), "joe")
+    assert loaded.resumed
+    assert loaded.is_completed("get_csr_and_key")
+    assert not loaded.is_completed("save_key")
+    assert loaded.next_step("get_csr_and_key") == "save_key"
+    assert loaded.get_bytes("key_pem") == b"key"
+    assert loaded.get("csr_resource") == "joe"
+    assert loaded.get_bytes("cert_pem") is None
+    assert os.stat(loaded.path).st_mode & 0o777 == 0o600
+
+    loaded.clear()
+    assert not os.path.exists(loaded.path)
+    assert not loaded.resumed
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test__csr_fingerprint():
+    candk = CSRandKey(common_name="joe", key_profile="ec-p256")
+    assert csr_fingerprint(candk.csr) == csr_fingerprint(candk.csr)
+    assert len(csr_fingerprint(candk.csr)) == 64
+
+
+def test__get_checkpoint(tmpdir):
+    class FakeUser:
+        name = "joe"
+
+    assert get_checkpoint({"user": FakeUser()}) is None
+    checkpoint = get_checkpoint({"user": FakeUser(), "checkpoint_dir": str(tmpdir)})
+    assert checkpoint.path == os.path.join(str(tmpdir), "joe.checkpoint.json")
+
+
+def test__checkpoint__concurrent_updates(tmpdir):
+    checkpoint = Checkpoint(str(tmpdir), "joe")
+
+    def work(i):
+        checkpoint.update(**{f"field{i}": str(i)})
+        checkpoint.step_done(f"step{i}", None)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(work, range(100)))
+
+    loaded = Checkpoint(str(tmpdir), "joe")
+    assert len(loaded.state["steps"]) == 100
+    assert all(loaded.get(f"field{i}") == str(i) for i in range(100))
@@ -0,0 +1,54 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from k8s_user.executors import ExecutorScope
+
+
+def test__executor_scope__owns_executor():
+    executor_class = mock.Mock()
+    with ExecutorScope(max_workers=3, executor_class=executor_class) as scope:
+        assert scope.executor is executor_class.return_value
+
+    executor_class.assert_called_once_with(max_workers=3)
+    scope.executor.shutdown.assert_called_once_with(wait=False)
+
+
+def test__executor_scope__given_executor():
+    executor = mock.Mock()
+    with ExecutorScope(executor) as scope:
+        scope.futures[scope.submit(len, "abc")] = "abc"
+
+    executor.submit.assert_called_once_with(len, "abc")
+    assert scope.futures == {executor.submit.return_value: "abc"}
+    executor.submit.return_value.cancel.assert_called_once_with()
+    executor.shutdown.assert_not_called()
+
+
+def test__executor_scope__cancels_queued_futures():
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with ExecutorScope(executor) as scope:
+            running = scope.submit(release.wait, 5)
+            queued = scope.submit(len, "abc")
+        release.set()
+
+    assert running.result() is True
+    assert queued.cancelled()
+
+
+def test__executor_scope__wait():
+    started = threading.Event()
+    release = threading.Event()
+
+    def _step():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    scope = ExecutorScope(max_workers=1, wait=True)
+    running = scope.submit(_step)
+    assert started.wait(5)
+    threading.Timer(0.1, release.set).start()
+    scope.close()
+
+    assert running.done() and running.result() == "done"
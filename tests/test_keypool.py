@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey
+from k8s_user.keypool import KeyPool
+from k8s_user.pki import CSRandKey, Key
+
+
+def test__keypool__get__miss():
+    with KeyPool(size=1, executor=ThreadPoolExecutor(1)) as pool:
+        key = pool.get(key_size=2048)
+        assert isinstance(key, RSAPrivateKey)
+        assert key.key_size == 2048
+        assert pool.stats.misses == 1
+        assert pool.stats.hits == 0
+
+
+def test__keypool__get__hit():
+    with KeyPool(size=2, executor=ThreadPoolExecutor(2)) as pool:
+        pool.fill(key_size=2048)
+        assert pool.wait(key_size=2048, timeout=30)
+        assert pool.ready(key_size=2048) == 2
+        key = pool.get(key_size=2048)
+        assert key.key_size == 2048
+        assert pool.stats.hits == 1
+        assert pool.stats.misses == 0
+        assert pool.stats.refills >= 2
+        assert pool.stats.refill_latency_max >= pool.stats.refill_latency_mean > 0
+
+
+def test__keypool__get__refills_after_take():
+    with KeyPool(size=1, executor=ThreadPoolExecutor(1)) as pool:
+        pool.get(key_size=2048)
+        assert pool.wait(key_size=2048, timeout=30)
+        assert pool.ready(key_size=2048) == 1
+
+
+def test__keypool__process_pool():
+    with KeyPool(size=1, max_workers=1) as pool:
+        pool.fill(key_size=2048)
+        assert pool.wait(key_size=2048, timeout=60)
+        assert pool.get(key_size=2048).key_size == 2048
+        assert pool.stats.hits == 1
+
+
+def test__key__key_pool():
+    with KeyPool(size=1, executor=ThreadPoolExecutor(1)) as pool:
+        pool.fill(key_size=2048)
+        pool.wait(key_size=2048, timeout=30)
+        k = Key(key_size=2048, key_pool=pool)
+        assert k.created
+        assert k.key.key_size == 2048
+        assert pool.stats.hits == 1
+
+
+def test__csrandkey__key_pool():
+    with KeyPool(size=1, executor=ThreadPoolExecutor(1)) as pool:
+        ck = CSRandKey(common_name="joe", key_size=2048, key_pool=pool)
+        assert (
+            ck.key.key.public_key().public_numbers().n ==
+            ck.csr.csr.public_key().public_numbers().n
+        )
+        assert pool.stats.misses == 1
+
+
+def test__keypool__get__ec():
+    with KeyPool(size=1, executor=ThreadPoolExecutor(1)) as pool:
+        pool.fill(algorithm="ec", key_size=256)
+        assert pool.wait(algorithm="ec", key_size=256, timeout=30)
+        k = Key(key_profile="ec-p256", key_pool=pool)
+        assert k.key.curve.name == "secp256r1"
+        assert pool.stats.hits == 1
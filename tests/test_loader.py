@@ -0,0 +1,84 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from k8s_user.loader import (
+    iter_pem_blocks, iter_pem_file, load_bundle, load_directory, parse_pem_block)
+from k8s_user.pki import Cert, CSR, Key
+
+
+FIXTURE_DIR = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    'fixtures',
+    )
+
+
+def _read_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), "rb") as f:
+        return f.read().strip() + b"\n"
+
+
+def test__iter_pem_blocks():
+    data = b"junk\n" + _read_fixture("03_cert.pem") + _read_fixture("test04.csr.pem")
+    blocks = list(iter_pem_blocks(data))
+    assert [label for label, _ in blocks] == ["CERTIFICATE", "CERTIFICATE REQUEST"]
+    assert blocks[0][1] == _read_fixture("03_cert.pem")
+
+
+def test__iter_pem_file__empty(tmp_path):
+    empty = tmp_path / "empty.pem"
+    empty.write_bytes(b"")
+    assert list(iter_pem_file(str(empty))) == []
+
+
+@pytest.mark.parametrize("fixture,klass",
+[
+    pytest.param("03_cert.pem", Cert),
+    pytest.param("test04.csr.pem", CSR),
+    pytest.param("test04.key.pem", Key),
+])
+def test__parse_pem_block(fixture, klass):
+    [(label, block)] = iter_pem_blocks(_read_fixture(fixture))
+    assert isinstance(parse_pem_block(label, block), klass)
+
+
+def test__parse_pem_block__unsupported():
+    with pytest.raises(ValueError):
+        parse_pem_block("X509 CRL", b"")
+
+
+def test__load_bundle(tmp_path):
+    bundle = tmp_path / "ca-bundle.pem"
+    bundle.write_bytes(_read_fixture("03_cert.pem") + _read_fixture("test04.crt.pem"))
+    certs = list(load_bundle(str(bundle)))
+    assert [type(c) for c in certs] == [Cert, Cert]
+    assert certs[0].crt.serial_number == 61276984187087310175771381080539889888
+
+
+def test__load_directory(tmp_path):
+    for suffix in ("key", "csr", "crt"):
+        shutil.copy(
+            os.path.join(FIXTURE_DIR, f"test04.{suffix}.pem"),
+            tmp_path / f"joe.{suffix}.pem")
+    shutil.copy(os.path.join(FIXTURE_DIR, "03_cert.pem"), tmp_path / "jane.crt.pem")
+    (tmp_path / "notes.txt").write_text("not a pem")
+
+    users = {
+        u.user_name: u
+        for u in load_directory(str(tmp_path), executor=ThreadPoolExecutor(2))
+    }
+    assert sorted(users) == ["jane", "joe"]
+
+    joe = users["joe"]
+    assert isinstance(joe.key, Key)
+    assert joe.csr.key is joe.key
+    assert (
+        joe.key.key.public_key().public_numbers() ==
+        joe.csr.csr.public_key().public_numbers()
+    )
+    assert isinstance(joe.cert, Cert)
+
+    jane = users["jane"]
+    assert jane.key is None
+    assert jane.csr is None
+    assert jane.cert.subject == "CN=john2,O=jazstudios"
@@ -0,0 +1,82 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from cryptography.x509.oid import ExtendedKeyUsageOID
+from k8s_user.local_ca import LocalCA
+from k8s_user.pki import Cert, CSR, Key
+from k8s_user.verify import is_signed_by, verify_user
+from .utils import get_self_signed_cert_for_key
+
+
+def _local_ca(key_profile="ec-p256", **kwargs):
+    ca_key = Key(key_profile=key_profile)
+    ca_cert = Cert(crt_data=get_self_signed_cert_for_key(ca_key.key).public_bytes(
+        serialization.Encoding.PEM))
+    return LocalCA(ca_cert=ca_cert, ca_key=ca_key, **kwargs)
+
+
+@pytest.mark.parametrize("key_profile", ["rsa-2048", "ec-p256", "ed25519"])
+def test__localca__sign(key_profile):
+    local_ca = _local_ca()
+    k = Key(key_profile=key_profile)
+    csr = CSR(key=k, common_name="joe", additional_subject={"O": "devs"},
+              dnsnames=["joe.example.com"])
+    cert = local_ca.sign(csr)
+    assert cert.subject == "O=devs,CN=joe"
+    assert is_signed_by(cert.crt, local_ca.ca_cert.crt)
+    assert verify_user("joe", key=k, csr=csr, cert=cert, ca_cert=local_ca.ca_cert).ok
+    eku = cert.crt.extensions.get_extension_for_class(x509.ExtendedKeyUsage)
+    assert list(eku.value) == [ExtendedKeyUsageOID.CLIENT_AUTH]
+    san = cert.crt.extensions.get_extension_for_class(x509.SubjectAlternativeName)
+    assert san.value.get_values_for_type(x509.DNSName) == ["joe.example.com"]
+
+
+def test__localca__sign__ed25519_ca():
+    local_ca = _local_ca("ed25519")
+    cert = local_ca.sign(CSR(key=Key(key_profile="ec-p256"), common_name="joe"))
+    assert is_signed_by(cert.crt, local_ca.ca_cert.crt)
+
+
+def test__localca__days():
+    local_ca = _local_ca(days=2)
+    cert = local_ca.sign(CSR(key=Key(key_profile="ec-p256"), common_name="joe"))
+    lifetime = cert.crt.not_valid_after - cert.crt.not_valid_before
+    assert 2 < lifetime.total_seconds() / 86400 < 2.1
+
+
+def test__localca__files(tmp_path):
+    local_ca = _local_ca()
+    local_ca.ca_cert.save(str(tmp_path / "ca.crt"))
+    local_ca.ca_key.save(str(tmp_path / "ca.key"))
+    loaded = LocalCA(ca_cert_file=str(tmp_path / "ca.crt"), ca_key_file=str(tmp_path / "ca.key"))
+    cert = loaded.sign(CSR(key=Key(key_profile="ec-p256"), common_name="joe"))
+    assert is_signed_by(cert.crt, local_ca.ca_cert.crt)
+
+
+def test__localca__ca_key_required():
+    ca_cert = _local_ca().ca_cert
+    with pytest.raises(ValueError, match="ca_key"):
+        LocalCA(ca_cert=ca_cert)
+
+
+def test__localca__ca_key_mismatch():
+    ca_cert = _local_ca().ca_cert
+    with pytest.raises(ValueError, match="does not belong"):
+        LocalCA(ca_cert=ca_cert, ca_key=Key(key_profile="ec-p256"))
+
+
+@pytest.mark.parametrize("executor_factory", [
+    pytest.param(lambda: ThreadPoolExecutor(2), id="threads"),
+    pytest.param(lambda: None, id="processes"),
+])
+def test__localca__sign_many(executor_factory):
+    local_ca = _local_ca()
+    csrs = [(name, CSR(key=Key(key_profile="ec-p256"), common_name=name).pem)
+            for name in ["joe", "jane", "jim"]]
+    results = dict(local_ca.sign_many(csrs, max_workers=2, executor=executor_factory()))
+    assert sorted(results) == ["jane", "jim", "joe"]
+    for name, cert_pem in results.items():
+        cert = Cert(crt_data=cert_pem)
+        assert cert.subject == f"CN={name}"
+        assert is_signed_by(cert.crt, local_ca.ca_cert.crt)
@@ -0,0 +1,127 @@
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import pytest
+from k8s_user.k8s.polling import PollPolicy
+from k8s_user.metrics import (
+    StepHistograms, StepTimer, StepTiming, count_api_call, instrument_api_client,
+)
+from k8s_user.workflows import BaseStep, StepReturn
+
+
+def test__steptimer():
+    with StepTimer("outer") as outer:
+        count_api_call()
+        with StepTimer("inner") as inner:
+            count_api_call()
+            for attempt in PollPolicy(timeout=1, initial_delay=0).start():
+                if attempt == 2:
+                    break
+        count_api_call()
+
+    assert outer.timing.name == "outer"
+    assert outer.timing.api_calls == 2
+    assert outer.timing.poll_iterations == 0
+    assert inner.timing.api_calls == 1
+    assert inner.timing.poll_iterations == 3
+    assert outer.timing.seconds >= inner.timing.seconds >= 0
+    assert outer.timing.error is None
+
+
+def test__steptimer__error():
+    timer = StepTimer("failing")
+    with pytest.raises(ValueError):
+        with timer:
+            raise ValueError("boom")
+    assert timer.timing.error == "ValueError"
+    count_api_call()  # outside of a step, this is a no-op
+
+
+def test__instrument_api_client():
+    api_client = mock.Mock()
+    call_api = api_client.call_api
+    instrument_api_client(api_client)
+    instrument_api_client(api_client)
+
+    with StepTimer("step") as timer:
+        api_client.call_api("/api/v1/namespaces", "GET")
+    assert timer.timing.api_calls == 1
+    call_api.assert_called_once_with("/api/v1/namespaces", "GET")
+
+
+def test__basestep__records_timing():
+    class Step(BaseStep):
+        name = "step"
+
+        def run(self):
+            self.api_client.call_api("/api", "GET")
+            return StepReturn(next_step=None, message="")
+
+    user = mock.Mock(step_timings=[])
+    api_client = instrument_api_client(mock.Mock())
+    Step({"user": user, "api_client": api_client})._run()
+
+    assert len(user.step_timings) == 1
+    assert user.step_timings[0].name == "step"
+    assert user.step_timings[0].api_calls == 1
+
+
+def test__stephistograms(tmpdir):
+    histograms = StepHistograms(buckets=(0.1, 1))
+    histograms.observe(StepTiming("get_cert", 0.05, 2, 1, None))
+    histograms.observe(StepTiming("get_cert", 0.5, 3, 4, None))
+    histograms.observe_user(mock.Mock(step_timings=[
+        StepTiming("get_cert", 5, 1, 10, "TimeoutError"),
+        StepTiming("save_key", 0.1, 0, 0, None),
+    ]))
+
+    assert histograms.to_dict() == {
+        "get_cert": {
+            "count": 3, "sum_seconds": 5.55, "api_calls": 6, "poll_iterations": 15,
+            "errors": 1, "buckets": {"0.1": 1, "1": 2, "+Inf": 3},
+        },
+        "save_key": {
+            "count": 1, "sum_seconds": 0.1, "api_calls": 0, "poll_iterations": 0,
+            "errors": 0, "buckets": {"0.1": 1, "1": 1, "+Inf": 1},
+        },
+    }
+    text = histograms.to_prometheus()
+    assert 'k8s_user_step_duration_seconds_bucket{step="get_cert",le="1"} 2\n' in text
+    assert 'k8s_user_step_duration_seconds_count{step="save_key"} 1\n' in text
+    assert 'k8s_user_step_poll_iterations_total{step="get_cert"} 15\n' in text
+
+    json_path = os.path.join(str(tmpdir), "metrics.json")
+    textfile_path = os.path.join(str(tmpdir), "k8s_user.prom")
+    histograms.write_json(json_path)
+    histograms.write_prometheus_textfile(textfile_path)
+    with open(json_path) as f:
+        assert json.load(f) == histograms.to_dict()
+    with open(textfile_path) as f:
+        assert f.read() == text
+    assert sorted(os.listdir(str(tmpdir))) == ["k8s_user.prom", "metrics.json"]
+
+
+def test__instrument_api_client__concurrent():
+    api_client = mock.Mock()
+    call_api = api_client.call_api
+    barrier = threading.Barrier(8)
+
+    def instrument():
+        barrier.wait()
+        instrument_api_client(api_client)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: instrument(), range(8)))
+
+    with StepTimer("step") as timer:
+        api_client.call_api("/api", "GET")
+    assert timer.timing.api_calls == 1
+    call_api.assert_called_once_with("/api", "GET")
+
+
+def test__steptimer__extra_seconds():
+    with StepTimer("step", extra_seconds=2) as timer:
+        pass
+    assert 2 <= timer.timing.seconds < 3
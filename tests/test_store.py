@@ -0,0 +1,91 @@
+import os
+from datetime import datetime, timedelta, timezone
+import pytest
+from cryptography.hazmat.primitives import serialization
+from k8s_user.pki import Cert, CSR, Key
+from k8s_user.store import CredentialStore
+from .utils import get_self_signed_cert_for_key
+
+
+FIXTURE_DIR = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    'fixtures',
+    )
+
+
+@pytest.fixture
+def store(tmp_path):
+    with CredentialStore(str(tmp_path / "creds.sqlite")) as store:
+        yield store
+
+
+def test__credentialstore__key(store):
+    k = Key(key_profile="ec-p256")
+    store.save_key("joe", "dev", k)
+    stored = store.get("joe", "dev")
+    assert stored.key_pem == k.pem
+    assert not stored.key_encrypted
+    assert store.load_key("joe", "dev").pem == k.pem
+    assert store.load_key("joe", "prod") is None
+
+
+def test__credentialstore__default_cluster(store):
+    k = Key(key_profile="ec-p256")
+    store.save_key("joe", None, k)
+    assert store.get("joe", "default").key_pem == k.pem
+    assert store.load_key("joe", None).pem == k.pem
+
+
+def test__credentialstore__key__encrypted(tmp_path):
+    k = Key(key_profile="ec-p256")
+    with CredentialStore(str(tmp_path / "creds.sqlite"), key_password="secret") as store:
+        store.save_key("joe", "dev", k)
+        stored = store.get("joe", "dev")
+        assert stored.key_encrypted
+        assert b"ENCRYPTED" in stored.key_pem
+        assert store.load_key("joe", "dev").pem == k.pem
+
+
+def test__credentialstore__csr_cert(store):
+    k = Key(key_profile="ec-p256")
+    store.save_key("joe", "dev", k)
+    csr = CSR(key=k, common_name="joe")
+    store.save_csr("joe", "dev", csr)
+    cert = Cert(crt_data=get_self_signed_cert_for_key(k.key).public_bytes(
+        serialization.Encoding.PEM))
+    store.save_cert("joe", "dev", cert)
+
+    stored = store.get("joe", "dev")
+    assert stored.kind == "csr"
+    assert stored.key_pem == k.pem
+    assert stored.csr_pem == csr.pem
+    assert stored.cert_pem == cert.pem
+    assert stored.not_after == int(cert.crt.not_valid_after.replace(
+        tzinfo=timezone.utc).timestamp())
+    assert store.load_cert("joe", "dev").pem == cert.pem
+
+
+def test__credentialstore__token_kubeconfig(store):
+    store.save_token("jane", "dev", "mytoken", "default")
+    store.save_kubeconfig("jane", "dev", "jane-kubeconfig.yaml", "dev-context")
+    stored = store.get("jane", "dev")
+    assert stored.kind == "sa"
+    assert stored.token == "mytoken"
+    assert stored.namespace == "default"
+    assert stored.kubeconfig_path == "jane-kubeconfig.yaml"
+    assert stored.context_name == "dev-context"
+
+
+def test__credentialstore__find(store):
+    k = Key(key_profile="ec-p256")
+    cert = Cert(crt_data=get_self_signed_cert_for_key(k.key).public_bytes(
+        serialization.Encoding.PEM))
+    store.save_cert("joe", "dev", cert)
+    store.save_cert("joe", "prod", cert)
+    store.save_token("jane", "dev", "mytoken", "default")
+
+    assert [(c.name, c.cluster) for c in store.find(cluster="dev", kind="csr")] == [("joe", "dev")]
+    assert sorted(c.cluster for c in store.find(name="joe")) == ["dev", "prod"]
+    soon = datetime.now(timezone.utc) + timedelta(days=30)
+    assert len(store.find(expires_before=soon)) == 2
+    assert store.find(expires_before=datetime.now(timezone.utc)) == []
@@ -0,0 +1,140 @@
+import datetime
+import os
+import shutil
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.x509.oid import NameOID
+from k8s_user.pki import Cert, CSR, Key
+from k8s_user.verify import is_signed_by, verify_directory, verify_user
+from .utils import get_self_signed_cert_for_key
+
+
+FIXTURE_DIR = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    'fixtures',
+    )
+
+
+def _issue(ca_key, ca_crt, csr):
+    now = datetime.datetime.utcnow()
+    crt = (
+        x509.CertificateBuilder()
+        .subject_name(csr.csr.subject)
+        .issuer_name(ca_crt.subject)
+        .public_key(csr.csr.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(ca_key.key, hashes.SHA256(), default_backend())
+    )
+    return Cert(crt_data=crt.public_bytes(serialization.Encoding.PEM))
+
+
+def _ca(key_profile="ec-p256"):
+    ca_key = Key(key_profile=key_profile)
+    ca_crt = get_self_signed_cert_for_key(ca_key.key)
+    return ca_key, Cert(crt_data=ca_crt.public_bytes(serialization.Encoding.PEM))
+
+
+def test__verify_user__ok():
+    ca_key, ca_cert = _ca()
+    k = Key(key_profile="ec-p256")
+    csr = CSR(key=k, common_name="joe")
+    cert = _issue(ca_key, ca_cert.crt, csr)
+    result = verify_user("joe", key=k, csr=csr, cert=cert, ca_cert=ca_cert)
+    assert result.ok
+    assert result.errors == []
+
+
+def test__verify_user__mismatch():
+    k = Key(key_file=os.path.join(FIXTURE_DIR, "test04.key.pem"))
+    csr = CSR(key=None, common_name="joe", csr_file=os.path.join(FIXTURE_DIR, "test04.csr.pem"))
+    other = Key(key_profile="ec-p256")
+    result = verify_user("joe", key=other, csr=csr)
+    assert not result.ok
+    assert result.errors == ["csr public key does not match key"]
+    assert verify_user("joe", key=k, csr=csr).ok
+
+
+def test__verify_user__wrong_ca():
+    ca_key, ca_cert = _ca()
+    _, other_ca_cert = _ca("rsa-2048")
+    k = Key(key_profile="ec-p256")
+    csr = CSR(key=k, common_name="joe")
+    cert = _issue(ca_key, ca_cert.crt, csr)
+    result = verify_user("joe", key=k, cert=cert, ca_cert=other_ca_cert)
+    assert result.errors == ["cert is not issued by the cluster CA"]
+
+
+def test__is_signed_by__rsa():
+    ca_key, ca_cert = _ca("rsa-2048")
+    csr = CSR(key=Key(key_profile="ec-p256"), common_name="joe")
+    cert = _issue(ca_key, ca_cert.crt, csr)
+    assert is_signed_by(cert.crt, ca_cert.crt)
+    assert not is_signed_by(ca_cert.crt, cert.crt)
+
+
+def test__is_signed_by__rsa_pss():
+    ca_key, ca_cert = _ca("rsa-2048")
+    csr = CSR(key=Key(key_profile="ec-p256"), common_name="joe")
+    now = datetime.datetime.utcnow()
+    crt = (
+        x509.CertificateBuilder()
+        .subject_name(csr.csr.subject)
+        .issuer_name(ca_cert.crt.subject)
+        .public_key(csr.csr.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(ca_key.key, hashes.SHA256(), rsa_padding=padding.PSS(
+            mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.DIGEST_LENGTH))
+    )
+    assert is_signed_by(crt, ca_cert.crt)
+    _, other_ca_cert = _ca("rsa-2048")
+    assert not is_signed_by(crt, other_ca_cert.crt)
+
+
+class _PreV40Certificate:
+    """A certificate as seen on cryptography releases before 40"""
+
+    def __init__(self, crt):
+        self._crt = crt
+
+    def __getattr__(self, name):
+        if name == "verify_directly_issued_by":
+            raise AttributeError(name)
+        return getattr(self._crt, name)
+
+
+def test__is_signed_by__without_verify_directly_issued_by():
+    for key_profile in ("rsa-2048", "ec-p256"):
+        ca_key, ca_cert = _ca(key_profile)
+        csr = CSR(key=Key(key_profile="ec-p256"), common_name="joe")
+        cert = _issue(ca_key, ca_cert.crt, csr)
+        assert is_signed_by(_PreV40Certificate(cert.crt), ca_cert.crt)
+        _, other_ca_cert = _ca(key_profile)
+        assert not is_signed_by(_PreV40Certificate(cert.crt), other_ca_cert.crt)
+
+
+def test__verify_directory(tmp_path):
+    ca_key, ca_cert = _ca()
+    k = Key(key_profile="ec-p256")
+    csr = CSR(key=k, common_name="joe")
+    k.save(str(tmp_path / "joe.key.pem"))
+    csr.save(str(tmp_path / "joe.csr.pem"))
+    _issue(ca_key, ca_cert.crt, csr).save(str(tmp_path / "joe.crt.pem"))
+
+    Key(key_profile="ec-p256").save(str(tmp_path / "jane.key.pem"))
+    shutil.copy(os.path.join(FIXTURE_DIR, "test04.csr.pem"), tmp_path / "jane.csr.pem")
+    (tmp_path / "jim.crt.pem").write_text(
+        "-----BEGIN CERTIFICATE-----\nAAAA\n-----END CERTIFICATE-----\n")
+
+    results = {r.user_name: r for r in verify_directory(str(tmp_path), ca_cert=ca_cert)}
+    assert results["joe"].ok
+    assert results["jane"].errors == ["csr public key does not match key"]
+    assert not results["jim"].ok
+
+    results = list(verify_directory(str(tmp_path), user_names=["joe", "nobody"]))
+    assert sorted((r.user_name, r.ok) for r in results) == [("joe", True), ("nobody", False)]
@@ -3,6 +3,7 @@ from cryptography import x509
 from cryptography.x509.oid import NameOID
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519
 from cryptography.hazmat.backends import default_backend
 
 
@@ -14,6 +15,10 @@ def get_self_signed_cert(key_file):
     key = serialization.load_pem_private_key(
             key_data.encode('utf-8'), password=None, backend=default_backend()
         )
+    return get_self_signed_cert_for_key(key)
+
+
+def get_self_signed_cert_for_key(key):
 
     subject = issuer = x509.Name([
         x509.NameAttribute(NameOID.COUNTRY_NAME, u"US"),
@@ -39,6 +44,10 @@ def get_self_signed_cert(key_file):
         x509.SubjectAlternativeName([x509.DNSName(u"localhost")]),
         critical=False,
     # Sign our certificate with our private key
-    ).sign(key, hashes.SHA256(),  backend=default_backend())
+    ).sign(
+        key,
+        None if isinstance(key, ed25519.Ed25519PrivateKey) else hashes.SHA256(),
+        backend=default_backend(),
+    )
 
     return cert
\ No newline at end of file
@@ -0,0 +1,128 @@
+import os
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import base64
+from unittest import mock
+import pytest
+import yaml
+from cryptography.hazmat.primitives import serialization
+from k8s_user.user import CSRK8sUser
+from k8s_user.workflows.aio import (
+    AsyncUserCSRWorkflow, _PregeneratedKey, create_users,
+)
+from k8s_user.k8s.csr_resource import CSRResource
+from k8s_user.k8s.kubeconfig import ClusterConfigGen
+from k8s_user.keypool import _generate_key_pem
+from ..utils import get_self_signed_cert_for_key
+
+
+users_by_name = {}
+
+
+def mock_get_cert_func(self, *args, **kwargs):
+    # the CSR resource is named after the user, whose key is in candk
+    user = users_by_name[self.name]
+    cert = get_self_signed_cert_for_key(user.candk.key.key)
+    return base64.b64encode(cert.public_bytes(serialization.Encoding.PEM))
+
+
+@mock.patch.object(ClusterConfigGen, 'host', new_callable=mock.PropertyMock)
+@mock.patch.object(ClusterConfigGen, 'cluster_ca_cert', new_callable=mock.PropertyMock)
+def test_create_users(mock_cluster_ca_cert, mock_host, tmpdir):
+    mock_cluster_ca_cert.return_value = "<ca-cert-data>"
+    mock_host.return_value = "test-host"
+    users = [CSRK8sUser(f"user{i}") for i in range(4)]
+    users_by_name.update({user.name: user for user in users})
+
+    def inputs_for(user):
+        return {
+            "key_profile": "ec-p256",
+            "out_kubeconfig": os.path.join(str(tmpdir), f"{user.name}.yaml"),
+        }
+
+    with mock.patch.object(CSRResource, 'get_cert', mock_get_cert_func):
+        results = asyncio.run(create_users(
+            mock.MagicMock(),
+            [(user, inputs_for(user)) for user in users],
+            max_concurrency=2,
+        ))
+
+    assert [result.user_name for result in results] == [u.name for u in users]
+    assert all(result.error is None for result in results)
+    for user in users:
+        with open(inputs_for(user)["out_kubeconfig"]) as c:
+            kubeconfig_yaml = yaml.safe_load(c)
+        assert kubeconfig_yaml['users'][0]['name'] == user.name
+        assert user.candk.key.created
+        assert user.candk.key.algorithm == "ec"
+
+
+def test_create_users__error_is_reported(tmpdir):
+    user = CSRK8sUser("baduser")
+    inputs = {"in_csr": os.path.join(str(tmpdir), "missing.csr.pem")}
+
+    results = asyncio.run(create_users(mock.MagicMock(), [(user, inputs)]))
+
+    assert results[0].user_name == "baduser"
+    assert results[0].error is not None
+
+
+def test_asyncworkflow__step_instances_per_workflow():
+    first = AsyncUserCSRWorkflow(inputs={"user": CSRK8sUser("first")})
+    second = AsyncUserCSRWorkflow(inputs={"user": CSRK8sUser("second")})
+
+    first_step = first.step_instances[first.start_step]
+    second_step = second.step_instances[second.start_step]
+    assert first_step.user.name == "first"
+    assert second_step.user.name == "second"
+
+
+def test_pregeneratedkey():
+    key_pool = _PregeneratedKey("ec", 256, _generate_key_pem("ec", 256))
+
+    assert key_pool.get(algorithm="ec", key_size=256).curve.key_size == 256
+    with pytest.raises(ValueError):
+        key_pool.get(algorithm="rsa", key_size=2048)
+
+
+@mock.patch.object(ClusterConfigGen, 'host', new_callable=mock.PropertyMock)
+@mock.patch.object(ClusterConfigGen, 'cluster_ca_cert', new_callable=mock.PropertyMock)
+def test_create_users__keygen_is_timed(mock_cluster_ca_cert, mock_host, tmpdir):
+    mock_cluster_ca_cert.return_value = "<ca-cert-data>"
+    mock_host.return_value = "test-host"
+    user = CSRK8sUser("timeduser")
+    users_by_name[user.name] = user
+
+    def slow_generate_key_pem(algorithm, key_size):
+        time.sleep(0.3)
+        return _generate_key_pem(algorithm, key_size)
+
+    with mock.patch.object(CSRResource, 'get_cert', mock_get_cert_func), \
+            mock.patch('k8s_user.workflows.aio._generate_key_pem', slow_generate_key_pem):
+        results = asyncio.run(create_users(
+            mock.MagicMock(),
+            [(user, {
+                "key_profile": "ec-p256",
+                "out_kubeconfig": os.path.join(str(tmpdir), "timeduser.yaml"),
+            })],
+            process_executor=ThreadPoolExecutor(1),
+        ))
+
+    assert results[0].error is None
+    timing = user.step_timings[0]
+    assert timing.name == "get_csr_and_key"
+    assert timing.seconds >= 0.3
+
+
+def test_create_users__owns_process_pool():
+    process_executor = mock.Mock()
+    user = CSRK8sUser("baduser")
+    with mock.patch('k8s_user.workflows.aio.ProcessPoolExecutor',
+                    return_value=process_executor) as mock_ProcessPoolExecutor, \
+            mock.patch.object(CSRK8sUser, 'create_async') as mock_create_async:
+        asyncio.run(create_users(mock.MagicMock(), [(user, {})]))
+
+    mock_ProcessPoolExecutor.assert_called_once_with(max_workers=None)
+    assert mock_create_async.call_args[0][1]["process_executor"] is process_executor
+    process_executor.shutdown.assert_called_once_with(wait=False)
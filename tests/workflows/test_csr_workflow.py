@@ -1,12 +1,20 @@
 import os
 import base64
+import json
 from unittest import mock
+import pytest
 import yaml
+import kubernetes
+from kubernetes.client.rest import ApiException
 from cryptography.hazmat.primitives import serialization
-from k8s_user.workflows.csr_workflow import UserCSRWorkflow
+from k8s_user.workflows.csr_workflow import ParallelUserCSRWorkflow, UserCSRWorkflow
 from k8s_user.k8s.csr_resource import CSRResource
 from k8s_user.k8s.kubeconfig import CSRKubeConfig, ClusterConfigGen
-from ..utils import get_self_signed_cert
+from k8s_user.local_ca import LocalCA
+from k8s_user.pki import Cert, Key
+from k8s_user.store import CredentialStore
+from k8s_user.verify import is_signed_by
+from ..utils import get_self_signed_cert, get_self_signed_cert_for_key
 
 
 FIXTURE_DIR = os.path.join(
@@ -54,3 +62,352 @@ def test_usercsrworkflow(mock_cluster_ca_cert, mock_host, tmpdir):
 
         assert kubeconfig_yaml['clusters'][0]['cluster']['certificate-authority-data'] == '<ca-cert-data>'
         assert kubeconfig_yaml['clusters'][0]['cluster']['server'] == 'test-host'
+
+
+@mock.patch.object(ClusterConfigGen, 'host', new_callable=mock.PropertyMock)
+@mock.patch.object(ClusterConfigGen, 'cluster_ca_cert', new_callable=mock.PropertyMock)
+def test_usercsrworkflow__store(mock_cluster_ca_cert, mock_host, tmpdir):
+
+    mock_cluster_ca_cert.return_value = "<ca-cert-data>"
+    mock_host.return_value = "test-host"
+    kubeconfig_path = os.path.join(str(tmpdir), 'kubeconfig.yaml')
+    fuser = FakeUser()
+
+    def mock_get_cert_func(self, *args, **kwargs):
+        cert = get_self_signed_cert_for_key(fuser.candk.key.key)
+        return base64.b64encode(cert.public_bytes(serialization.Encoding.PEM))
+
+    with CredentialStore(os.path.join(str(tmpdir), "creds.sqlite")) as store:
+        inputs = {
+            "api_client": mock.MagicMock(),
+            "kubeconfig_klass": CSRKubeConfig,
+            "user": fuser,
+            "out_kubeconfig": kubeconfig_path,
+            "cluster_name": "dev",
+            "context_name": "dev-context",
+            "store": store,
+            "key_profile": "ec-p256",
+        }
+        with mock.patch.object(CSRResource, 'get_cert', mock_get_cert_func):
+            UserCSRWorkflow(inputs=inputs).start()
+
+        stored = store.get("fakename", "dev")
+        assert stored.key_pem == fuser.candk.key.pem
+        assert stored.csr_pem == fuser.candk.csr.pem
+        assert stored.cert_pem == fuser.crt.pem
+        assert stored.not_after
+        assert stored.kubeconfig_path == kubeconfig_path
+        assert stored.context_name == "dev-context"
+
+        # a second run reuses the stored key and csr
+        first_key_pem = fuser.candk.key.pem
+        os.remove(kubeconfig_path)
+        with mock.patch.object(CSRResource, 'get_cert', mock_get_cert_func):
+            UserCSRWorkflow(inputs=inputs).start()
+        assert not fuser.candk.key.created
+        assert fuser.candk.key.pem == first_key_pem
+
+
+@mock.patch.object(ClusterConfigGen, 'host', new_callable=mock.PropertyMock)
+@mock.patch.object(ClusterConfigGen, 'cluster_ca_cert', new_callable=mock.PropertyMock)
+def test_usercsrworkflow__store_and_creds_dir_rerun(mock_cluster_ca_cert, mock_host, tmpdir):
+    mock_cluster_ca_cert.return_value = "<ca-cert-data>"
+    mock_host.return_value = "test-host"
+    kubeconfig_path = os.path.join(str(tmpdir), 'kubeconfig.yaml')
+    key_path = os.path.join(str(tmpdir), 'fakename.key.pem')
+    fuser = FakeUser()
+
+    def mock_get_cert_func(self, *args, **kwargs):
+        cert = get_self_signed_cert_for_key(fuser.candk.key.key)
+        return base64.b64encode(cert.public_bytes(serialization.Encoding.PEM))
+
+    with CredentialStore(os.path.join(str(tmpdir), "creds.sqlite")) as store:
+        inputs = {
+            "api_client": mock.MagicMock(),
+            "kubeconfig_klass": CSRKubeConfig,
+            "user": fuser,
+            "creds_dir": str(tmpdir),
+            "out_kubeconfig": kubeconfig_path,
+            "store": store,
+            "key_profile": "ec-p256",
+        }
+        with mock.patch.object(CSRResource, 'get_cert', mock_get_cert_func):
+            UserCSRWorkflow(inputs=inputs).start()
+            first_key_pem = fuser.candk.key.pem
+            # without a cluster_name input, the store uses the default cluster
+            assert store.load_key(fuser.name, "default").pem == first_key_pem
+
+            # the stored key is the one in the key file, so the rerun succeeds
+            os.remove(kubeconfig_path)
+            UserCSRWorkflow(inputs=inputs).start()
+            assert not fuser.candk.key.created
+            with open(key_path, "rb") as f:
+                assert f.read() == first_key_pem
+
+            # a different key file is not overwritten
+            with open(key_path, "wb") as f:
+                f.write(b"another key")
+            os.remove(kubeconfig_path)
+            with pytest.raises(Exception, match="Key already exists"):
+                UserCSRWorkflow(inputs=inputs).start()
+
+
+def test_usercsrworkflow__in_csr_mismatch(tmpdir):
+    fuser = FakeUser()
+    csr_wf = UserCSRWorkflow(inputs={
+        "api_client": mock.MagicMock(),
+        "kubeconfig_klass": CSRKubeConfig,
+        "user": fuser,
+        "in_key": os.path.join(FIXTURE_DIR, "01_crypto_key.pem"),
+        "in_csr": os.path.join(FIXTURE_DIR, "test04.csr.pem"),
+        "out_kubeconfig": os.path.join(str(tmpdir), 'kubeconfig.yaml'),
+    })
+    with mock.patch.object(CSRResource, 'resource_exists') as mock_resource_exists:
+        with pytest.raises(ValueError):
+            csr_wf.start()
+        mock_resource_exists.assert_not_called()
+
+
+@mock.patch.object(ClusterConfigGen, 'host', new_callable=mock.PropertyMock)
+@mock.patch.object(ClusterConfigGen, 'cluster_ca_cert', new_callable=mock.PropertyMock)
+def test_usercsrworkflow__local_ca(mock_cluster_ca_cert, mock_host, tmpdir):
+
+    mock_cluster_ca_cert.return_value = "<ca-cert-data>"
+    mock_host.return_value = "test-host"
+    kubeconfig_path = os.path.join(str(tmpdir), 'kubeconfig.yaml')
+
+    ca_key = Key(key_profile="ec-p256")
+    ca_cert = Cert(crt_data=get_self_signed_cert_for_key(ca_key.key).public_bytes(
+        serialization.Encoding.PEM))
+    local_ca = LocalCA(ca_cert=ca_cert, ca_key=ca_key)
+
+    fuser = FakeUser()
+    with mock.patch.object(CSRResource, 'resource_exists') as mock_exists, \
+            mock.patch.object(CSRResource, 'create') as mock_create, \
+            mock.patch.object(CSRResource, 'approve') as mock_approve, \
+            mock.patch.object(CSRResource, 'get_cert') as mock_get_cert:
+        UserCSRWorkflow(inputs={
+            "api_client": mock.MagicMock(),
+            "kubeconfig_klass": CSRKubeConfig,
+            "user": fuser,
+            "out_kubeconfig": kubeconfig_path,
+            "key_profile": "ec-p256",
+            "local_ca": local_ca,
+        }).start()
+        for api_mock in [mock_exists, mock_create, mock_approve, mock_get_cert]:
+            api_mock.assert_not_called()
+
+    # CSR resources carry the managed-by label the sweeper selects on
+    assert fuser.csr_resource.get_text().metadata.labels == {
+        "app.kubernetes.io/managed-by": "k8s_user"}
+
+    with open(kubeconfig_path) as c:
+        kubeconfig_yaml = (yaml.safe_load(c))
+    crt = Cert(crt_data=base64.b64decode(
+        kubeconfig_yaml['users'][0]['user']['client-certificate-data']))
+    assert crt.subject == "CN=fakename"
+    assert is_signed_by(crt.crt, ca_cert.crt)
+    assert kubeconfig_yaml['clusters'][0]['cluster']['certificate-authority-data'] == '<ca-cert-data>'
+
+
+@pytest.mark.parametrize("existing", [False, True])
+@mock.patch.object(ClusterConfigGen, 'host', new_callable=mock.PropertyMock)
+@mock.patch.object(ClusterConfigGen, 'cluster_ca_cert', new_callable=mock.PropertyMock)
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+def test_parallelusercsrworkflow(
+        mock_CertificatesV1beta1Api, mock_cluster_ca_cert, mock_host, existing, tmpdir):
+    mock_cluster_ca_cert.return_value = "<ca-cert-data>"
+    mock_host.return_value = "test-host"
+    mock_api = mock_CertificatesV1beta1Api.return_value
+    if existing:
+        mock_api.read_certificate_signing_request_status.return_value = mock.Mock()
+    else:
+        mock_api.read_certificate_signing_request_status.side_effect = ApiException(
+            status=404)
+    kubeconfig_path = os.path.join(str(tmpdir), 'kubeconfig.yaml')
+    fuser = FakeUser()
+
+    def mock_get_cert_func(self, *args, **kwargs):
+        cert = get_self_signed_cert_for_key(fuser.candk.key.key)
+        return base64.b64encode(cert.public_bytes(serialization.Encoding.PEM))
+
+    with mock.patch.object(CSRResource, 'approve') as mock_approve, \
+            mock.patch.object(CSRResource, 'get_cert', mock_get_cert_func):
+        ParallelUserCSRWorkflow(inputs={
+            "api_client": mock.MagicMock(),
+            "kubeconfig_klass": CSRKubeConfig,
+            "user": fuser,
+            "creds_dir": str(tmpdir),
+            "out_kubeconfig": kubeconfig_path,
+            "key_profile": "ec-p256",
+        }).start()
+
+    # the lookup made while the key was generated is reused for the create
+    mock_api.read_certificate_signing_request_status.assert_called_once_with("fakename")
+    assert mock_api.create_certificate_signing_request.called is not existing
+    mock_approve.assert_called_once()
+    for suffix in ["key.pem", "csr.pem", "crt.pem"]:
+        assert os.path.isfile(os.path.join(str(tmpdir), f"fakename.{suffix}"))
+    with open(kubeconfig_path) as c:
+        kubeconfig_yaml = (yaml.safe_load(c))
+    assert kubeconfig_yaml['users'][0]['name'] == 'fakename'
+    assert kubeconfig_yaml['users'][0]['user']['client-certificate-data']
+
+
+def _csr_object(request):
+    return kubernetes.client.V1beta1CertificateSigningRequest(
+        spec=kubernetes.client.V1beta1CertificateSigningRequestSpec(request=request))
+
+
+@pytest.mark.parametrize("workflow_klass", [UserCSRWorkflow, ParallelUserCSRWorkflow])
+@mock.patch.object(ClusterConfigGen, 'host', new_callable=mock.PropertyMock)
+@mock.patch.object(ClusterConfigGen, 'cluster_ca_cert', new_callable=mock.PropertyMock)
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+def test_usercsrworkflow__resume(
+        mock_CertificatesV1beta1Api, mock_cluster_ca_cert, mock_host, workflow_klass, tmpdir):
+    mock_cluster_ca_cert.return_value = "<ca-cert-data>"
+    mock_host.return_value = "test-host"
+    mock_api = mock_CertificatesV1beta1Api.return_value
+    mock_api.read_certificate_signing_request_status.side_effect = ApiException(status=404)
+    checkpoint_dir = os.path.join(str(tmpdir), "checkpoints")
+    os.mkdir(checkpoint_dir)
+    checkpoint_path = os.path.join(checkpoint_dir, "fakename.checkpoint.json")
+    fuser = FakeUser()
+    inputs = {
+        "api_client": mock.MagicMock(),
+        "kubeconfig_klass": CSRKubeConfig,
+        "user": fuser,
+        "creds_dir": str(tmpdir),
+        "out_kubeconfig": os.path.join(str(tmpdir), 'kubeconfig.yaml'),
+        "key_profile": "ec-p256",
+        "checkpoint_dir": checkpoint_dir,
+    }
+
+    # the first run times out waiting for the cert
+    with mock.patch.object(CSRResource, 'approve'), \
+            mock.patch.object(CSRResource, 'get_cert', side_effect=TimeoutError):
+        with pytest.raises(TimeoutError):
+            workflow_klass(inputs=inputs).start()
+    first_key_pem = fuser.candk.key.pem
+    mock_api.create_certificate_signing_request.assert_called_once()
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    assert checkpoint["key_pem"] == first_key_pem.decode("utf-8")
+    assert "get_cert" not in checkpoint["steps"] and "sign_cert" not in checkpoint["steps"]
+    assert oct(os.stat(checkpoint_path).st_mode & 0o777) == "0o600"
+
+    # the rerun reuses the key and the existing CSR resource
+    mock_api.reset_mock()
+    mock_api.read_certificate_signing_request_status.side_effect = None
+    mock_api.read_certificate_signing_request_status.return_value = _csr_object(
+        fuser.candk.csr.base64)
+
+    def mock_get_cert_func(self, *args, **kwargs):
+        cert = get_self_signed_cert_for_key(fuser.candk.key.key)
+        return base64.b64encode(cert.public_bytes(serialization.Encoding.PEM))
+
+    fuser = FakeUser()
+    with mock.patch.object(CSRResource, 'approve'), \
+            mock.patch.object(CSRResource, 'get_cert', mock_get_cert_func):
+        workflow_klass(inputs={**inputs, "user": fuser}).start()
+    assert not fuser.candk.key.created
+    assert fuser.candk.key.pem == first_key_pem
+    mock_api.create_certificate_signing_request.assert_not_called()
+    assert not os.path.exists(checkpoint_path)
+    assert os.path.isfile(inputs["out_kubeconfig"])
+
+
+@mock.patch.object(ClusterConfigGen, 'host', new_callable=mock.PropertyMock)
+@mock.patch.object(ClusterConfigGen, 'cluster_ca_cert', new_callable=mock.PropertyMock)
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+def test_usercsrworkflow__resume__encrypted_key(
+        mock_CertificatesV1beta1Api, mock_cluster_ca_cert, mock_host, tmpdir):
+    mock_cluster_ca_cert.return_value = "<ca-cert-data>"
+    mock_host.return_value = "test-host"
+    mock_api = mock_CertificatesV1beta1Api.return_value
+    mock_api.read_certificate_signing_request_status.side_effect = ApiException(status=404)
+    checkpoint_path = os.path.join(str(tmpdir), "fakename.checkpoint.json")
+    store_path = os.path.join(str(tmpdir), "creds.sqlite")
+    fuser = FakeUser()
+    inputs = {
+        "api_client": mock.MagicMock(),
+        "kubeconfig_klass": CSRKubeConfig,
+        "user": fuser,
+        "out_kubeconfig": os.path.join(str(tmpdir), 'kubeconfig.yaml'),
+        "key_profile": "ec-p256",
+        "checkpoint_dir": str(tmpdir),
+    }
+
+    with CredentialStore(store_path, key_password="secret") as store:
+        with mock.patch.object(CSRResource, 'approve'), \
+                mock.patch.object(CSRResource, 'get_cert', side_effect=TimeoutError):
+            with pytest.raises(TimeoutError):
+                UserCSRWorkflow(inputs={**inputs, "store": store}).start()
+    first_key_pem = fuser.candk.key.pem
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    # the checkpointed key is encrypted with the store's key password
+    assert checkpoint["key_encrypted"]
+    assert "ENCRYPTED PRIVATE KEY" in checkpoint["key_pem"]
+    assert first_key_pem.decode("utf-8") not in checkpoint["key_pem"]
+
+    # resuming needs the key password
+    with pytest.raises(ValueError, match="encrypted"):
+        UserCSRWorkflow(inputs={**inputs, "user": FakeUser()}).start()
+
+    def mock_get_cert_func(self, *args, **kwargs):
+        cert = get_self_signed_cert_for_key(fuser.candk.key.key)
+        return base64.b64encode(cert.public_bytes(serialization.Encoding.PEM))
+
+    mock_api.read_certificate_signing_request_status.side_effect = None
+    mock_api.read_certificate_signing_request_status.return_value = _csr_object(
+        fuser.candk.csr.base64)
+    fuser = FakeUser()
+    with CredentialStore(store_path, key_password="secret") as store:
+        with mock.patch.object(CSRResource, 'approve'), \
+                mock.patch.object(CSRResource, 'get_cert', mock_get_cert_func):
+            UserCSRWorkflow(inputs={**inputs, "user": fuser, "store": store}).start()
+    assert fuser.candk.key.pem == first_key_pem
+
+
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+def test_usercsrworkflow__resume__csr_mismatch(mock_CertificatesV1beta1Api, tmpdir):
+    mock_api = mock_CertificatesV1beta1Api.return_value
+    mock_api.read_certificate_signing_request_status.return_value = _csr_object(
+        base64.b64encode(b"another csr").decode("utf-8"))
+    fuser = FakeUser()
+    csr_wf = UserCSRWorkflow(inputs={
+        "api_client": mock.MagicMock(),
+        "kubeconfig_klass": CSRKubeConfig,
+        "user": fuser,
+        "key_profile": "ec-p256",
+        "checkpoint_dir": str(tmpdir),
+        "out_kubeconfig": os.path.join(str(tmpdir), 'kubeconfig.yaml'),
+    })
+    with mock.patch.object(CSRResource, 'approve') as mock_approve:
+        with pytest.raises(ValueError, match="does not match"):
+            csr_wf.start()
+    mock_approve.assert_not_called()
+    assert os.path.isfile(os.path.join(str(tmpdir), "fakename.checkpoint.json"))
+
+
+@mock.patch('k8s_user.k8s.csr_resource.kubernetes.client.CertificatesV1beta1Api')
+def test_parallelusercsrworkflow__save_key_fails(mock_CertificatesV1beta1Api, tmpdir):
+    mock_api = mock_CertificatesV1beta1Api.return_value
+    mock_api.read_certificate_signing_request_status.side_effect = ApiException(status=404)
+    with open(os.path.join(str(tmpdir), "fakename.key.pem"), "w") as f:
+        f.write("existing key")
+
+    with mock.patch.object(CSRResource, 'approve') as mock_approve:
+        with pytest.raises(Exception, match="Key already exists"):
+            ParallelUserCSRWorkflow(inputs={
+                "api_client": mock.MagicMock(),
+                "kubeconfig_klass": CSRKubeConfig,
+                "user": FakeUser(),
+                "creds_dir": str(tmpdir),
+                "out_kubeconfig": os.path.join(str(tmpdir), 'kubeconfig.yaml'),
+                "key_profile": "ec-p256",
+            }).start()
+
+    mock_api.create_certificate_signing_request.assert_not_called()
+    mock_approve.assert_not_called()
@@ -0,0 +1,96 @@
+import threading
+import time
+import pytest
+from k8s_user.workflows import BaseStep, GraphWorkflowBase, StepReturn
+
+
+def make_step(step_name, deps=(), action=None):
+    class Step(BaseStep):
+        name = step_name
+        depends_on = deps
+
+        def run(self):
+            if action:
+                action()
+            self.user.ran.append(step_name)
+            return StepReturn(next_step=None, message="")
+
+    return Step
+
+
+class FakeUser:
+    def __init__(self):
+        self.ran = []
+
+
+def test_graphworkflow__runs_independent_steps_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+
+    class Workflow(GraphWorkflowBase):
+        steps = [
+            make_step("last", ("first", "second")),
+            make_step("first", (), barrier.wait),
+            make_step("second", (), barrier.wait),
+        ]
+
+    user = FakeUser()
+    Workflow(inputs={"user": user}).start()
+
+    assert sorted(user.ran[:2]) == ["first", "second"]
+    assert user.ran[2] == "last"
+
+
+def test_graphworkflow__step_error_is_raised():
+    def fail():
+        raise RuntimeError("boom")
+
+    class Workflow(GraphWorkflowBase):
+        steps = [make_step("first", (), fail), make_step("second", ("first",))]
+
+    user = FakeUser()
+    with pytest.raises(RuntimeError):
+        Workflow(inputs={"user": user}).start()
+    assert user.ran == []
+
+
+def test_graphworkflow__unknown_dependency():
+    class Workflow(GraphWorkflowBase):
+        steps = [make_step("first", ("missing",))]
+
+    with pytest.raises(ValueError):
+        Workflow(inputs={"user": FakeUser()})
+
+
+def test_graphworkflow__circular_dependencies():
+    class Workflow(GraphWorkflowBase):
+        steps = [
+            make_step("first"),
+            make_step("second", ("third",)),
+            make_step("third", ("second",)),
+        ]
+
+    user = FakeUser()
+    with pytest.raises(ValueError):
+        Workflow(inputs={"user": user}).start()
+    assert user.ran == ["first"]
+
+
+def test_graphworkflow__waits_for_running_steps_on_error():
+    started = threading.Event()
+
+    def fail():
+        started.wait(5)
+        raise RuntimeError("boom")
+
+    def slow():
+        started.set()
+        time.sleep(0.2)
+
+    class Workflow(GraphWorkflowBase):
+        steps = [make_step("failing", (), fail), make_step("slow", (), slow)]
+
+    user = FakeUser()
+    with pytest.raises(RuntimeError):
+        Workflow(inputs={"user": user}).start()
+    # the step that was running when the other failed has finished
+    assert user.ran == ["slow"]
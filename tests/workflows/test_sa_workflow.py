@@ -49,3 +49,37 @@ def test_usersaworkflow(mock_cluster_ca_cert, mock_host, tmpdir):
 
         assert kubeconfig_yaml['clusters'][0]['cluster']['certificate-authority-data'] == '<ca-cert-data>'
         assert kubeconfig_yaml['clusters'][0]['cluster']['server'] == 'test-host'
+
+
+@mock.patch.object(ClusterConfigGen, 'host', new_callable=mock.PropertyMock)
+@mock.patch.object(ClusterConfigGen, 'cluster_ca_cert', new_callable=mock.PropertyMock)
+def test_usersaworkflow__token_request(mock_cluster_ca_cert, mock_host, tmpdir):
+
+    mock_cluster_ca_cert.return_value = "<ca-cert-data>"
+    mock_host.return_value = "test-host"
+    kubeconfig_path = os.path.join(str(tmpdir), 'kubeconfig.yaml')
+
+    with mock.patch.object(SAResource, 'request_token') as mock_request_token, \
+            mock.patch.object(SAResource, 'get_secret_token') as mock_get_secret_token:
+        mock_request_token.return_value = "requested-token"
+        fuser = FakeUser()
+        UserTokenWorkflow(inputs={
+            "api_client": mock.MagicMock(),
+            "kubeconfig_klass": TokenKubeConfig,
+            "user": fuser,
+            "out_kubeconfig": kubeconfig_path,
+            "namespace": "default",
+            "token_audiences": ["vault"],
+            "token_expiration_seconds": 600,
+        }).start()
+        mock_request_token.assert_called_once_with(
+            mock.ANY, audiences=["vault"], expiration_seconds=600)
+        mock_get_secret_token.assert_not_called()
+
+    # Service Accounts carry the managed-by label the inventory selects on
+    assert fuser.sa_resource.get_text().metadata.labels == {
+        "app.kubernetes.io/managed-by": "k8s_user"}
+
+    with open(kubeconfig_path) as c:
+        kubeconfig_yaml = (yaml.safe_load(c))
+    assert kubeconfig_yaml['users'][0]['user']['token'] == 'requested-token'